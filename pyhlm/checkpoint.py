@@ -0,0 +1,136 @@
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+# Checkpoint of a Gibbs chain: a directory holding
+#   model.pkl         the model without its utterances (parameters, word_list, sweep
+#                     policy, params_version), the per-utterance settings and the
+#                     state of np.random
+#   data.npy          the frames of all utterances, concatenated (memory-mappable)
+#   lengths.npy       the number of frames per utterance
+#   segmentations.npy int32 run-length segmentations of all utterances, per utterance
+#                     words, durations, letters, letter_durations
+#   segmentation_index.npy  number of words and of letter segments per utterance
+#   info.json         free-form information of the caller, e.g. the iteration
+# A checkpoint is written into <path>.tmp and then renamed over <path>. When the
+# utterance lengths did not change, data.npy and lengths.npy are hard-linked from the
+# previous checkpoint in <path>, since the frames do not change while training; fresh
+# data is always written to a new file, never through a link. Loading restores the
+# chain such that the following iterations are identical to those of the uninterrupted chain.
+
+_FORMAT_VERSION = 1
+
+def _save_npy(path, array):
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+def _write_data(path, previous, states_list):
+    lengths = np.array([state.T for state in states_list], dtype=np.int64)
+    lengths_path = os.path.join(previous, "lengths.npy")
+    if os.path.exists(lengths_path) and np.array_equal(np.load(lengths_path), lengths):
+        try:
+            os.link(os.path.join(previous, "data.npy"), os.path.join(path, "data.npy"))
+            os.link(lengths_path, os.path.join(path, "lengths.npy"))
+            return
+        except OSError:
+            pass
+    # A link made before the failure shares the file of the previous checkpoint.
+    for name in ("data.npy", "lengths.npy"):
+        if os.path.exists(os.path.join(path, name)):
+            os.unlink(os.path.join(path, name))
+    _save_npy(os.path.join(path, "lengths.npy"), lengths)
+    D = states_list[0].data.shape[1] if states_list else 0
+    data = np.lib.format.open_memmap(
+        os.path.join(path, "data.npy"), mode="w+", dtype=np.float64, shape=(int(lengths.sum()), D))
+    offset = 0
+    for state in states_list:
+        data[offset:offset + state.T] = state.data
+        offset += state.T
+    data.flush()
+    del data
+
+def save_checkpoint(model, path, info=None):
+    path = os.path.abspath(path)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    states_list = model.states_list
+
+    _write_data(tmp, path, states_list)
+
+    records = []
+    index = np.empty((len(states_list), 2), dtype=np.int64)
+    for idx, state in enumerate(states_list):
+        words, durations = state.stateseq_norep, state.durations_censored
+        letters, letter_durations = state.letter_stateseq_norep, state.letter_durations
+        records.extend((words, durations, letters, letter_durations))
+        index[idx] = (len(words), len(letters))
+    _save_npy(os.path.join(tmp, "segmentations.npy"),
+              np.concatenate(records).astype(np.int32) if records else np.empty(0, dtype=np.int32))
+    _save_npy(os.path.join(tmp, "segmentation_index.npy"), index)
+
+    meta = {
+        "format_version": _FORMAT_VERSION,
+        "states": [dict(kwargs=state._kwargs, normalizer=state._normalizer,
+                        normalizer_version=state._normalizer_version, pi_0=state._pi_0)
+                   for state in states_list],
+        "random_state": np.random.get_state(),
+    }
+    letter_states_list = model.letter_hsmm.states_list
+    model.states_list, model.letter_hsmm.states_list = [], []
+    try:
+        with open(os.path.join(tmp, "model.pkl"), "wb") as f:
+            pickle.dump((model, meta), f, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        model.states_list, model.letter_hsmm.states_list = states_list, letter_states_list
+
+    with open(os.path.join(tmp, "info.json"), "w") as f:
+        json.dump(info if info is not None else {}, f)
+
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+def load_checkpoint_info(path):
+    with open(os.path.join(path, "info.json")) as f:
+        return json.load(f)
+
+def load_checkpoint(path, mmap_data=False):
+    # mmap_data: the utterances read their frames from data.npy instead of memory.
+    with open(os.path.join(path, "model.pkl"), "rb") as f:
+        model, meta = pickle.load(f)
+    if meta["format_version"] != _FORMAT_VERSION:
+        raise ValueError("unsupported checkpoint format {}".format(meta["format_version"]))
+
+    data = np.load(os.path.join(path, "data.npy"), mmap_mode="r" if mmap_data else None)
+    lengths = np.load(os.path.join(path, "lengths.npy"))
+    segmentations = np.load(os.path.join(path, "segmentations.npy"))
+    index = np.load(os.path.join(path, "segmentation_index.npy"))
+
+    offset = 0
+    seg_offset = 0
+    for T, (num_words, num_letters), state_meta in zip(lengths, index, meta["states"]):
+        words, durations, letters, letter_durations = np.split(
+            segmentations[seg_offset:seg_offset + 2 * (num_words + num_letters)],
+            np.cumsum((num_words, num_words, num_letters)))
+        seg_offset += 2 * (num_words + num_letters)
+
+        state = model._states_class(model, data[offset:offset + T], generate=False, **state_meta["kwargs"])
+        offset += T
+        state.stateseq = np.repeat(words, durations)
+        state._stateseq_norep = words.copy()
+        state._durations_censored = durations.copy()
+        state.letter_stateseq = np.repeat(letters, letter_durations)
+        state._normalizer = state_meta["normalizer"]
+        state._normalizer_version = state_meta["normalizer_version"]
+        state._pi_0 = state_meta["pi_0"]
+        model.states_list.append(state)
+
+    np.random.set_state(meta["random_state"])
+    return model
@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+
+# Binary cache of a corpus of text feature files (one frame per line, as np.loadtxt reads
+# them). All utterances are stored back to back in <prefix>.bin, with <prefix>.json
+# holding the names, offsets and lengths of the utterances, the frame dimension, the
+# dtype and the size and mtime of every source file. The cache is rebuilt when the list
+# of names or any source file changes. Corpus memory-maps <prefix>.bin read-only, so
+# the utterances are views which processes forked from the loader share.
+
+_CACHE_VERSION = 1
+
+def _load_text(path):
+    return np.loadtxt(path, ndmin=2)
+
+def _load_chunk(paths):
+    return [_load_text(path) for path in paths]
+
+def _source_stats(paths):
+    stats = [os.stat(path) for path in paths]
+    return [[stat.st_size, stat.st_mtime_ns] for stat in stats]
+
+class Corpus(object):
+
+    def __init__(self, prefix):
+        with open(prefix + ".json") as f:
+            self.index = json.load(f)
+        self.names = self.index["names"]
+        self.offsets = np.array(self.index["offsets"], dtype=np.int64)
+        self.lengths = np.array(self.index["lengths"], dtype=np.int64)
+        self.dim = self.index["dim"]
+        total = int(self.lengths.sum())
+        if total == 0:
+            self.data = np.empty((0, self.dim), dtype=self.index["dtype"])
+        else:
+            self.data = np.memmap(prefix + ".bin", dtype=self.index["dtype"], mode="r", shape=(total, self.dim))
+        self._name_to_idx = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, key):
+        # key: index or name of an utterance.
+        idx = self._name_to_idx[key] if isinstance(key, str) else int(key)
+        return self.data[self.offsets[idx]:self.offsets[idx] + self.lengths[idx]]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def datas(self):
+        return list(self)
+
+def _is_valid(prefix, names, paths, dtype):
+    if not (os.path.exists(prefix + ".json") and os.path.exists(prefix + ".bin")):
+        return False
+    try:
+        with open(prefix + ".json") as f:
+            index = json.load(f)
+        return (index.get("version") == _CACHE_VERSION and index["names"] == names
+                and index["dtype"] == np.dtype(dtype).name and index["sources"] == _source_stats(paths))
+    except (OSError, ValueError, KeyError):
+        return False
+
+def build_corpus(names, prefix, data_dir="DATA", suffix=".txt", dtype=np.float64, num_procs=0, chunksize=64):
+    # Writes the cache of data_dir/<name><suffix> for all names, loading the files with
+    # num_procs worker processes in chunks of chunksize files.
+    names = [str(name) for name in names]
+    paths = [os.path.join(data_dir, name + suffix) for name in names]
+    sources = _source_stats(paths)
+    chunks = [paths[i:i+chunksize] for i in range(0, len(paths), chunksize)]
+    if num_procs == 0:
+        loaded = map(_load_chunk, chunks)
+    else:
+        from joblib import Parallel, delayed
+        loaded = Parallel(n_jobs=num_procs, return_as="generator")(delayed(_load_chunk)(chunk) for chunk in chunks)
+
+    dirname = os.path.dirname(prefix)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    lengths = []
+    dim = None
+    with open(prefix + ".bin.tmp", "wb") as f:
+        for datas in loaded:
+            for data in datas:
+                if dim is None:
+                    dim = data.shape[1]
+                elif data.shape[1] != dim:
+                    raise ValueError("{} has {} dimensions, expected {}".format(paths[len(lengths)], data.shape[1], dim))
+                f.write(np.ascontiguousarray(data, dtype=dtype).tobytes())
+                lengths.append(len(data))
+
+    index = {
+        "version": _CACHE_VERSION,
+        "names": names,
+        "offsets": np.concatenate(([0], np.cumsum(lengths)[:-1])).astype(int).tolist() if lengths else [],
+        "lengths": lengths,
+        "dim": dim if dim is not None else 0,
+        "dtype": np.dtype(dtype).name,
+        "sources": sources,
+    }
+    with open(prefix + ".json.tmp", "w") as f:
+        json.dump(index, f)
+    if os.path.exists(prefix + ".json"):
+        os.remove(prefix + ".json")
+    os.replace(prefix + ".bin.tmp", prefix + ".bin")
+    os.replace(prefix + ".json.tmp", prefix + ".json")
+    return Corpus(prefix)
+
+def load_corpus(names, prefix=None, data_dir="DATA", suffix=".txt", dtype=np.float64, num_procs=0):
+    # Opens the cache of the corpus, building it first if it is missing or outdated.
+    # prefix defaults to data_dir/.corpus
+    prefix = os.path.join(data_dir, ".corpus") if prefix is None else prefix
+    names = [str(name) for name in names]
+    paths = [os.path.join(data_dir, name + suffix) for name in names]
+    if _is_valid(prefix, names, paths, dtype):
+        return Corpus(prefix)
+    return build_corpus(names, prefix, data_dir=data_dir, suffix=suffix, dtype=dtype, num_procs=num_procs)
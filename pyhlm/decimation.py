@@ -0,0 +1,110 @@
+import numpy as np
+
+# Coarse-to-fine schedule: the first iterations of resample_model run on copies of the
+# utterances whose frames are mean-pooled by a factor, so the O(T^2) lattice work shrinks
+# by factor^2 while the segmentation is still far from converged. Durations are measured
+# in pooled frames during those iterations, the word and letter segmentations of the last
+# coarse iteration are projected back to the full resolution to warm-start the rest.
+# Mean pooling also shrinks the covariance of the frames of a letter by about 1/factor, so
+# the letter Gaussians (and durations) are drawn once more from the projected segmentations
+# on the full-resolution frames before the fine iterations start.
+
+def block_sizes(T, factor):
+    sizes = np.full(-(-T // factor), factor, dtype=np.int64)
+    sizes[-1] = T - factor * (len(sizes) - 1)
+    return sizes
+
+def pool_frames(data, factor):
+    starts = np.arange(0, len(data), factor)
+    return np.add.reduceat(data, starts, axis=0) / block_sizes(len(data), factor)[:, None]
+
+def pool_boundaries(boundaries, factor):
+    # A pooled frame may end a segment if any of its frames may.
+    boundaries = np.asarray(boundaries, dtype=bool)
+    return np.maximum.reduceat(boundaries, np.arange(0, len(boundaries), factor))
+
+def rescale_durations(dur_distns, scale, min_lmbda=1e-3):
+    # Changes the time unit of Poisson durations, scale = new frames per old frame.
+    # PoissonDuration is 1 + Poisson(lmbda), the mean duration 1 + lmbda is what scales.
+    for dur_distn in dur_distns:
+        dur_distn.lmbda = max((1.0 + dur_distn.lmbda) * scale - 1.0, min_lmbda)
+        alpha_0 = getattr(dur_distn, "alpha_0", None)
+        beta_0 = getattr(dur_distn, "beta_0", None)
+        if alpha_0 is not None and beta_0 is not None:
+            # Keeps the shape and moves the prior mean alpha_0 / beta_0 the same way.
+            dur_distn.beta_0 = alpha_0 / max((1.0 + alpha_0 / beta_0) * scale - 1.0, min_lmbda)
+
+def project_segmentation(coarse_state, fine_state, factor):
+    sizes = block_sizes(fine_state.T, factor)
+    fine_state.stateseq = np.repeat(coarse_state.stateseq, sizes).astype(np.int32)
+    fine_state.letter_stateseq = np.repeat(coarse_state.letter_stateseq, sizes).astype(np.int32)
+    fine_state._stateseq_norep = None
+    fine_state._durations_censored = None
+    fine_state._normalizer = None
+    fine_state.clear_caches()
+
+class CoarseToFine(object):
+
+    def __init__(self, model, schedule):
+        # schedule: list of (factor, iterations), coarsest first, e.g. [(4, 10), (2, 10)].
+        self.model = model
+        self.schedule = [(int(factor), int(iterations)) for factor, iterations in schedule]
+        if any(factor < 1 for factor, _ in self.schedule):
+            raise ValueError("decimation factors must be >= 1")
+
+    def run(self, num_procs=0, callback=None):
+        # callback(model, factor, iteration) is called after every coarse iteration.
+        for factor, iterations in self.schedule:
+            self._run_stage(factor, iterations, num_procs, callback)
+
+    def _run_stage(self, factor, iterations, num_procs, callback):
+        model = self.model
+        fine_states = model.states_list
+        coarse_states = [self._coarse_state(state, factor) for state in fine_states]
+
+        self._rescale(1.0 / factor)
+        model.states_list = coarse_states
+        # Coarse iterations are cheap, they sweep over every utterance.
+        sweep, model.sweep = model.sweep, None
+        try:
+            model.resample_states(num_procs=num_procs)
+            for itr in range(iterations):
+                model.resample_model(num_procs=num_procs)
+                if callback is not None:
+                    callback(model, factor, itr)
+            for state in coarse_states:
+                state.sample_letter_stateseq()
+        finally:
+            model.sweep = sweep
+            model.states_list = fine_states
+            model.letter_hsmm.states_list = []
+            for coarse_state in coarse_states:
+                coarse_state.clear_caches()
+            self._rescale(factor)
+
+        for coarse_state, fine_state in zip(coarse_states, fine_states):
+            project_segmentation(coarse_state, fine_state, factor)
+        self._refit_letters(num_procs)
+
+    def _refit_letters(self, num_procs):
+        model = self.model
+        model.letter_hsmm.states_list = []
+        for state in model.states_list:
+            state.add_word_datas(generate=False)
+        model.letter_hsmm.resample_obs_and_dur_distns_by_statistics(num_procs=num_procs)
+        model.letter_hsmm.states_list = []
+        model.params_version += 1
+
+    def _coarse_state(self, state, factor):
+        kwargs = dict(state._kwargs)
+        if kwargs.get("trunc") is not None:
+            kwargs["trunc"] = -(-kwargs["trunc"] // factor)
+        for key in ("word_boundaries", "letter_boundaries"):
+            if kwargs.get(key) is not None:
+                kwargs[key] = pool_boundaries(kwargs[key], factor)
+        return self.model._states_class(self.model, pool_frames(state.data, factor), generate=False, **kwargs)
+
+    def _rescale(self, scale):
+        rescale_durations(self.model.letter_dur_distns, scale)
+        rescale_durations(self.model.dur_distns, scale)
+        self.model.params_version += 1
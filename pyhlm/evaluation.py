@@ -0,0 +1,151 @@
+import numpy as np
+
+# Clustering scores of segmentations against frame labels, computed from contingency
+# tables (counts of frames per pair of true and predicted label) instead of per-label
+# masks over the frames. A table of a corpus is the sum of the tables of its
+# utterances, and the table of an utterance is built from the run-length encodings of
+# both labelings in time linear in the number of runs, so the scores are cheap enough
+# to compute in the training loop.
+# adjusted_rand_index equals sklearn's adjusted_rand_score, and f1_scores equals
+# sklearn's f1_score after every predicted label is mapped onto the true label it
+# overlaps most (label_mapping), as the summary scripts have always scored.
+
+class ContingencyTable(object):
+
+    def __init__(self):
+        self._true = []
+        self._pred = []
+        self._counts = []
+
+    def add(self, truth, predict):
+        # Frame-level labels of one utterance (or of a concatenated corpus).
+        truth, predict = np.asarray(truth), np.asarray(predict)
+        if truth.shape != predict.shape:
+            raise ValueError("truth and predict differ in shape: {} and {}".format(truth.shape, predict.shape))
+        self._true.append(truth.ravel())
+        self._pred.append(predict.ravel())
+        self._counts.append(np.ones(truth.size, dtype=np.int64))
+
+    def add_rle(self, true_labels, true_durations, pred_labels, pred_durations):
+        # Run-length encoded labels of one utterance, e.g. (words, durations) of a segmentation.
+        true_ends = np.cumsum(true_durations)
+        pred_ends = np.cumsum(pred_durations)
+        T = true_ends[-1] if len(true_ends) else 0
+        if T != (pred_ends[-1] if len(pred_ends) else 0):
+            raise ValueError("truth and predict cover {} and {} frames".format(T, pred_ends[-1] if len(pred_ends) else 0))
+        ends = np.union1d(true_ends, pred_ends)
+        starts = np.concatenate(([0], ends[:-1]))
+        self._true.append(np.asarray(true_labels)[np.searchsorted(true_ends, starts, side="right")])
+        self._pred.append(np.asarray(pred_labels)[np.searchsorted(pred_ends, starts, side="right")])
+        self._counts.append((ends - starts).astype(np.int64))
+
+    def table(self):
+        # (true_labels, pred_labels, counts) with counts[i, j] the frames labelled
+        # true_labels[i] and pred_labels[j], the labels sorted.
+        if not self._true:
+            return np.empty(0), np.empty(0), np.zeros((0, 0), dtype=np.int64)
+        true_labels, true_idx = np.unique(np.concatenate(self._true), return_inverse=True)
+        pred_labels, pred_idx = np.unique(np.concatenate(self._pred), return_inverse=True)
+        counts = np.bincount(true_idx.ravel() * len(pred_labels) + pred_idx.ravel(),
+                             weights=np.concatenate(self._counts), minlength=len(true_labels) * len(pred_labels))
+        return true_labels, pred_labels, counts.astype(np.int64).reshape(len(true_labels), len(pred_labels))
+
+def contingency_table(truth, predict):
+    table = ContingencyTable()
+    table.add(truth, predict)
+    return table.table()
+
+def adjusted_rand_index(counts):
+    # Same as sklearn.metrics.adjusted_rand_score, from the pair confusion matrix.
+    counts = np.asarray(counts, dtype=np.int64)
+    n = int(counts.sum())
+    sum_squares = int((counts ** 2).sum())
+    true_sizes = counts.sum(axis=1)
+    pred_sizes = counts.sum(axis=0)
+    tp = sum_squares - n
+    fp = int(counts.dot(pred_sizes).sum()) - sum_squares
+    fn = int(counts.T.dot(true_sizes).sum()) - sum_squares
+    tn = n * n - fp - fn - sum_squares
+    if fn == 0 and fp == 0:
+        return 1.0
+    return 2.0 * (tp * tn - fn * fp) / ((tp + fn) * (fn + tn) + (tp + fp) * (fp + tn))
+
+def label_mapping(true_labels, pred_labels, counts, N):
+    # The true label _convert_label assigns to every predicted label, N for none: for
+    # true labels 0..N-1 in order, the predicted label (of 0..N-1) sharing most frames
+    # with it is mapped onto it, later true labels overriding earlier ones.
+    true_labels, pred_labels = np.asarray(true_labels), np.asarray(pred_labels)
+    square = np.zeros((N, N), dtype=np.int64)
+    true_in = np.isin(true_labels, np.arange(N))
+    pred_in = np.isin(pred_labels, np.arange(N))
+    square[np.ix_(true_labels[true_in].astype(np.int64), pred_labels[pred_in].astype(np.int64))] = counts[np.ix_(true_in, pred_in)]
+    mapping = np.full(N, N, dtype=np.int64)
+    for true_lab, pred_lab in enumerate(np.argmax(square, axis=1)):
+        mapping[pred_lab] = true_lab
+    return np.array([mapping[int(label)] if pred_in[j] else N for j, label in enumerate(pred_labels)], dtype=np.int64)
+
+def f1_scores(true_labels, pred_labels, counts, N):
+    # (macro F1, micro F1) over the labels the mapped prediction uses.
+    mapped = label_mapping(true_labels, pred_labels, counts, N)
+    labels = np.unique(mapped)
+    merged = np.zeros((len(true_labels), len(labels)), dtype=np.int64)
+    np.add.at(merged.T, np.searchsorted(labels, mapped), counts.T)
+    true_sizes = counts.sum(axis=1)
+    tp = np.zeros(len(labels), dtype=np.int64)
+    support = np.zeros(len(labels), dtype=np.int64)
+    for j, label in enumerate(labels):
+        rows = np.flatnonzero(np.asarray(true_labels) == label)
+        if len(rows):
+            tp[j] = merged[rows[0], j]
+            support[j] = true_sizes[rows[0]]
+    predicted = merged.sum(axis=0)
+    macro = np.mean(2.0 * tp / (predicted + support))
+    micro = 2.0 * tp.sum() / (predicted.sum() + support.sum())
+    return macro, micro
+
+def scores(true_labels, pred_labels, counts, N):
+    macro, micro = f1_scores(true_labels, pred_labels, counts, N)
+    return {"ARI": adjusted_rand_index(counts), "macro_F1": macro, "micro_F1": micro}
+
+def evaluate(truth, predict, N):
+    # Scores of frame-level labels.
+    return scores(*contingency_table(truth, predict), N)
+
+class SegmentationEvaluator(object):
+    # Letter and word scores of the segmentations of a corpus with frame labels, e.g.
+    #   evaluator = SegmentationEvaluator(letter_labels, word_labels, letter_num, word_num)
+    #   evaluator.evaluate(snapshot_segmentations(model))
+    # The labels are run-length encoded once, every evaluation only touches runs.
+
+    def __init__(self, letter_labels, word_labels, letter_num, word_num):
+        self.letter_num = letter_num
+        self.word_num = word_num
+        self.letter_rles = [_rle(labels) for labels in letter_labels]
+        self.word_rles = [_rle(labels) for labels in word_labels]
+
+    def evaluate(self, segmentations):
+        # segmentations: (words, durations, letters, letter_durations) per utterance, in
+        # the order of the labels. Returns {"letter_ARI": ..., "word_macro_F1": ..., ...}.
+        letter_table = ContingencyTable()
+        word_table = ContingencyTable()
+        for (words, durations, letters, letter_durations), letter_rle, word_rle in zip(
+                segmentations, self.letter_rles, self.word_rles):
+            letter_table.add_rle(letter_rle[0], letter_rle[1], letters, letter_durations)
+            word_table.add_rle(word_rle[0], word_rle[1], words, durations)
+        out = {}
+        for prefix, table, N in (("letter", letter_table, self.letter_num), ("word", word_table, self.word_num)):
+            for key, value in scores(*table.table(), N).items():
+                out[prefix + "_" + key] = value
+        return out
+
+    def evaluate_model(self, model):
+        return self.evaluate([(state.stateseq_norep, state.durations_censored,
+                               state.letter_stateseq_norep, state.letter_durations)
+                              for state in model.states_list])
+
+def _rle(labels):
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        return labels, np.empty(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+    return labels[starts], np.diff(np.append(starts, len(labels)))
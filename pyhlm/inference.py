@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+from scipy.special import gammaln
+
+from pyhlm.internals import hlm_states
+from pyhlm.model import SegmentationMixin
+
+# Exported model: a directory of .npy files holding what segmentation needs,
+#   word_letters, word_offsets   letters of word i are word_letters[word_offsets[i]:word_offsets[i+1]]
+#   word_ids, letter_ids         ids of the kept words and letters in the trained model
+#   letter_mus, letter_sigmas, letter_sigma_chols   letter Gaussians
+#   letter_dur_lmbdas, word_dur_lmbdas              Poisson durations
+#   trans_matrix, pi_0           word bigram, renormalized over the kept words
+# Words which no utterance uses (unless keep_unused) and letters which no kept word
+# uses are dropped. The files are memory-mapped by InferenceModel, so worker processes
+# share one copy.
+
+_ARRAYS = ("word_letters", "word_offsets", "word_ids", "letter_ids",
+           "letter_mus", "letter_sigmas", "letter_sigma_chols",
+           "letter_dur_lmbdas", "word_dur_lmbdas", "trans_matrix", "pi_0")
+
+def export_model(model, path, keep_unused=False):
+    if model.states_list and not keep_unused:
+        word_ids = np.flatnonzero(model.word_counts())
+    else:
+        word_ids = np.arange(model.num_states)
+    if len(word_ids) == 0:
+        raise ValueError("no word of the model is used by its utterances, nothing to export (see keep_unused)")
+    letter_ids = np.unique(np.concatenate([model.word_list[i] for i in word_ids])).astype(np.int64)
+    letter_map = np.full(model.letter_num_states, -1, dtype=np.int32)
+    letter_map[letter_ids] = np.arange(len(letter_ids))
+
+    words = [letter_map[list(model.word_list[i])] for i in word_ids]
+    trans_matrix = model.trans_distn.trans_matrix[np.ix_(word_ids, word_ids)]
+    pi_0 = model.init_state_distn.pi_0[word_ids]
+    obs_distns = [model.letter_obs_distns[i] for i in letter_ids]
+    sigmas = np.array([obs_distn.sigma for obs_distn in obs_distns], dtype=np.float64)
+
+    arrays = dict(
+        word_letters=np.concatenate(words).astype(np.int32),
+        word_offsets=np.concatenate(([0], np.cumsum([len(word) for word in words]))).astype(np.int64),
+        word_ids=word_ids.astype(np.int64),
+        letter_ids=letter_ids,
+        letter_mus=np.array([obs_distn.mu for obs_distn in obs_distns], dtype=np.float64),
+        letter_sigmas=sigmas,
+        letter_sigma_chols=np.linalg.cholesky(sigmas),
+        letter_dur_lmbdas=np.array([model.letter_dur_distns[i].lmbda for i in letter_ids], dtype=np.float64),
+        word_dur_lmbdas=np.array([model.dur_distns[i].lmbda for i in word_ids], dtype=np.float64),
+        trans_matrix=trans_matrix / trans_matrix.sum(1)[:, None],
+        pi_0=pi_0 / pi_0.sum(),
+    )
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(array))
+
+class _Gaussian(object):
+
+    def __init__(self, mu, sigma, sigma_chol):
+        self.mu = mu
+        self.sigma = sigma
+        self.sigma_chol = sigma_chol
+
+class _PoissonDuration(object):
+    # Same log_pmf as pyhsmm.basic.distributions.PoissonDuration (durations start at 1).
+
+    def __init__(self, lmbda):
+        self.lmbda = lmbda
+
+    def log_pmf(self, x):
+        x = np.asarray(x) - 1
+        out = np.full(x.shape, -np.inf)
+        valid = x >= 0
+        out[valid] = -self.lmbda + x[valid] * np.log(self.lmbda) - gammaln(x[valid] + 1)
+        return out
+
+class _Distribution(object):
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class InferenceModelPython(SegmentationMixin):
+    # Segmentation-only model built from an exported directory. It has the interface the
+    # states classes need, but no priors and no resampling of the parameters.
+    _states_class = hlm_states.WeakLimitHDPHLMStatesPython
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+        offsets = arrays["word_offsets"]
+        self.word_list = [tuple(int(l) for l in arrays["word_letters"][offsets[i]:offsets[i+1]])
+                          for i in range(len(offsets) - 1)]
+        self.letter_obs_distns = [_Gaussian(mu, sigma, sigma_chol) for mu, sigma, sigma_chol in zip(
+            arrays["letter_mus"], arrays["letter_sigmas"], arrays["letter_sigma_chols"])]
+        self.letter_dur_distns = [_PoissonDuration(lmbda) for lmbda in arrays["letter_dur_lmbdas"]]
+        self.dur_distns = [_PoissonDuration(lmbda) for lmbda in arrays["word_dur_lmbdas"]]
+        self.trans_distn = _Distribution(trans_matrix=arrays["trans_matrix"])
+        self.init_state_distn = _Distribution(pi_0=arrays["pi_0"])
+        self.num_states = len(self.word_list)
+        self.letter_num_states = len(self.letter_obs_distns)
+        self.params_version = 0
+        self.sweep = None
+        self.table_cache = None
+        self.states_list = []
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return cls({name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r" if mmap else None)
+                    for name in _ARRAYS})
+
+    def original_words(self, words):
+        # Maps word ids of segmentations back to the ids of the trained model.
+        return self.arrays["word_ids"][words]
+
+    def original_letters(self, letters):
+        return self.arrays["letter_ids"][letters]
+
+class InferenceModel(InferenceModelPython):
+    _states_class = hlm_states.WeakLimitHDPHLMStates
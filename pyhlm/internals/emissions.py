@@ -0,0 +1,56 @@
+import numpy as np
+
+def stack_gaussian_params(obs_distns):
+    mus = np.array([obs_distn.mu for obs_distn in obs_distns], dtype=np.float64)
+    sigma_chols = np.array([_sigma_chol(obs_distn) for obs_distn in obs_distns], dtype=np.float64)
+    return mus, sigma_chols
+
+def _sigma_chol(obs_distn):
+    # pybasicbayes.Gaussian caches its Cholesky factor, reuse it if it is there.
+    sigma_chol = getattr(obs_distn, "sigma_chol", None)
+    if sigma_chol is None:
+        sigma_chol = np.linalg.cholesky(obs_distn.sigma)
+    return sigma_chol
+
+def is_gaussian(obs_distn):
+    return getattr(obs_distn, "mu", None) is not None and getattr(obs_distn, "sigma", None) is not None
+
+def gaussian_log_likelihoods(data, mus, sigma_chols, chunksize=None, out=None):
+    # Computes the T x P table of log N(x_t | mu_p, sigma_p) for all letters at once.
+    # x_t - mu_p is whitened with the inverse Cholesky factors of all letters
+    # stacked into one (P*D) x D matrix, so that each time chunk is a single GEMM.
+    T, D = data.shape
+    P = mus.shape[0]
+    if out is None:
+        out = np.empty((T, P), dtype=np.float64)
+    if T == 0:
+        return out
+    chunksize = T if chunksize is None else max(int(chunksize), 1)
+
+    eye = np.broadcast_to(np.eye(D), sigma_chols.shape)
+    inv_chols = np.linalg.solve(sigma_chols, eye)
+    stacked_inv_chols = inv_chols.reshape((P * D, D)).T
+    whitened_mus = np.einsum("pij,pj->pi", inv_chols, mus).ravel()
+    consts = -D / 2 * np.log(2 * np.pi) - np.log(np.diagonal(sigma_chols, axis1=1, axis2=2)).sum(axis=1)
+
+    for start in range(0, T, chunksize):
+        stop = min(start + chunksize, T)
+        x = data[start:stop]
+        bads = np.isnan(x).any(axis=1)
+        xs = np.nan_to_num(x).dot(stacked_inv_chols)
+        xs -= whitened_mus
+        xs = xs.reshape((stop - start, P, D))
+        out[start:stop] = -1./2. * np.einsum("tpi,tpi->tp", xs, xs) + consts
+        out[start:stop][bads] = 0.0
+    return out
+
+def letter_log_likelihoods(data, obs_distns, chunksize=None, out=None):
+    if all(is_gaussian(obs_distn) for obs_distn in obs_distns):
+        mus, sigma_chols = stack_gaussian_params(obs_distns)
+        aBl = gaussian_log_likelihoods(data, mus, sigma_chols, chunksize=chunksize, out=out)
+    else:
+        aBl = np.empty((data.shape[0], len(obs_distns))) if out is None else out
+        for idx, obs_distn in enumerate(obs_distns):
+            aBl[:,idx] = obs_distn.log_likelihood(data).ravel()
+    aBl[np.isnan(aBl).any(1)] = 0.0
+    return aBl
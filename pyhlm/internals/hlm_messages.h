@@ -3,11 +3,12 @@
 
 #include <Eigen/Core>
 #include <iostream> // cout, endl
-#include <algorithm> // min
+#include <algorithm> // min, sort
 #include <math.h>
 
 #include "util.h"
 #include "nptypes.h"
+#include "word_lattice.h"
 
 namespace hlm
 {
@@ -21,12 +22,11 @@ namespace hlm
       int T, int N, int P, int Lmax, int Ls[], int cLs[],
       Type *Al, Type *aDl,
       Type *aBl, Type *alDl,
-      int words[], int itrunc,
+      int words[], int itrunc, int word_ends[], int letter_ends[],
       Type *betal, Type *betastarl)
     {
       int tsize;
       Type cmax;
-      Type ctmp;
       NPArray<Type> eAl(Al, N, N);
       NPArray<Type> eaDl(aDl, T, N);
       NPArray<Type> eaBl(aBl, T, P);
@@ -57,6 +57,7 @@ namespace hlm
       Type maxes_buf[N] __attribute__((aligned(16)));
       NPRowVectorArray<Type> maxes(maxes_buf, N);
 #endif
+      Array<int, 1, Dynamic> cand(itrunc);
 
       //initialize.
       Type neg_inf = -1.0*numeric_limits<Type>::infinity();
@@ -65,29 +66,17 @@ namespace hlm
       ebetal.row(T-1).setZero();
 
       for(int t=T-1; t>=0; t--){
+        if(t > 0 && !word_ends[t-1]){
+          // no word ends at t-1, so none starts at t and betal(t-1, :) stays -inf.
+          continue;
+        }
         tsize = min(itrunc, T-t);
         // calculate internal forward message
         for(int i=0; i<N; i++){
           ealphal.setConstant(neg_inf);
-          ctmp = 0.0;
-          for(int tt=0; tt<tsize-Ls[i]+1; tt++){
-            ctmp += eaBl(t+tt, words[cLs[i]]);
-            ealphal(tt, 0) = ctmp + ealDl(tt, words[cLs[i]]);
-          }
-          for(int j=0; j<Ls[i]-1; j++){
-            sumsofar_alpha.setZero();
-            for(int tt=0; tt<tsize-Ls[i]+1; tt++){
-              for(int tau=0; tau<=tt; tau++){
-                sumsofar_alpha(tau) += eaBl(t+tt+j+1, words[cLs[i]+j+1]);
-                result_alpha(tau) = sumsofar_alpha(tau) + ealDl(tt-tau, words[cLs[i]+j+1]) + ealphal(j+tau, j);
-              }
-              cmax = result_alpha.head(tt+1).maxCoeff();
-              ealphal(tt+j+1, j+1) = log((result_alpha.head(tt+1) - cmax).exp().sum()) + cmax;
-              if(ealphal(tt+j+1, j+1) != ealphal(tt+j+1, j+1)){
-                ealphal(tt+j+1, j+1) = neg_inf;
-              }
-            }
-          }
+          word_lattice::forwards<false, Type>(
+              tsize, Ls[i], t, eaBl, ealDl, &words[cLs[i]], letter_ends,
+              ealphal, cand, sumsofar_alpha, result_alpha);
           cum_ealphal.col(i) = ealphal.col(Ls[i]-1);
         }
         // untill here (internal forward message)
@@ -116,6 +105,196 @@ namespace hlm
       }
     }
 
+    template <typename Type>
+    void messages_backwards_log_beam(
+      int T, int N, int P, int Lmax, int Ls[], int cLs[],
+      Type *Al, Type *aDl,
+      Type *aBl, Type *alDl,
+      int words[], int itrunc, int word_ends[], int letter_ends[], Type beam, Type *cmaxBl,
+      Type *betal, Type *betastarl, int pruned[])
+    {
+      // messages_backwards_log with beam pruning of words.
+      // cmaxBl(t, nu) is the sum over the frames before t of the best aBl among the
+      // letters of word nu, so that betal + (cmaxBl(t+tau+1, nu) - cmaxBl(t, nu)) + aDl
+      // bounds the contribution of the word from above. The internal forward pass of the words is computed in the order
+      // of their bounds and stops at the first word whose bound is below best - beam.
+      // pruned[t] is the number of the skipped words at t.
+      int tsize;
+      int i;
+      Type cmax;
+      Type ctmp;
+      Type best;
+      NPArray<Type> eAl(Al, N, N);
+      NPArray<Type> eaDl(aDl, T, N);
+      NPArray<Type> eaBl(aBl, T, P);
+      NPArray<Type> ealDl(alDl, T, P);
+
+      NPArray<Type> ebetal(betal, T, N);
+      NPArray<Type> ebetastarl(betastarl, T, N);
+      NPArray<Type> ecmaxBl(cmaxBl, T+1, N);
+
+      Array<Type, 1, Dynamic> sumsofar_alpha(itrunc);
+      Array<Type, 1, Dynamic> result_alpha(itrunc);
+      Array<Type, Dynamic, Dynamic> ealphal(itrunc, Lmax);
+      Array<Type, 1, Dynamic> result(N);
+      Array<Type, 1, Dynamic> bounds(N);
+      Array<int, 1, Dynamic> order(N);
+      Array<int, 1, Dynamic> cand(itrunc);
+
+      //initialize.
+      Type neg_inf = -1.0*numeric_limits<Type>::infinity();
+      ebetal.setConstant(neg_inf);
+      ebetastarl.setConstant(neg_inf);
+      ebetal.row(T-1).setZero();
+
+      for(int t=T-1; t>=0; t--){
+        if(t > 0 && !word_ends[t-1]){
+          // no word ends at t-1, so none starts at t and betal(t-1, :) stays -inf.
+          continue;
+        }
+        tsize = min(itrunc, T-t);
+        // upper bounds of betastarl(t, :)
+        for(int nu=0; nu<N; nu++){
+          cmax = neg_inf;
+          for(int tau=Ls[nu]-1; tau<tsize; tau++){
+            result_alpha(tau) = ebetal(t+tau, nu) + ecmaxBl(t+tau+1, nu) - ecmaxBl(t, nu) + eaDl(tau, nu);
+            cmax = max(cmax, result_alpha(tau));
+          }
+          bounds(nu) = neg_inf;
+          if(cmax > neg_inf){
+            ctmp = 0.0;
+            for(int tau=Ls[nu]-1; tau<tsize; tau++){
+              ctmp += exp(result_alpha(tau) - cmax);
+            }
+            bounds(nu) = log(ctmp) + cmax;
+          }
+          order(nu) = nu;
+        }
+        sort(order.data(), order.data() + N,
+            [&bounds](int a, int b){ return bounds(a) > bounds(b); });
+
+        best = neg_inf;
+        pruned[t] = 0;
+        for(int k=0; k<N; k++){
+          i = order(k);
+          if(bounds(i) == neg_inf || bounds(i) < best - beam){
+            pruned[t] = N - k;
+            break;
+          }
+          // calculate internal forward message
+          ealphal.setConstant(neg_inf);
+          word_lattice::forwards<false, Type>(
+              tsize, Ls[i], t, eaBl, ealDl, &words[cLs[i]], letter_ends,
+              ealphal, cand, sumsofar_alpha, result_alpha);
+          for(int tau=0; tau<tsize; tau++){
+            result_alpha(tau) = ebetal(t+tau, i) + ealphal(tau, Ls[i]-1) + eaDl(tau, i);
+          }
+          cmax = result_alpha.head(tsize).maxCoeff();
+          if(cmax > neg_inf){
+            ebetastarl(t, i) = log((result_alpha.head(tsize) - cmax).exp().sum()) + cmax;
+            best = max(best, ebetastarl(t, i));
+          }
+        }
+
+        if(likely(t > 0)){
+          for(int nu=0; nu<N; nu++){
+            result = ebetastarl.row(t) + eAl.row(nu);
+            cmax = result.maxCoeff();
+            ebetal(t-1, nu) = log((result - cmax).exp().sum()) + cmax;
+            if(ebetal(t-1, nu) != ebetal(t-1, nu)){
+              ebetal(t-1, nu) = neg_inf;
+            }
+          }
+        }
+      }
+    }
+
+    template <typename Type>
+    void messages_backwards_max(
+      int T, int N, int P, int Lmax, int Ls[], int cLs[],
+      Type *Al, Type *aDl,
+      Type *aBl, Type *alDl,
+      int words[], int itrunc, int word_ends[], int letter_ends[], int bounded[], Type *cmaxBl,
+      Type *betal, Type *betastarl)
+    {
+      // Max-product version of messages_backwards_log.
+      // The words with bounded[nu] are scored by the upper bound cmaxBl(t+tau+1, nu) - cmaxBl(t, nu)
+      // (see messages_backwards_log_beam) instead of their internal forward message.
+      int tsize;
+      NPArray<Type> eAl(Al, N, N);
+      NPArray<Type> eaDl(aDl, T, N);
+      NPArray<Type> eaBl(aBl, T, P);
+      NPArray<Type> ealDl(alDl, T, P);
+      NPArray<Type> ecmaxBl(cmaxBl, T+1, N);
+
+      NPArray<Type> ebetal(betal, T, N);
+      NPArray<Type> ebetastarl(betastarl, T, N);
+
+      //NPArray<Type> ealphal(itrunc, Lmax);
+#ifdef HLM_TEMPS_ON_HEAP
+      Array<Type, 1, Dynamic> sumsofar_alpha(itrunc);
+      Array<Type, 1, Dynamic> result_alpha(itrunc);
+      Array<Type, Dynamic, Dynamic> ealphal(itrunc, Lmax);
+      Array<Type, Dynamic, Dynamic> cum_ealphal(itrunc, N);
+      Array<Type, 1, Dynamic> result(N);
+      Array<Type, 1, Dynamic> maxes(N);
+#else
+      Type sumsofar_alpha_buf[itrunc] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> sumsofar_alpha(sumsofar_alpha_buf, itrunc);
+      Type result_alpha_buf[itrunc] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> result_alpha(result_alpha_buf, itrunc);
+      Type ealphal_buf[itrunc*Lmax] __attribute__((aligned(16)));
+      NPArray<Type> ealphal(ealphal_buf, itrunc, Lmax);
+      Type cum_ealphal_buf[itrunc*N] __attribute__((aligned(16)));
+      NPArray<Type> cum_ealphal(cum_ealphal_buf, itrunc, N);
+      Type result_buf[N] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> result(result_buf, N);
+      Type maxes_buf[N] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> maxes(maxes_buf, N);
+#endif
+      Array<int, 1, Dynamic> cand(itrunc);
+
+      //initialize.
+      Type neg_inf = -1.0*numeric_limits<Type>::infinity();
+      ebetal.setConstant(neg_inf);
+      ebetastarl.setConstant(neg_inf);
+      ebetal.row(T-1).setZero();
+
+      for(int t=T-1; t>=0; t--){
+        if(t > 0 && !word_ends[t-1]){
+          // no word ends at t-1, so none starts at t and betal(t-1, :) stays -inf.
+          continue;
+        }
+        tsize = min(itrunc, T-t);
+        // calculate internal forward message
+        for(int i=0; i<N; i++){
+          if(bounded[i]){
+            for(int tau=0; tau<tsize; tau++){
+              cum_ealphal(tau, i) = tau < Ls[i]-1 ? neg_inf : ecmaxBl(t+tau+1, i) - ecmaxBl(t, i);
+            }
+            continue;
+          }
+          ealphal.setConstant(neg_inf);
+          word_lattice::forwards<true, Type>(
+              tsize, Ls[i], t, eaBl, ealDl, &words[cLs[i]], letter_ends,
+              ealphal, cand, sumsofar_alpha, result_alpha);
+          cum_ealphal.col(i) = ealphal.col(Ls[i]-1);
+        }
+        // untill here (internal forward message)
+
+        for(int tau=0; tau<tsize; tau++){
+          result = ebetal.row(t+tau) + cum_ealphal.row(tau) + eaDl.row(tau);
+          ebetastarl.row(t) = ebetastarl.row(t).cwiseMax(result);
+        }
+        if(likely(t > 0)){
+          for(int nu=0; nu<N; nu++){
+            result = ebetastarl.row(t) + eAl.row(nu);
+            ebetal(t-1, nu) = result.maxCoeff();
+          }
+        }
+      }
+    }
+
 }
 
 // NOTE: this class exists for cyhton binding convenience
@@ -129,9 +308,25 @@ class hlmc
       int T, int N, int P, int Lmax, int Ls[], int cLs[],
       FloatType *Al, FloatType *aDl,
       FloatType *aBl, FloatType* alDl,
-      int words[], int itrunc,
+      int words[], int itrunc, int word_ends[], int letter_ends[],
+      FloatType *betal, FloatType *betastarl)
+    { hlm::messages_backwards_log(T, N, P, Lmax, Ls, cLs, Al, aDl, aBl, alDl, words, itrunc, word_ends, letter_ends, betal, betastarl); }
+
+    static void messages_backwards_log_beam(
+      int T, int N, int P, int Lmax, int Ls[], int cLs[],
+      FloatType *Al, FloatType *aDl,
+      FloatType *aBl, FloatType* alDl,
+      int words[], int itrunc, int word_ends[], int letter_ends[], FloatType beam, FloatType *cmaxBl,
+      FloatType *betal, FloatType *betastarl, int pruned[])
+    { hlm::messages_backwards_log_beam(T, N, P, Lmax, Ls, cLs, Al, aDl, aBl, alDl, words, itrunc, word_ends, letter_ends, beam, cmaxBl, betal, betastarl, pruned); }
+
+    static void messages_backwards_max(
+      int T, int N, int P, int Lmax, int Ls[], int cLs[],
+      FloatType *Al, FloatType *aDl,
+      FloatType *aBl, FloatType* alDl,
+      int words[], int itrunc, int word_ends[], int letter_ends[], int bounded[], FloatType *cmaxBl,
       FloatType *betal, FloatType *betastarl)
-    { hlm::messages_backwards_log(T, N, P, Lmax, Ls, cLs, Al, aDl, aBl, alDl, words, itrunc, betal, betastarl); }
+    { hlm::messages_backwards_max(T, N, P, Lmax, Ls, cLs, Al, aDl, aBl, alDl, words, itrunc, word_ends, letter_ends, bounded, cmaxBl, betal, betastarl); }
 };
 
 #endif
@@ -18,7 +18,19 @@ cdef extern from "hlm_messages.h":
             int T, int N, int P, int Lmax, int[] Ls, int[] cLs,
             Type *Al, Type *aDl,
             Type *aBl, Type* alDl,
-            int[] words, int itrunc,
+            int[] words, int itrunc, int[] word_ends, int[] letter_ends,
+            Type *betal, Type *betastarl) nogil
+        void messages_backwards_log_beam(
+            int T, int N, int P, int Lmax, int[] Ls, int[] cLs,
+            Type *Al, Type *aDl,
+            Type *aBl, Type* alDl,
+            int[] words, int itrunc, int[] word_ends, int[] letter_ends, Type beam, Type *cmaxBl,
+            Type *betal, Type *betastarl, int32_t *pruned) nogil
+        void messages_backwards_max(
+            int T, int N, int P, int Lmax, int[] Ls, int[] cLs,
+            Type *Al, Type *aDl,
+            Type *aBl, Type* alDl,
+            int[] words, int itrunc, int[] word_ends, int[] letter_ends, int[] bounded, Type *cmaxBl,
             Type *betal, Type *betastarl) nogil
 
 def messages_backwards_log(
@@ -32,15 +44,109 @@ def messages_backwards_log(
         int Lmax,
         int itrunc,
         np.ndarray[floating, ndim=2, mode="c"] betal not None,
-        np.ndarray[floating, ndim=2, mode="c"] betastarl not None):
+        np.ndarray[floating, ndim=2, mode="c"] betastarl not None,
+        int[::1] word_ends=None,
+        int[::1] letter_ends=None):
+
+    cdef hlmc[floating] ref
+
+    if word_ends is None:
+        word_ends = np.ones(betal.shape[0], dtype=np.int32)
+    if letter_ends is None:
+        letter_ends = np.ones(betal.shape[0], dtype=np.int32)
+
+    cdef int T = betal.shape[0], N = betal.shape[1], P = aBl.shape[1]
+    cdef floating *pbetal = &betal[0, 0]
+    cdef floating *pbetastarl = &betastarl[0, 0]
+
+    with nogil:
+        ref.messages_backwards_log(
+            T, N, P, Lmax, &Ls[0], &cLs[0],
+            &aAl[0, 0], &aDl[0, 0],
+            &aBl[0, 0], &alDl[0, 0],
+            &words[0], itrunc, &word_ends[0], &letter_ends[0],
+            pbetal, pbetastarl)
+
+    return betal, betastarl
+
+def messages_backwards_log_beam(
+        floating[:,::1] aBl not None,
+        floating[:,::1] aDl not None,
+        floating[:,::1] alDl not None,
+        floating[:,::1] aAl not None,
+        int[::1] words not None,
+        int[::1] Ls not None,
+        int[::1] cLs not None,
+        int Lmax,
+        int itrunc,
+        floating beam,
+        floating[:,::1] cmaxBl not None,
+        np.ndarray[floating, ndim=2, mode="c"] betal not None,
+        np.ndarray[floating, ndim=2, mode="c"] betastarl not None,
+        np.ndarray[np.int32_t, ndim=1, mode="c"] pruned not None,
+        int[::1] word_ends=None,
+        int[::1] letter_ends=None):
+
+    cdef hlmc[floating] ref
+
+    if word_ends is None:
+        word_ends = np.ones(betal.shape[0], dtype=np.int32)
+    if letter_ends is None:
+        letter_ends = np.ones(betal.shape[0], dtype=np.int32)
+
+    cdef int T = betal.shape[0], N = betal.shape[1], P = aBl.shape[1]
+    cdef floating *pbetal = &betal[0, 0]
+    cdef floating *pbetastarl = &betastarl[0, 0]
+    cdef int32_t *ppruned = &pruned[0]
+
+    with nogil:
+        ref.messages_backwards_log_beam(
+            T, N, P, Lmax, &Ls[0], &cLs[0],
+            &aAl[0, 0], &aDl[0, 0],
+            &aBl[0, 0], &alDl[0, 0],
+            &words[0], itrunc, &word_ends[0], &letter_ends[0], beam, &cmaxBl[0, 0],
+            pbetal, pbetastarl, ppruned)
+
+    return betal, betastarl, pruned
+
+def messages_backwards_max(
+        floating[:,::1] aBl not None,
+        floating[:,::1] aDl not None,
+        floating[:,::1] alDl not None,
+        floating[:,::1] aAl not None,
+        int[::1] words not None,
+        int[::1] Ls not None,
+        int[::1] cLs not None,
+        int Lmax,
+        int itrunc,
+        np.ndarray[floating, ndim=2, mode="c"] betal not None,
+        np.ndarray[floating, ndim=2, mode="c"] betastarl not None,
+        int[::1] word_ends=None,
+        int[::1] letter_ends=None,
+        int[::1] bounded=None,
+        floating[:,::1] cmaxBl=None):
 
     cdef hlmc[floating] ref
 
-    ref.messages_backwards_log(
-        betal.shape[0], betal.shape[1], aBl.shape[1], Lmax, &Ls[0], &cLs[0],
-        &aAl[0, 0], &aDl[0, 0],
-        &aBl[0, 0], &alDl[0, 0],
-        &words[0], itrunc,
-        &betal[0, 0], &betastarl[0, 0])
+    if word_ends is None:
+        word_ends = np.ones(betal.shape[0], dtype=np.int32)
+    if letter_ends is None:
+        letter_ends = np.ones(betal.shape[0], dtype=np.int32)
+    if bounded is None:
+        bounded = np.zeros(betal.shape[1], dtype=np.int32)
+    if cmaxBl is None:
+        cmaxBl = np.zeros((betal.shape[0] + 1, betal.shape[1]), dtype=np.asarray(betal).dtype)
+
+    cdef int T = betal.shape[0], N = betal.shape[1], P = aBl.shape[1]
+    cdef floating *pbetal = &betal[0, 0]
+    cdef floating *pbetastarl = &betastarl[0, 0]
+
+    with nogil:
+        ref.messages_backwards_max(
+            T, N, P, Lmax, &Ls[0], &cLs[0],
+            &aAl[0, 0], &aDl[0, 0],
+            &aBl[0, 0], &alDl[0, 0],
+            &words[0], itrunc, &word_ends[0], &letter_ends[0], &bounded[0], &cmaxBl[0, 0],
+            pbetal, pbetastarl)
 
     return betal, betastarl
@@ -1,22 +1,55 @@
 import numpy as np
-from functools import reduce
+from collections import namedtuple
+from itertools import chain
 
 from pyhsmm.util.stats import sample_discrete
 from pyhsmm.util.general import rle
+from pyhlm.util.general import rle_with_boundaries
+from pyhlm.internals.emissions import letter_log_likelihoods
+
+# Compact result of segmenting one utterance. Letters are run-length encoded over the
+# whole utterance, the i-th word owns the next len(word_list[words[i]]) of them.
+# normalizer is the marginal log likelihood for sampled segmentations and the score
+# of the best path for Viterbi segmentations.
+Segmentation = namedtuple("Segmentation", ["words", "durations", "letters", "letter_durations", "normalizer"])
 
 class WeakLimitHDPHLMStatesPython(object):
 
-    def __init__(self, model, data=None, trunc=None, generate=True, initialize_from_prior=False):
+    def __init__(self, model, data=None, trunc=None, generate=True, initialize_from_prior=False, beam=None, min_word_mass=None, emission_beam=None,
+                 word_boundaries=None, letter_boundaries=None):
         self.model = model
         self.data = data
         self.T = T = len(data)
         self.trunc = trunc
+        # beam (in nats) prunes the words far below the best one at each t
+        # from the backward messages. None computes the exact messages.
+        self.beam = beam
+        self._pruned = None
+        # min_word_mass: Viterbi scores the words entered with a lower prior probability by an upper bound.
+        self.min_word_mass = min_word_mass
+        # emission_beam (in nats) keeps, at each frame, only the letters whose score is
+        # within it of the best letter of the frame as candidates in the word lattice.
+        # A too narrow beam can leave no word sequence for the data. None keeps all letters.
+        self.emission_beam = emission_beam
+        # word_boundaries, letter_boundaries: boolean masks of length T, True where a word
+        # (a letter) may end at the frame, e.g. from silence or change-point detection.
+        # The last frame always may, and a word boundary is also a letter boundary.
+        # None allows every frame.
+        self.word_boundaries = word_boundaries
+        self.letter_boundaries = letter_boundaries
+        self._letter_ends = self._boundary_ends(letter_boundaries, word_boundaries)
+        self._word_ends = self._boundary_ends(word_boundaries) if word_boundaries is not None else self._letter_ends
         self._stateseq = np.zeros(T, dtype=np.int32)
         self._stateseq_norep = None
         self._durations_censored = None
         self._normalizer = None
+        self._normalizer_version = None
+        self._pi_0 = None
         self._letter_stateseq = np.zeros(T, dtype=np.int32)
-        self._kwargs = dict(trunc=trunc)
+        self._letter_states = []
+        self._shared_tables = (None, None, None)
+        self._kwargs = dict(trunc=trunc, beam=beam, min_word_mass=min_word_mass, emission_beam=emission_beam,
+                            word_boundaries=word_boundaries, letter_boundaries=letter_boundaries)
         if generate:
             if data is not None and not initialize_from_prior:
                 self.resample()
@@ -27,6 +60,33 @@ class WeakLimitHDPHLMStatesPython(object):
     def generate_states(self):
         raise NotImplementedError
 
+    def _boundary_ends(self, boundaries, extra_boundaries=None):
+        if boundaries is None:
+            return None
+        ends = np.array(boundaries, dtype=bool)
+        if ends.shape != (self.T,):
+            raise ValueError("boundary masks must have one entry per frame ({}), got {}".format(self.T, ends.shape))
+        if extra_boundaries is not None:
+            ends |= self._boundary_ends(extra_boundaries).astype(bool)
+        ends[-1] = True
+        return ends.astype(np.int32)
+
+    @property
+    def word_ends(self):
+        # 1 where a word may end at the frame, None without boundary constraints.
+        return self._word_ends
+
+    @property
+    def letter_ends(self):
+        return self._letter_ends
+
+    def unconstrained(self):
+        # The same utterance without the boundary masks, e.g. to validate a constrained segmentation.
+        kwargs = dict(self._kwargs, word_boundaries=None, letter_boundaries=None)
+        state = self.__class__(self.model, self.data, generate=False, **kwargs)
+        state.pi_0 = self._pi_0
+        return state
+
     @property
     def stateseq(self):
         return self._stateseq
@@ -43,6 +103,15 @@ class WeakLimitHDPHLMStatesPython(object):
     def letter_stateseq(self, letter_stateseq):
         self._letter_stateseq = letter_stateseq
 
+    # Letters of consecutive words are kept apart even if they are the same letter.
+    @property
+    def letter_stateseq_norep(self):
+        return rle_with_boundaries(self.letter_stateseq, np.cumsum(self.durations_censored)[:-1])[0]
+
+    @property
+    def letter_durations(self):
+        return rle_with_boundaries(self.letter_stateseq, np.cumsum(self.durations_censored)[:-1])[1]
+
     @property
     def stateseq_norep(self):
         if self._stateseq_norep is None:
@@ -57,16 +126,34 @@ class WeakLimitHDPHLMStatesPython(object):
 
     # Be care full!!!!
     # This method return the log likelihood which before resampling this model.
-    def log_likelihood(self):
-        if self._normalizer is None:
+    # The cached normalizer is reused even if the parameters changed since, unless current=True.
+    def log_likelihood(self, current=False):
+        if self._normalizer is None or (current and self.normalizer_is_stale):
             _, _, normalizerl = self.messages_backwards()
-            self._normalizer = normalizerl
+            self.set_normalizer(normalizerl)
         return self._normalizer
 
+    # The normalizer is tagged with model.params_version at the time it was computed.
+    @property
+    def normalizer_is_stale(self):
+        return self._normalizer_version != self.model.params_version
+
+    def set_normalizer(self, normalizer):
+        self._normalizer = normalizer
+        self._normalizer_version = self.model.params_version
+
+    # pi_0 can be overridden per state, e.g. by trans_matrix[previous word]
+    # when the data continues an utterance that has already been segmented.
     @property
     def pi_0(self):
+        if self._pi_0 is not None:
+            return self._pi_0
         return self.model.init_state_distn.pi_0
 
+    @pi_0.setter
+    def pi_0(self, pi_0):
+        self._pi_0 = pi_0
+
     @property
     def aDl(self):
         if self._aDl is None:
@@ -75,28 +162,110 @@ class WeakLimitHDPHLMStatesPython(object):
             for idx, dur_distn in enumerate(self.model.dur_distns):
                 aDl[:,idx] = dur_distn.log_pmf(possible_durations)
             self._aDl = aDl
+            self._tables_computed()
+        else:
+            self._tables_used()
         return self._aDl
 
     @property
     def alDl(self):
         if self._alDl is None:
-            alDl = np.empty((self.T,self.model.letter_num_states))
-            possible_durations = np.arange(1,self.T + 1,dtype=np.float64)
-            for idx, dur_distn in enumerate(self.model.letter_dur_distns):
-                alDl[:,idx] = dur_distn.log_pmf(possible_durations)
-            self._alDl = alDl
+            self._alDl = self._letter_duration_table(self.model.letter_dur_distns)
+            self._tables_computed()
+        else:
+            self._tables_used()
         return self._alDl
 
+    def _letter_duration_table(self, dur_distns):
+        alDl = np.empty((self.T,len(dur_distns)))
+        possible_durations = np.arange(1,self.T + 1,dtype=np.float64)
+        for idx, dur_distn in enumerate(dur_distns):
+            alDl[:,idx] = dur_distn.log_pmf(possible_durations)
+        return alDl
+
     @property
     def aBl(self):
         if self._aBl is None:
-            aBl = np.empty((self.data.shape[0], self.model._letter_num_states))
-            for idx, obs_distn in enumerate(self.model.letter_obs_distns):
-                aBl[:,idx] = obs_distn.log_likelihood(self.data).ravel()
-            aBl[np.isnan(aBl).any(1)] = 0.0
-            self._aBl = aBl
+            self._aBl = letter_log_likelihoods(self.data, self.model.letter_obs_distns)
+            self._tables_computed()
+        else:
+            self._tables_used()
         return self._aBl
 
+    # Tables computed outside the state, e.g. for a batch of utterances. They take the place
+    # of the cleared tables, so they are only valid while the parameters do not change.
+    def share_tables(self, aBl, aDl, alDl):
+        self._shared_tables = (aBl, aDl, alDl)
+        self.clear_caches()
+
+    # With model.table_cache (pyhlm.internals.table_cache), the tables of all utterances
+    # share a memory budget and may be dropped between uses, they are recomputed on demand.
+    def _tables_computed(self):
+        table_cache = getattr(self.model, "table_cache", None)
+        if table_cache is not None:
+            table_cache.touch(self)
+
+    def _tables_used(self):
+        table_cache = getattr(self.model, "table_cache", None)
+        if table_cache is not None:
+            table_cache.hit(self)
+
+    def table_nbytes(self):
+        tables = [self._aBl, self._aDl, self._alDl] + (list(self._lattice) if self._lattice is not None else [])
+        return sum(table.nbytes for table in tables if table is not None)
+
+    # The word lattice only needs the letters spelled by some word of word_list.
+    # lattice_aBl and lattice_alDl hold the columns of those letters, and lattice_word
+    # maps a word onto them. The tables are keyed on the active letters, so a new
+    # word_list never reuses the columns of the previous one. aBl and alDl keep all
+    # letters for the letter HSMM. With emission_beam, the letters outside the beam
+    # of a frame are -inf in lattice_aBl, which the kernels skip.
+    @property
+    def active_letters(self):
+        return np.unique(np.fromiter(chain.from_iterable(self.model.word_list), dtype=np.int64))
+
+    @property
+    def lattice_aBl(self):
+        return self._lattice_tables()[0]
+
+    @property
+    def lattice_alDl(self):
+        return self._lattice_tables()[1]
+
+    def lattice_word(self, word):
+        return self._lattice_tables()[2][np.asarray(word, dtype=np.int64)]
+
+    def _lattice_tables(self):
+        active = self.active_letters
+        key = tuple(active)
+        if self._lattice_key != key:
+            if self._aBl is not None:
+                aBl = np.ascontiguousarray(self._aBl[:, active])
+            else:
+                aBl = letter_log_likelihoods(self.data, [self.model.letter_obs_distns[i] for i in active])
+            if self.emission_beam is not None:
+                aBl[aBl < aBl.max(axis=1)[:, None] - self.emission_beam] = -np.inf
+            if self._alDl is not None:
+                alDl = np.ascontiguousarray(self._alDl[:, active])
+            else:
+                alDl = self._letter_duration_table([self.model.letter_dur_distns[i] for i in active])
+            letter_index = np.full(self.model.letter_num_states, -1, dtype=np.int32)
+            letter_index[active] = np.arange(len(active))
+            self._lattice = (aBl, alDl, letter_index)
+            self._lattice_key = key
+            self._tables_computed()
+        else:
+            self._tables_used()
+        return self._lattice
+
+    @property
+    def bounded_states(self):
+        # The words whose prior probability of being entered (from pi_0 or from any word) is below min_word_mass.
+        if self.min_word_mass is None:
+            return np.array([], dtype=np.int64)
+        mass = np.maximum(self.trans_matrix.max(axis=0), self.pi_0)
+        return np.flatnonzero(mass < self.min_word_mass)
+
     @property
     def trans_matrix(self):
         return self.model.trans_distn.trans_matrix
@@ -110,39 +279,109 @@ class WeakLimitHDPHLMStatesPython(object):
     def resample(self):
         self.clear_caches()
         betal, betastarl, normalizerl = self.messages_backwards()
-        self._normalizer = normalizerl
+        if normalizerl == -np.inf and self.emission_beam is not None:
+            betal, betastarl, normalizerl = self._without_emission_beam(self.messages_backwards)
+        self.set_normalizer(normalizerl)
         self.sample_forwards(betal, betastarl)
 
+    def _without_emission_beam(self, messages_func):
+        # The emission beam left no word sequence for the data, rebuilds the lattice
+        # tables with all letters. They stay cached until the next clear_caches.
+        emission_beam, self.emission_beam = self.emission_beam, None
+        self._lattice_key = None
+        try:
+            return messages_func()
+        finally:
+            self.emission_beam = emission_beam
+
     def messages_backwards(self):
-        aDl = self.aDl
-        log_trans_matrix = self.log_trans_matrix
         T = self.T
-        pi_0 = self.pi_0
         trunc = self.trunc if self.trunc is not None else T
         betal = np.zeros((T, self.model.num_states), dtype=np.float64)
         betastarl = np.zeros((T, self.model.num_states), dtype=np.float64)
 
-        return hlm_messages_backwards_log(self.cumulative_likelihoods, aDl, log_trans_matrix, pi_0, trunc, betal, betastarl)
+        self._pruned = None
+        if self.beam is not None:
+            betal, betastarl, normalizerl, self._pruned = hlm_messages_backwards_log_beam(
+                self.likelihood_block_word, self.model.word_list, self.cumulative_max_aBl(self.model.word_list),
+                self.aDl, self.log_trans_matrix, self.pi_0, trunc, self.beam, betal, betastarl, word_ends=self.word_ends)
+        else:
+            betal, betastarl, normalizerl = hlm_messages_backwards_log(
+                self.cumulative_likelihoods, self.aDl, self.log_trans_matrix, self.pi_0, trunc, betal, betastarl, word_ends=self.word_ends)
+        return betal, betastarl, normalizerl
+
+    def cumulative_max_aBl(self, word_list):
+        # cumulative_max_aBl[t, i] is the sum over the frames before t of the best
+        # letter score among the letters of word_list[i].
+        # Letters outside the emission beam score below (best of the frame - emission_beam),
+        # which keeps the sums finite and still bounds them from above.
+        aBl = self.lattice_aBl
+        floor = aBl.max(axis=1) - self.emission_beam if self.emission_beam is not None else -np.inf
+        cmaxBl = np.zeros((self.T + 1, len(word_list)), dtype=np.float64)
+        for state, word in enumerate(word_list):
+            np.cumsum(np.maximum(aBl[:, self.lattice_word(word)].max(axis=1), floor), out=cmaxBl[1:, state])
+        return cmaxBl
 
-    def cumulative_likelihoods(self, start, stop):
+    @property
+    def pruned_fraction(self):
+        # Fraction of the (t, word) pairs skipped by the beam in the last backward pass.
+        if self._pruned is None:
+            return 0.0
+        return self._pruned.sum() / float(self.T * self.model.num_states)
+
+    def beam_statistics(self):
+        # Runs the backward pass with and without the beam, this costs a full exact pass.
+        _, _, normalizer_beam = self.messages_backwards()
+        pruned_fraction = self.pruned_fraction
+        beam, self.beam = self.beam, None
+        try:
+            _, _, normalizer = self.messages_backwards()
+        finally:
+            self.beam = beam
+        return dict(pruned_fraction=pruned_fraction, normalizer_error=normalizer_beam - normalizer)
+
+    def cumulative_likelihoods(self, start, stop, word_list=None):
+        word_list = self.model.word_list if word_list is None else word_list
         T = min(self.T, stop)
         tsize = T - start
-        cum_like = np.empty((tsize, self.model.num_states), dtype=np.float64)
+        cum_like = np.empty((tsize, len(word_list)), dtype=np.float64)
 
-        for state, word in enumerate(self.model.word_list):
+        for state, word in enumerate(word_list):
             cum_like[:, state] = self.likelihood_block_word(start, stop, word)
 
         return cum_like
 
     def likelihood_block_word(self, start, stop, word):
+        return self.internal_messages_forwards(start, stop, word)[:, -1]
+
+    def internal_messages_forwards(self, start, stop, word):
         T = min(self.T, stop)
         tsize = T - start
-        aBl = self.aBl[start:T]
-        alDl = self.alDl[:tsize]
+        aBl = self.lattice_aBl[start:T]
+        alDl = self.lattice_alDl[:tsize]
         L = len(word)
         alphal = np.ones((tsize, L), dtype=np.float64) * -np.inf
 
-        return hlm_internal_hsmm_messages_forwards_log(aBl, alDl, word, alphal)[:, -1]
+        letter_ends = self.letter_ends[start:T] if self.letter_ends is not None else None
+        return hlm_internal_hsmm_messages_forwards_log(aBl, alDl, self.lattice_word(word), alphal, letter_ends)
+
+    def sample_letter_stateseq(self):
+        # Samples the letters of every word of the current word segmentation.
+        letter_stateseq = np.empty(self.T, dtype=np.int32)
+        dc = np.concatenate(([0], self.durations_censored)).cumsum()
+        for i, state in enumerate(self.stateseq_norep):
+            word = self.model.word_list[state]
+            alphal = self.internal_messages_forwards(dc[i], dc[i+1], word)
+            ldurs = hlm_internal_hsmm_backtrace(
+                self.lattice_aBl[dc[i]:dc[i+1]], self.lattice_alDl, self.lattice_word(word), alphal, viterbi=False)
+            letter_stateseq[dc[i]:dc[i+1]] = np.repeat(word, ldurs)
+        self._letter_stateseq = letter_stateseq
+
+    def segmentation(self, normalizer=None):
+        return Segmentation(
+            self.stateseq_norep.copy(), self.durations_censored.copy(),
+            self.letter_stateseq_norep, self.letter_durations,
+            self._normalizer if normalizer is None else normalizer)
 
     def sample_forwards(self, betal, betastarl):
         T = self.T
@@ -157,37 +396,161 @@ class WeakLimitHDPHLMStatesPython(object):
         self._stateseq_norep = stateseq_norep
         self._durations_censored = durations_censored
 
+    def Viterbi(self):
+        # The bounded words only enter the best path through their bound, so when the
+        # decoded path uses none of them it is the exact best path. Otherwise the words
+        # on it are scored exactly and the path is decoded again.
+        self.clear_caches()
+        bounded = self.bounded_states
+        while True:
+            betal, betastarl = self.maxsum_messages_backwards(bounded)
+            if np.max(betastarl[0]) == -np.inf and self.emission_beam is not None:
+                betal, betastarl = self._without_emission_beam(lambda: self.maxsum_messages_backwards(bounded))
+            score = self.maxsum_messages_forwards(betal, betastarl, bounded)
+            on_path = np.intersect1d(self.stateseq_norep, bounded)
+            if len(on_path) == 0:
+                return score
+            bounded = np.setdiff1d(bounded, on_path)
+
+    def maxsum_messages_backwards(self, bounded=()):
+        T = self.T
+        trunc = self.trunc if self.trunc is not None else T
+        betal = np.zeros((T, self.model.num_states), dtype=np.float64)
+        betastarl = np.zeros((T, self.model.num_states), dtype=np.float64)
+        cmaxBl = self.cumulative_max_aBl(self.model.word_list) if len(bounded) > 0 else None
+
+        betal, betastarl = hlm_messages_backwards_max(
+            lambda start, stop: self.cumulative_likelihoods_max(start, stop, bounded=bounded, cmaxBl=cmaxBl),
+            self.aDl, self.log_trans_matrix, trunc, betal, betastarl, word_ends=self.word_ends)
+        return betal, betastarl
+
+    def cumulative_likelihoods_max(self, start, stop, word_list=None, bounded=(), cmaxBl=None):
+        # The words in bounded are scored by the upper bound of cumulative_max_aBl.
+        word_list = self.model.word_list if word_list is None else word_list
+        T = min(self.T, stop)
+        tsize = T - start
+        cum_like = np.empty((tsize, len(word_list)), dtype=np.float64)
+
+        for state, word in enumerate(word_list):
+            if state in bounded:
+                cum_like[:, state] = self.likelihood_bound_word(start, stop, state, word, cmaxBl)
+            else:
+                cum_like[:, state] = self.internal_maxsum_messages_forwards(start, stop, word)[:, -1]
+
+        return cum_like
+
+    def likelihood_bound_word(self, start, stop, state, word, cmaxBl):
+        T = min(self.T, stop)
+        bound = cmaxBl[start+1:T+1, state] - cmaxBl[start, state]
+        bound[:len(word)-1] = -np.inf
+        return bound
+
+    def internal_maxsum_messages_forwards(self, start, stop, word):
+        T = min(self.T, stop)
+        tsize = T - start
+        aBl = self.lattice_aBl[start:T]
+        alDl = self.lattice_alDl[:tsize]
+        L = len(word)
+        alphal = np.ones((tsize, L), dtype=np.float64) * -np.inf
+
+        letter_ends = self.letter_ends[start:T] if self.letter_ends is not None else None
+        return hlm_internal_hsmm_messages_forwards_max(aBl, alDl, self.lattice_word(word), alphal, letter_ends)
+
+    def maxsum_messages_forwards(self, betal, betastarl, bounded=()):
+        # Decodes the best word segmentation from the max-product messages and
+        # backtraces the letters of each word. Returns the score of the best path.
+        # The words in bounded keep their bound and get no letters (-1).
+        T = self.T
+        trunc = self.trunc if self.trunc is not None else T
+        aDl = self.aDl
+        cmaxBl = self.cumulative_max_aBl(self.model.word_list) if len(bounded) > 0 else None
+        stateseq = np.empty(T, dtype=np.int32)
+        letter_stateseq = np.empty(T, dtype=np.int32)
+        stateseq_norep, durations_censored = [], []
+
+        t = 0
+        nextstate_scores = np.log(self.pi_0)
+        score = np.max(betastarl[0] + nextstate_scores)
+        while t < T:
+            state = np.argmax(betastarl[t] + nextstate_scores)
+            word = self.model.word_list[state]
+            if state in bounded:
+                like = self.likelihood_bound_word(t, t+trunc, state, word, cmaxBl)
+                tsize = like.shape[0]
+                dur = np.argmax(like + betal[t:t+tsize, state] + aDl[:tsize, state]) + 1
+                letter_stateseq[t:t+dur] = -1
+            else:
+                alphal = self.internal_maxsum_messages_forwards(t, t+trunc, word)
+                tsize = alphal.shape[0]
+                dur = np.argmax(alphal[:, -1] + betal[t:t+tsize, state] + aDl[:tsize, state]) + 1
+                ldurs = hlm_internal_hsmm_backtrace(
+                    self.lattice_aBl[t:t+dur], self.lattice_alDl, self.lattice_word(word), alphal[:dur], viterbi=True)
+                letter_stateseq[t:t+dur] = np.repeat(word, ldurs)
+
+            stateseq[t:t+dur] = state
+            stateseq_norep.append(state)
+            durations_censored.append(dur)
+            nextstate_scores = self.log_trans_matrix[state]
+            t += dur
+
+        self._stateseq = stateseq
+        self._stateseq_norep = np.array(stateseq_norep, dtype=np.int32)
+        self._durations_censored = np.array(durations_censored, dtype=np.int32)
+        self._letter_stateseq = letter_stateseq
+        return score
+
     def clear_caches(self):
-        self._aBl = None
-        self._aDl = None
-        self._alDl = None
+        self._aBl, self._aDl, self._alDl = self._shared_tables
         self._log_trans_matrix = None
+        self._lattice = None
+        self._lattice_key = None
+        table_cache = getattr(self.model, "table_cache", None)
+        if table_cache is not None:
+            table_cache.discard(self)
 
     def add_word_datas(self, **kwargs):
         s = self.stateseq_norep
         d = self.durations_censored
         dc = np.concatenate(([0], d)).cumsum()
+        # Segment states are pooled per utterance and rebound to the new segments,
+        # only segments beyond the pool size allocate new objects.
+        letter_states = self._letter_states
         for i, word_idx in enumerate(s):
-            self.model.add_word_data(self.data[dc[i]:dc[i+1]], hlmstate=self, word_idx=word_idx, d0=dc[i], d1=dc[i+1], **kwargs)
+            if i < len(letter_states):
+                letter_states[i].reset(self, word_idx, dc[i], dc[i+1])
+                self.model.letter_hsmm.states_list.append(letter_states[i])
+            else:
+                self.model.add_word_data(self.data[dc[i]:dc[i+1]], hlmstate=self, word_idx=word_idx, d0=dc[i], d1=dc[i+1], **kwargs)
+                letter_states.append(self.model.letter_hsmm.states_list[-1])
+        del letter_states[len(s):]
 
 class WeakLimitHDPHLMStates(WeakLimitHDPHLMStatesPython):
 
     def messages_backwards(self):
-        from pyhlm.internals.hlm_messages_interface import messages_backwards_log
-        words = np.array(reduce(lambda a, b: a + b, self.model.word_list), dtype=np.int32)
-        Ls = np.array([len(word) for word in self.model.word_list], dtype=np.int32)
-        cLs = np.concatenate(([0], np.cumsum(Ls)[:-1])).astype(np.int32)
-        Lmax = Ls.max()
+        from pyhlm.internals.hlm_messages_interface import messages_backwards_log, messages_backwards_log_beam
+        words, Ls, cLs, Lmax = self._lattice_words(self.model.word_list)
         N = self.model.num_states
         T = self.T
         pi_0 = self.pi_0
         trunc = self.trunc if self.trunc is not None else T
-        betal, betastarl = messages_backwards_log(
-            self.aBl, self.aDl, self.alDl, self.log_trans_matrix,
-            words, Ls, cLs, Lmax, trunc,
-            np.zeros((T, self.model.num_states), dtype=np.float64),
-            np.zeros((T, self.model.num_states), dtype=np.float64)
-        )
+        self._pruned = None
+        if self.beam is not None:
+            betal, betastarl, self._pruned = messages_backwards_log_beam(
+                self.lattice_aBl, self.aDl, self.lattice_alDl, self.log_trans_matrix,
+                words, Ls, cLs, Lmax, trunc, float(self.beam), self.cumulative_max_aBl(self.model.word_list),
+                np.zeros((T, N), dtype=np.float64),
+                np.zeros((T, N), dtype=np.float64),
+                np.zeros(T, dtype=np.int32),
+                self.word_ends, self.letter_ends
+            )
+        else:
+            betal, betastarl = messages_backwards_log(
+                self.lattice_aBl, self.aDl, self.lattice_alDl, self.log_trans_matrix,
+                words, Ls, cLs, Lmax, trunc,
+                np.zeros((T, N), dtype=np.float64),
+                np.zeros((T, N), dtype=np.float64),
+                self.word_ends, self.letter_ends
+            )
 
         assert not np.isnan(betal).any()
         assert not np.isnan(betastarl).any()
@@ -196,27 +559,71 @@ class WeakLimitHDPHLMStates(WeakLimitHDPHLMStatesPython):
 
         return betal, betastarl, normalizerl
 
+    def _lattice_words(self, word_list):
+        # Flattened words over the lattice letters, as the native kernels take them.
+        letter_index = self._lattice_tables()[2]
+        words = letter_index[np.fromiter(chain.from_iterable(word_list), dtype=np.int64)].astype(np.int32)
+        Ls = np.array([len(word) for word in word_list], dtype=np.int32)
+        cLs = np.concatenate(([0], np.cumsum(Ls)[:-1])).astype(np.int32)
+        return words, Ls, cLs, Ls.max()
+
     def messages_backwards_python(self):
         return super(WeakLimitHDPHLMStates, self).messages_backwards()
 
-    def likelihood_block_word(self, start, stop, word):
+    def internal_messages_forwards(self, start, stop, word):
         from pyhlm.internals.internal_hsmm_messages_interface import internal_hsmm_messages_forwards_log
         T = min(self.T, stop)
         tsize = T - start
-        aBl = self.aBl[start:T]
-        alDl = self.alDl[:tsize]
+        aBl = self.lattice_aBl[start:T]
+        alDl = self.lattice_alDl[:tsize]
         L = len(word)
         alphal = np.ones((tsize, L), dtype=np.float64) * -np.inf
 
         if tsize - L + 1 <= 0:
-            return alphal[:, -1]
+            return alphal
 
-        return internal_hsmm_messages_forwards_log(aBl, alDl, np.array(word, dtype=np.int32), alphal)[:, -1]
+        letter_ends = self.letter_ends[start:T] if self.letter_ends is not None else None
+        return internal_hsmm_messages_forwards_log(aBl, alDl, self.lattice_word(word).astype(np.int32), alphal, letter_ends)
 
     def likelihood_block_word_python(self, start, stop, word):
         return super(WeakLimitHDPHLMStates, self).likelihood_block_word(start, stop, word)
 
-def hlm_internal_hsmm_messages_forwards_log(aBl, alDl, word, alphal):
+    def maxsum_messages_backwards(self, bounded=()):
+        from pyhlm.internals.hlm_messages_interface import messages_backwards_max
+        words, Ls, cLs, Lmax = self._lattice_words(self.model.word_list)
+        N = self.model.num_states
+        T = self.T
+        trunc = self.trunc if self.trunc is not None else T
+        bounded_words = np.zeros(N, dtype=np.int32)
+        bounded_words[np.asarray(bounded, dtype=np.int64)] = 1
+        return messages_backwards_max(
+            self.lattice_aBl, self.aDl, self.lattice_alDl, self.log_trans_matrix,
+            words, Ls, cLs, Lmax, trunc,
+            np.zeros((T, N), dtype=np.float64),
+            np.zeros((T, N), dtype=np.float64),
+            self.word_ends, self.letter_ends,
+            bounded_words, self.cumulative_max_aBl(self.model.word_list) if len(bounded) > 0 else None
+        )
+
+    def maxsum_messages_backwards_python(self, bounded=()):
+        return super(WeakLimitHDPHLMStates, self).maxsum_messages_backwards(bounded)
+
+    def internal_maxsum_messages_forwards(self, start, stop, word):
+        from pyhlm.internals.internal_hsmm_messages_interface import internal_hsmm_messages_forwards_max
+        T = min(self.T, stop)
+        tsize = T - start
+        aBl = self.lattice_aBl[start:T]
+        alDl = self.lattice_alDl[:tsize]
+        L = len(word)
+        alphal = np.ones((tsize, L), dtype=np.float64) * -np.inf
+
+        if tsize - L + 1 <= 0:
+            return alphal
+
+        letter_ends = self.letter_ends[start:T] if self.letter_ends is not None else None
+        return internal_hsmm_messages_forwards_max(aBl, alDl, self.lattice_word(word).astype(np.int32), alphal, letter_ends)
+
+def hlm_internal_hsmm_messages_forwards_log(aBl, alDl, word, alphal, letter_ends=None):
     T = alphal.shape[0]
     L = alphal.shape[1]
     alphal[:] = -np.inf
@@ -226,18 +633,93 @@ def hlm_internal_hsmm_messages_forwards_log(aBl, alDl, word, alphal):
 
     cumsum_aBl = np.empty(T-L+1, dtype=np.float64)
     alphal[:T-L+1, 0] = np.cumsum(aBl[:T-L+1, word[0]]) + alDl[:T-L+1, word[0]]
+    if letter_ends is not None:
+        alphal[:T-L+1, 0][letter_ends[:T-L+1] == 0] = -np.inf
     cache_range = range(T - L + 1)
     for j, l in enumerate(word[1:]):
         cumsum_aBl[:] = 0.0
+        lo = 0
         for t in cache_range:
-            cumsum_aBl[:t+1] += aBl[t+j+1, l]
-            alphal[t+j+1, j+1] = np.logaddexp.reduce(cumsum_aBl[:t+1] + alDl[t::-1, l] + alphal[j:t+j+1, j])
+            if aBl[t+j+1, l] == -np.inf:
+                # Letters outside the emission beam cut every segment over this frame.
+                lo = t+1
+                continue
+            cumsum_aBl[lo:t+1] += aBl[t+j+1, l]
+            if letter_ends is not None and not letter_ends[t+j+1]:
+                continue
+            alphal[t+j+1, j+1] = np.logaddexp.reduce(cumsum_aBl[lo:t+1] + alDl[t-lo::-1, l] + alphal[j+lo:t+j+1, j])
     return alphal
 
-def hlm_messages_backwards_log(cumulative_likelihoods_func, aDl, log_trans_matrix, pi_0, trunc, betal, betastarl):
+def hlm_internal_hsmm_messages_forwards_max(aBl, alDl, word, alphal, letter_ends=None):
+    T = alphal.shape[0]
+    L = alphal.shape[1]
+    alphal[:] = -np.inf
+
+    if T-L+1 <= 0:
+        return alphal
+
+    cumsum_aBl = np.empty(T-L+1, dtype=np.float64)
+    alphal[:T-L+1, 0] = np.cumsum(aBl[:T-L+1, word[0]]) + alDl[:T-L+1, word[0]]
+    if letter_ends is not None:
+        alphal[:T-L+1, 0][letter_ends[:T-L+1] == 0] = -np.inf
+    cache_range = range(T - L + 1)
+    for j, l in enumerate(word[1:]):
+        cumsum_aBl[:] = 0.0
+        lo = 0
+        for t in cache_range:
+            if aBl[t+j+1, l] == -np.inf:
+                # Letters outside the emission beam cut every segment over this frame.
+                lo = t+1
+                continue
+            cumsum_aBl[lo:t+1] += aBl[t+j+1, l]
+            if letter_ends is not None and not letter_ends[t+j+1]:
+                continue
+            alphal[t+j+1, j+1] = np.max(cumsum_aBl[lo:t+1] + alDl[t-lo::-1, l] + alphal[j+lo:t+j+1, j])
+    return alphal
+
+def hlm_internal_hsmm_backtrace(aBl, alDl, word, alphal, viterbi=False):
+    # Letter durations of a word which covers all frames of aBl, given the internal
+    # forward messages alphal of the word (log-sum or max-product, matching viterbi).
+    T = aBl.shape[0]
+    L = len(word)
+    durations = np.empty(L, dtype=np.int32)
+    end = T - 1
+    for j in range(L-1, 0, -1):
+        l = word[j]
+        starts = np.arange(j, end+1)
+        scores = alphal[starts-1, j-1] + np.cumsum(aBl[end:j-1:-1, l])[::-1] + alDl[end-starts, l]
+        if viterbi:
+            start = starts[np.argmax(scores)]
+        else:
+            start = starts[sample_discrete(np.exp(scores - scores.max()))]
+        durations[j] = end - start + 1
+        end = start - 1
+    durations[0] = end + 1
+    return durations
+
+def hlm_messages_backwards_max(cumulative_likelihoods_func, aDl, log_trans_matrix, trunc, betal, betastarl, word_ends=None):
+    T = betal.shape[0]
+
+    for t in range(T-1, -1, -1):
+        if t > 0 and word_ends is not None and not word_ends[t-1]:
+            betastarl[t] = betal[t-1] = -np.inf
+            continue
+        betastarl[t] = np.max(
+            betal[t:t+trunc] + cumulative_likelihoods_func(t, t+trunc) + aDl[:min(trunc, T-t)],
+            axis=0
+        )
+        betal[t-1] = np.max(betastarl[t] + log_trans_matrix, axis=1)
+    betal[-1] = 0.0
+    return betal, betastarl
+
+def hlm_messages_backwards_log(cumulative_likelihoods_func, aDl, log_trans_matrix, pi_0, trunc, betal, betastarl, word_ends=None):
+    # word_ends: 0 where no word may end at the frame, so no word starts at the next one.
     T = betal.shape[0]
 
     for t in range(T-1, -1, -1):
+        if t > 0 and word_ends is not None and not word_ends[t-1]:
+            betastarl[t] = betal[t-1] = -np.inf
+            continue
         betastarl[t] = np.logaddexp.reduce(
             betal[t:t+trunc] + cumulative_likelihoods_func(t, t+trunc) + aDl[:min(trunc, T-t)],
             axis=0
@@ -247,6 +729,37 @@ def hlm_messages_backwards_log(cumulative_likelihoods_func, aDl, log_trans_matri
     normalizerl = np.logaddexp.reduce(betastarl[0] + np.log(pi_0))
     return betal, betastarl, normalizerl
 
+def hlm_messages_backwards_log_beam(likelihood_block_word_func, word_list, cmaxBl, aDl, log_trans_matrix, pi_0, trunc, beam, betal, betastarl, word_ends=None):
+    # hlm_messages_backwards_log where the words whose upper bound is below best - beam are skipped.
+    # The bound replaces the internal likelihood of a word with the best of its letters at every frame.
+    T, N = betal.shape
+    Ls = np.array([len(word) for word in word_list])
+    pruned = np.zeros(T, dtype=np.int32)
+    betal[:] = -np.inf
+    betastarl[:] = -np.inf
+    betal[-1] = 0.0
+
+    for t in range(T-1, -1, -1):
+        if t > 0 and word_ends is not None and not word_ends[t-1]:
+            continue
+        tsize = min(trunc, T-t)
+        scores = betal[t:t+tsize] + (cmaxBl[t+1:t+tsize+1] - cmaxBl[t]) + aDl[:tsize]
+        scores[np.arange(tsize)[:, None] < Ls - 1] = -np.inf
+        bounds = np.logaddexp.reduce(scores, axis=0)
+        best = -np.inf
+        for k, state in enumerate(np.argsort(-bounds, kind="stable")):
+            if bounds[state] == -np.inf or bounds[state] < best - beam:
+                pruned[t] = N - k
+                break
+            betastarl[t, state] = np.logaddexp.reduce(
+                betal[t:t+tsize, state] + likelihood_block_word_func(t, t+trunc, word_list[state]) + aDl[:tsize, state]
+            )
+            best = max(best, betastarl[t, state])
+        if t > 0:
+            betal[t-1] = np.logaddexp.reduce(betastarl[t] + log_trans_matrix, axis=1)
+    normalizerl = np.logaddexp.reduce(betastarl[0] + np.log(pi_0))
+    return betal, betastarl, normalizerl, pruned
+
 def hlm_sample_forwards_log(likelihood_block_word_func, trans_matrix, pi_0, aDl, word_list, betal, betastarl, stateseq, stateseq_norep, durations_censored):
     stateseq[:] = -1
     T = betal.shape[0]
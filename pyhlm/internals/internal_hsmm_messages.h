@@ -8,6 +8,7 @@
 
 #include "util.h"
 #include "nptypes.h"
+#include "word_lattice.h"
 
 namespace internal_hsmm
 {
@@ -18,51 +19,175 @@ namespace internal_hsmm
     template <typename Type>
     void internal_hsmm_messages_forwards_log(
       int T, int L, int P,
-      Type *aBl, Type* alDl, int word[],
+      Type *aBl, Type* alDl, int word[], int letter_ends[],
       Type *alphal)
     {
       // T: Length of observations.
       // P: Number of phonemes in model. (Number of upper limit of phonemes.)
       // L: Length of the word. (Number of letters in word.)
+      // letter_ends: 0 where no letter may end at the frame.
       NPArray<Type> eaBl(aBl, T, P);
       NPArray<Type> ealDl(alDl, T, P);
 
       NPArray<Type> ealphal(alphal, T, L);
 
-#ifdef HLM_TEMPS_ON_HEAP
-      Array<Type,1,Dynamic> sumsofar(T-L+1);
-      Array<Type,1,Dynamic> result(T-L+1);
-#else
-      Type sumsofar_buf[T-L+1] __attribute__((aligned(16)));
-      NPRowVectorArray<Type> sumsofar(sumsofar_buf,T-L+1);
-      Type result_buf[T-L+1] __attribute__((aligned(16)));
-      NPRowVectorArray<Type> result(result_buf,T-L+1);
-#endif
+      Array<int,1,Dynamic> cand(max(T-L+1, 1));
+      Array<Type,1,Dynamic> sumsofar(max(T-L+1, 1));
+      Array<Type,1,Dynamic> result(max(T-L+1, 1));
 
       //initialize.
       Type neg_inf = -1.0*numeric_limits<Type>::infinity();
       ealphal.setConstant(neg_inf);
 
-      Type ctmp = 0.0;
-      for(int t=0; t<T-L+1; t++){
-        ctmp += eaBl(t, word[0]);
-        ealphal(t, 0) = ctmp + ealDl(t, word[0]);
-      }
+      word_lattice::forwards<false, Type>(T, L, 0, eaBl, ealDl, word, letter_ends, ealphal, cand, sumsofar, result);
+    }
+
+    template <typename Type>
+    void internal_hsmm_messages_forwards_max(
+      int T, int L, int P,
+      Type *aBl, Type* alDl, int word[], int letter_ends[],
+      Type *alphal)
+    {
+      // Max-product version of internal_hsmm_messages_forwards_log.
+      NPArray<Type> eaBl(aBl, T, P);
+      NPArray<Type> ealDl(alDl, T, P);
 
+      NPArray<Type> ealphal(alphal, T, L);
+
+      Array<int,1,Dynamic> cand(max(T-L+1, 1));
+      Array<Type,1,Dynamic> sumsofar(max(T-L+1, 1));
+      Array<Type,1,Dynamic> result(max(T-L+1, 1));
+
+      //initialize.
+      Type neg_inf = -1.0*numeric_limits<Type>::infinity();
+      ealphal.setConstant(neg_inf);
+
+      word_lattice::forwards<true, Type>(T, L, 0, eaBl, ealDl, word, letter_ends, ealphal, cand, sumsofar, result);
+    }
+
+    template <typename Type>
+    void resample_segments_log(
+      int T, int P, int S, int segs[], int itrunc,
+      Type *aBl, Type *alDl, Type *alDsl, int letter_ends[], Type *Al, Type *logpi_0,
+      Type *rands, Type *betal, Type *betastarl,
+      Type *normalizers, int32_t *stateseq)
+    {
+      // T: Length of observations. (All segments are slices of these frames.)
+      // P: Number of phonemes in model.
+      // S: Number of segments. Segment s covers frames segs[s] <= t < segs[s+1]
+      //    and its last letter is right-censored at the segment boundary, as in pyhsmm.
+      // alDsl: log survival of the letter durations, alDsl(d, p) = log P(D > d+1).
+      // letter_ends: 0 where no letter may end at the frame (segment ends always may).
+      // rands: 2*T uniform random numbers. (Two per sampled letter.)
+      NPArray<Type> eaBl(aBl, T, P);
+      NPArray<Type> ealDl(alDl, T, P);
+      NPArray<Type> ealDsl(alDsl, T, P);
+      NPArray<Type> eAl(Al, P, P);
+      NPRowVectorArray<Type> elogpi_0(logpi_0, P);
+
+      NPArray<Type> ebetal(betal, T, P);
+      NPArray<Type> ebetastarl(betastarl, T, P);
+
+#ifdef HLM_TEMPS_ON_HEAP
+      Array<Type,1,Dynamic> sumsofar(P);
+      Array<Type,1,Dynamic> result(P);
+      Array<Type,1,Dynamic> maxes(P);
+#else
+      Type sumsofar_buf[P] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> sumsofar(sumsofar_buf,P);
+      Type result_buf[P] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> result(result_buf,P);
+      Type maxes_buf[P] __attribute__((aligned(16)));
+      NPRowVectorArray<Type> maxes(maxes_buf,P);
+#endif
+
+      Type neg_inf = -1.0*numeric_limits<Type>::infinity();
       Type cmax;
-      for(int j=0; j<L-1; j++){
-        sumsofar.setZero();
-        for(int t=0; t<T-L+1; t++){
-          for(int tau=0; tau<=t; tau++){
-            sumsofar(tau) = sumsofar(tau) + eaBl(t+j+1, word[j+1]);
-            result(tau) = sumsofar(tau) + ealDl(t-tau, word[j+1]) + ealphal(j+tau, j);
+      int k = 0;
+
+      for(int s=0; s<S; s++){
+        int s0 = segs[s];
+        int s1 = segs[s+1];
+
+        // backward messages of segment s.
+        ebetal.block(s0, 0, s1-s0, P).setConstant(neg_inf);
+        ebetastarl.block(s0, 0, s1-s0, P).setConstant(neg_inf);
+        ebetal.row(s1-1).setZero();
+        for(int t=s1-1; t>=s0; t--){
+          int tsize = min(itrunc, s1-t);
+          sumsofar.setZero();
+          for(int d=0; d<tsize; d++){
+            sumsofar += eaBl.row(t+d);
+            result = ebetal.row(t+d) + sumsofar + ealDl.row(d);
+            maxes = ebetastarl.row(t).cwiseMax(result);
+            ebetastarl.row(t) = ((ebetastarl.row(t) - maxes).exp() + (result - maxes).exp()).log() + maxes;
+            for(int p=0; p<P; p++){
+              if(ebetastarl(t, p) != ebetastarl(t, p)){
+                ebetastarl(t, p) = neg_inf;
+              }
+            }
           }
-          cmax = result.head(t+1).maxCoeff();
-          ealphal(t+j+1, j+1) = log((result.head(t+1) - cmax).exp().sum()) + cmax;
-          if(ealphal(t+j+1, j+1) != ealphal(t+j+1, j+1)){
-            ealphal(t+j+1, j+1) = neg_inf;
+          if(s1-t-1 < itrunc){
+            // the letter lasts beyond the segment end.
+            result = sumsofar + ealDsl.row(s1-t-1);
+            maxes = ebetastarl.row(t).cwiseMax(result);
+            ebetastarl.row(t) = ((ebetastarl.row(t) - maxes).exp() + (result - maxes).exp()).log() + maxes;
+            for(int p=0; p<P; p++){
+              if(ebetastarl(t, p) != ebetastarl(t, p)){
+                ebetastarl(t, p) = neg_inf;
+              }
+            }
+          }
+          if(likely(t > s0)){
+            if(letter_ends[t-1] == 0){
+              ebetal.row(t-1).setConstant(neg_inf);
+            } else {
+              for(int p=0; p<P; p++){
+                result = ebetastarl.row(t) + eAl.row(p);
+                cmax = result.maxCoeff();
+                ebetal(t-1, p) = log((result - cmax).exp().sum()) + cmax;
+                if(ebetal(t-1, p) != ebetal(t-1, p)){
+                  ebetal(t-1, p) = neg_inf;
+                }
+              }
+            }
           }
         }
+        result = ebetastarl.row(s0) + elogpi_0;
+        cmax = result.maxCoeff();
+        normalizers[s] = log((result - cmax).exp().sum()) + cmax;
+
+        // forward sampling of segment s.
+        int t = s0;
+        int state = -1;
+        while(t < s1){
+          if(state < 0){
+            result = ebetastarl.row(t) + elogpi_0;
+          } else {
+            result = ebetastarl.row(t) + eAl.row(state);
+          }
+          cmax = result.maxCoeff();
+          maxes = (result - cmax).exp();
+          state = util::sample_discrete(P, maxes.data(), rands[k++]);
+
+          // the mass left after the last duration is the censored one, it ends at s1.
+          int tsize = min(itrunc, s1-t);
+          Type durprob = rands[k++];
+          Type ctmp = 0.0;
+          int dur = 0;
+          while(dur < tsize){
+            ctmp += eaBl(t+dur, state);
+            durprob -= exp(ebetal(t+dur, state) + ctmp + ealDl(dur, state) - ebetastarl(t, state));
+            dur++;
+            if(durprob <= 0){
+              break;
+            }
+          }
+          for(int d=0; d<dur; d++){
+            stateseq[t+d] = state;
+          }
+          t += dur;
+        }
       }
     }
 
@@ -77,9 +202,22 @@ class internal_hsmmc
 
     static void internal_hsmm_messages_forwards_log(
       int T, int L, int P,
-      FloatType *aBl, FloatType *alDl, int word[],
+      FloatType *aBl, FloatType *alDl, int word[], int letter_ends[],
       FloatType *alphal)
-    { internal_hsmm::internal_hsmm_messages_forwards_log(T, L, P, aBl, alDl, word, alphal); }
+    { internal_hsmm::internal_hsmm_messages_forwards_log(T, L, P, aBl, alDl, word, letter_ends, alphal); }
+
+    static void internal_hsmm_messages_forwards_max(
+      int T, int L, int P,
+      FloatType *aBl, FloatType *alDl, int word[], int letter_ends[],
+      FloatType *alphal)
+    { internal_hsmm::internal_hsmm_messages_forwards_max(T, L, P, aBl, alDl, word, letter_ends, alphal); }
+
+    static void resample_segments_log(
+      int T, int P, int S, int segs[], int itrunc,
+      FloatType *aBl, FloatType *alDl, FloatType *alDsl, int letter_ends[], FloatType *Al, FloatType *logpi_0,
+      FloatType *rands, FloatType *betal, FloatType *betastarl,
+      FloatType *normalizers, IntType *stateseq)
+    { internal_hsmm::resample_segments_log(T, P, S, segs, itrunc, aBl, alDl, alDsl, letter_ends, Al, logpi_0, rands, betal, betastarl, normalizers, stateseq); }
 
 };
 
@@ -15,19 +15,90 @@ cdef extern from "internal_hsmm_messages.h":
     cdef cppclass internal_hsmmc[Type]:
         internal_hsmmc()
         void internal_hsmm_messages_forwards_log(
-            int T, int L, int P, Type *aBl, Type *alDl, int[] word,
+            int T, int L, int P, Type *aBl, Type *alDl, int[] word, int[] letter_ends,
             Type *alphal) nogil
+        void internal_hsmm_messages_forwards_max(
+            int T, int L, int P, Type *aBl, Type *alDl, int[] word, int[] letter_ends,
+            Type *alphal) nogil
+        void resample_segments_log(
+            int T, int P, int S, int[] segs, int itrunc,
+            Type *aBl, Type *alDl, Type *alDsl, int[] letter_ends, Type *Al, Type *logpi_0,
+            Type *rands, Type *betal, Type *betastarl,
+            Type *normalizers, int32_t *stateseq) nogil
 
 def internal_hsmm_messages_forwards_log(
         floating[:,::1] aBl not None,
         floating[:,::1] alDl not None,
         int[::1] word not None,
-        np.ndarray[floating, ndim=2, mode="c"] alphal not None):
+        np.ndarray[floating, ndim=2, mode="c"] alphal not None,
+        int[::1] letter_ends=None):
 
     cdef internal_hsmmc[floating] ref
 
-    ref.internal_hsmm_messages_forwards_log(
-        alphal.shape[0], alphal.shape[1], aBl.shape[1],
-        &aBl[0, 0], &alDl[0, 0], &word[0], &alphal[0, 0])
+    if letter_ends is None:
+        letter_ends = np.ones(alphal.shape[0], dtype=np.int32)
+
+    cdef int T = alphal.shape[0], L = alphal.shape[1], P = aBl.shape[1]
+    cdef floating *palphal = &alphal[0, 0]
+
+    with nogil:
+        ref.internal_hsmm_messages_forwards_log(
+            T, L, P, &aBl[0, 0], &alDl[0, 0], &word[0], &letter_ends[0], palphal)
 
     return alphal
+
+def internal_hsmm_messages_forwards_max(
+        floating[:,::1] aBl not None,
+        floating[:,::1] alDl not None,
+        int[::1] word not None,
+        np.ndarray[floating, ndim=2, mode="c"] alphal not None,
+        int[::1] letter_ends=None):
+
+    cdef internal_hsmmc[floating] ref
+
+    if letter_ends is None:
+        letter_ends = np.ones(alphal.shape[0], dtype=np.int32)
+
+    cdef int T = alphal.shape[0], L = alphal.shape[1], P = aBl.shape[1]
+    cdef floating *palphal = &alphal[0, 0]
+
+    with nogil:
+        ref.internal_hsmm_messages_forwards_max(
+            T, L, P, &aBl[0, 0], &alDl[0, 0], &word[0], &letter_ends[0], palphal)
+
+    return alphal
+
+def resample_segments_log(
+        floating[:,::1] aBl not None,
+        floating[:,::1] alDl not None,
+        floating[:,::1] alDsl not None,
+        floating[:,::1] aAl not None,
+        floating[::1] logpi_0 not None,
+        int[::1] segs not None,
+        int itrunc,
+        floating[::1] rands not None,
+        np.ndarray[floating, ndim=2, mode="c"] betal not None,
+        np.ndarray[floating, ndim=2, mode="c"] betastarl not None,
+        np.ndarray[floating, ndim=1, mode="c"] normalizers not None,
+        np.ndarray[np.int32_t, ndim=1, mode="c"] stateseq not None,
+        int[::1] letter_ends=None):
+
+    cdef internal_hsmmc[floating] ref
+
+    if letter_ends is None:
+        letter_ends = np.ones(aBl.shape[0], dtype=np.int32)
+
+    cdef int T = aBl.shape[0], P = aBl.shape[1], S = segs.shape[0] - 1
+    cdef floating *pbetal = &betal[0, 0]
+    cdef floating *pbetastarl = &betastarl[0, 0]
+    cdef floating *pnormalizers = &normalizers[0]
+    cdef int32_t *pstateseq = &stateseq[0]
+
+    with nogil:
+        ref.resample_segments_log(
+            T, P, S, &segs[0], itrunc,
+            &aBl[0, 0], &alDl[0, 0], &alDsl[0, 0], &letter_ends[0], &aAl[0, 0], &logpi_0[0],
+            &rands[0], pbetal, pbetastarl,
+            pnormalizers, pstateseq)
+
+    return stateseq, normalizers
@@ -1,7 +1,9 @@
 import numpy as np
 
+from pyhsmm.util.stats import sample_discrete
 from pyhsmm.internals.hsmm_states import HSMMStatesPython
 from pyhsmm.internals.hsmm_states import HSMMStatesEigen
+from pyhlm.internals.emissions import letter_log_likelihoods
 
 class LetterHSMMStatesPython(HSMMStatesPython):
 
@@ -16,6 +18,36 @@ class LetterHSMMStatesPython(HSMMStatesPython):
     def word_idx(self):
         return self._word_idx
 
+    def reset(self, hlmstate, word_idx, d0, d1):
+        # Rebinds a pooled segment state to another segment of hlmstate instead of
+        # building a new object. The result is the same as a fresh generate=False state.
+        self._hlmstate = hlmstate
+        self._word_idx = word_idx
+        self._d0 = d0
+        self._d1 = d1
+        self.data = hlmstate.data[d0:d1]
+        self.T = d1 - d0
+        self.stateseq = None
+        self.clear_caches()
+
+    # Segments cut out of an utterance borrow views into the utterance's tables,
+    # so the emissions of those frames are computed once per parameter update.
+    # The views are not cached here; LetterHSMMPython._clear_caches invalidates
+    # the utterance's tables when the letter parameters change.
+    @property
+    def aBl(self):
+        if self._hlmstate is not None:
+            return self._hlmstate.aBl[self._d0:self._d1]
+        if self._aBl is None:
+            self._aBl = letter_log_likelihoods(self.data, self.obs_distns)
+        return self._aBl
+
+    @property
+    def aDl(self):
+        if self._hlmstate is not None:
+            return self._hlmstate.alDl[:self.T]
+        return super(LetterHSMMStatesPython, self).aDl
+
     def likelihood_block_word(self, word):
         from pyhlm.internals.hlm_states import hlm_internal_hsmm_messages_forwards_log
         T = self.T
@@ -30,6 +62,36 @@ class LetterHSMMStatesPython(HSMMStatesPython):
         if self._hlmstate is not None:
             self._hlmstate.letter_stateseq[self._d0:self._d1] = self.stateseq
 
+    # Batched resampling of all word segments of one utterance, the same distribution as
+    # resampling each segment state on its own (right-censored last letter), except that
+    # the letter boundary mask of the utterance is respected.
+    @classmethod
+    def resample_segments(cls, letter_states):
+        hlmstate = letter_states[0]._hlmstate
+        segs = np.array([s._d0 for s in letter_states] + [letter_states[-1]._d1], dtype=np.int32)
+        trunc = letter_states[0].trunc if letter_states[0].trunc is not None else hlmstate.T
+        model = letter_states[0].model
+        stateseq, normalizers = cls.sample_segments(
+            model, hlmstate.aBl, hlmstate.alDl, letter_duration_survival(model.dur_distns, hlmstate.T),
+            segs, trunc, hlmstate.letter_ends)
+        cls.set_segments(hlmstate, letter_states, stateseq, normalizers)
+
+    @staticmethod
+    def set_segments(hlmstate, letter_states, stateseq, normalizers):
+        hlmstate.letter_stateseq[:] = stateseq
+        for letter_state, normalizer in zip(letter_states, normalizers):
+            letter_state.stateseq = stateseq[letter_state._d0:letter_state._d1]
+            letter_state._normalizer = normalizer
+
+    @staticmethod
+    def sample_segments(model, aBl, alDl, alDsl, segs, trunc, letter_ends=None):
+        T, P = aBl.shape
+        return letter_hsmm_resample_segments_log(
+            aBl, alDl, alDsl, np.log(model.trans_distn.trans_matrix), np.log(model.init_state_distn.pi_0),
+            segs, trunc,
+            np.empty((T, P), dtype=np.float64), np.empty((T, P), dtype=np.float64),
+            np.full(T, -1, dtype=np.int32), letter_ends)
+
 
 class LetterHSMMStatesEigen(HSMMStatesEigen, LetterHSMMStatesPython):
 
@@ -58,3 +120,59 @@ class LetterHSMMStatesEigen(HSMMStatesEigen, LetterHSMMStatesPython):
 
     def likelihood_block_word_python(self, word):
         return super(LetterHSMMStatesEigen, self).likelihood_block_word(word)
+
+    @staticmethod
+    def sample_segments(model, aBl, alDl, alDsl, segs, trunc, letter_ends=None):
+        from pyhlm.internals.internal_hsmm_messages_interface import resample_segments_log
+        T, P = aBl.shape
+        return resample_segments_log(
+            aBl, alDl, alDsl, np.log(model.trans_distn.trans_matrix), np.log(model.init_state_distn.pi_0),
+            segs, trunc, np.random.random(2 * T),
+            np.empty((T, P), dtype=np.float64), np.empty((T, P), dtype=np.float64),
+            np.empty(len(segs) - 1, dtype=np.float64), np.full(T, -1, dtype=np.int32), letter_ends)
+
+    @staticmethod
+    def sample_segments_python(model, aBl, alDl, alDsl, segs, trunc, letter_ends=None):
+        return LetterHSMMStatesPython.sample_segments(model, aBl, alDl, alDsl, segs, trunc, letter_ends)
+
+def letter_duration_survival(dur_distns, T):
+    # alDsl[d, p] = log P(D > d+1), the table pyhsmm censors the last letter with.
+    alDsl = np.empty((T, len(dur_distns)))
+    possible_durations = np.arange(1, T + 1, dtype=np.float64)
+    for idx, dur_distn in enumerate(dur_distns):
+        alDsl[:, idx] = dur_distn.log_sf(possible_durations)
+    return alDsl
+
+def letter_hsmm_resample_segments_log(aBl, alDl, alDsl, log_trans_matrix, log_pi_0, segs, trunc, betal, betastarl, stateseq, letter_ends=None):
+    normalizers = np.empty(len(segs) - 1, dtype=np.float64)
+    for s, (s0, s1) in enumerate(zip(segs[:-1], segs[1:])):
+        betal[s0:s1] = -np.inf
+        betal[s1-1] = 0.0
+        for t in range(s1-1, s0-1, -1):
+            tsize = min(trunc, s1-t)
+            cumsum_aBl = np.cumsum(aBl[t:t+tsize], axis=0)
+            betastarl[t] = np.logaddexp.reduce(betal[t:t+tsize] + cumsum_aBl + alDl[:tsize], axis=0)
+            if s1-t-1 < trunc:
+                betastarl[t] = np.logaddexp(betastarl[t], cumsum_aBl[-1] + alDsl[s1-t-1])
+            if t > s0:
+                if letter_ends is not None and not letter_ends[t-1]:
+                    betal[t-1] = -np.inf
+                else:
+                    betal[t-1] = np.logaddexp.reduce(betastarl[t] + log_trans_matrix, axis=1)
+        normalizers[s] = np.logaddexp.reduce(betastarl[s0] + log_pi_0)
+
+        t = s0
+        nextstate_logdomain = log_pi_0
+        while t < s1:
+            logdomain = betastarl[t] + nextstate_logdomain
+            state = sample_discrete(np.exp(logdomain - logdomain.max()))
+            tsize = min(trunc, s1-t)
+            durprobs = np.exp(
+                betal[t:t+tsize, state] + np.cumsum(aBl[t:t+tsize, state]) + alDl[:tsize, state] - betastarl[t, state]
+            )
+            # The mass beyond the last duration is the censored one, it ends at s1.
+            dur = min(np.searchsorted(np.cumsum(durprobs), np.random.random()) + 1, tsize)
+            stateseq[t:t+dur] = state
+            nextstate_logdomain = log_trans_matrix[state]
+            t += dur
+    return stateseq, normalizers
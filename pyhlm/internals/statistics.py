@@ -0,0 +1,46 @@
+import numpy as np
+
+from pyhlm.util.general import rle_with_boundaries
+
+# Sufficient statistics of the letters, accumulated per utterance (or per worker) and
+# reduced by summation, so that no frame-level data is concatenated across segments.
+
+def empty_letter_statistics(num_states, D):
+    return (np.zeros(num_states, dtype=np.int64), np.zeros((num_states, D)), np.zeros((num_states, D, D)),
+            np.zeros(num_states, dtype=np.int64), np.zeros(num_states))
+
+def letter_statistics(data, stateseq, segs, num_states):
+    # data, stateseq: frames of an utterance and their letters.
+    # segs: word boundaries (starting with 0), a letter never continues over them.
+    T, D = data.shape
+    # Frames with a NaN (missing observations) are left out of the Gaussian statistics,
+    # but they still count in the letter durations.
+    observed = ~np.isnan(data).any(1)
+    n = np.bincount(stateseq[observed], minlength=num_states)
+    sumx = np.zeros((num_states, D))
+    sumxxT = np.zeros((num_states, D, D))
+    for state in np.flatnonzero(n):
+        x = data[observed & (stateseq == state)]
+        sumx[state] = x.sum(0)
+        sumxxT[state] = x.T.dot(x)
+
+    labels, durations = rle_with_boundaries(stateseq, segs[:-1])
+    dur_n = np.bincount(labels, minlength=num_states)
+    dur_tot = np.bincount(labels, weights=durations, minlength=num_states)
+    return n, sumx, sumxxT, dur_n, dur_tot
+
+def reduce_letter_statistics(statistics_list, num_states, D):
+    out = empty_letter_statistics(num_states, D)
+    for statistics in statistics_list:
+        for acc, stats in zip(out, statistics):
+            acc += stats
+    return out
+
+def gaussian_natural_statistics(n, sumx, sumxxT):
+    # Same layout as pybasicbayes.distributions.Gaussian._get_statistics.
+    D = sumx.shape[0]
+    out = np.zeros((D+2, D+2))
+    out[:D,:D] = sumxxT
+    out[-2,:D] = out[:D,-2] = sumx
+    out[-2,-2] = out[-1,-1] = n
+    return out
@@ -0,0 +1,79 @@
+import weakref
+from collections import OrderedDict
+
+# Memory budget of the derived tables (aBl, aDl, alDl and the lattice tables) of the
+# utterances of a model. Every utterance reports its tables when it computes one and
+# when it reads a cached one; when the tables of all utterances exceed max_bytes, those
+# of the least recently used utterances are dropped (clear_caches) and recomputed on
+# demand the next time they are used. Together with frames memory-mapped from a corpus file (pyhlm.corpus) or a
+# checkpoint (mmap_data=True), this bounds the memory of a chain independently of the
+# size of the corpus. The utterance which just computed a table is never evicted, so a
+# single utterance may exceed the budget.
+# Utterances are held by weak references, the cache does not keep them alive, and the
+# entry of an utterance which is garbage collected (e.g. a temporary state of segment())
+# is dropped with it.
+
+class TableCache(object):
+
+    def __init__(self, max_bytes):
+        if max_bytes <= 0:
+            raise ValueError("max_bytes must be > 0, got {}".format(max_bytes))
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def touch(self, state):
+        # Called by a state after computing a table: accounts its tables as the most
+        # recently used and evicts the least recently used states over the budget.
+        key = id(state)
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+        nbytes = state.table_nbytes()
+        self._entries[key] = (weakref.ref(state, lambda ref: self._drop(key, ref)), nbytes)
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            _, (ref, evicted_nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            evicted = ref()
+            if evicted is not None:
+                evicted.clear_caches()
+                self.evictions += 1
+
+    def hit(self, state):
+        # Called by a state when it reads a cached table: its tables become the most recently used.
+        key = id(state)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+
+    def _drop(self, key, ref):
+        # The state of ref was garbage collected, its tables went with it.
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is ref:
+            del self._entries[key]
+            self.nbytes -= entry[1]
+
+    def discard(self, state):
+        # The tables of state were dropped by the state itself.
+        entry = self._entries.pop(id(state), None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        for ref, _ in list(self._entries.values()):
+            state = ref()
+            if state is not None:
+                state.clear_caches()
+        self._entries.clear()
+        self.nbytes = 0
+
+    # Pickled with the model (checkpoints, joblib workers) without its entries.
+    def __getstate__(self):
+        return {"max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_bytes"])
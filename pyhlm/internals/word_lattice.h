@@ -0,0 +1,90 @@
+#ifndef WORD_LATTICE_H
+#define WORD_LATTICE_H
+
+#include <Eigen/Core>
+#include <algorithm> // min
+#include <math.h>
+
+namespace word_lattice
+{
+    using namespace std;
+    using namespace Eigen;
+
+    template <bool MAX, typename Type, typename BArray, typename DArray, typename AArray, typename IVec, typename Vec>
+    void forwards(
+      int T, int L, int t0,
+      BArray &eaBl, DArray &ealDl, int word[], int letter_ends[],
+      AArray &ealphal,
+      IVec &cand, Vec &sumsofar, Vec &result)
+    {
+      // Internal forward messages of a word over the frames t0 <= t < t0+T of eaBl.
+      // ealphal(t, j): the first j+1 letters cover the frames t0..t0+t and letter j ends at t0+t
+      // (log-sum-exp over the letter segmentations, or max over them if MAX).
+      // ealphal has to be -inf on entry.
+      // Letters with -inf in eaBl (outside the emission beam) cut every segment over the frame,
+      // and letter_ends[t0+t] == 0 forbids a letter to end at t0+t. Only the starts where
+      // the previous letter has a finite message (cand) are visited.
+      // cand, sumsofar, result: work space of at least T-L+1 elements.
+      Type neg_inf = -1.0*numeric_limits<Type>::infinity();
+      int W = T-L+1;
+      int nc, klo, khi;
+      Type a, cmax;
+
+      if(W <= 0){
+        return;
+      }
+
+      Type ctmp = 0.0;
+      for(int t=0; t<W; t++){
+        ctmp += eaBl(t0+t, word[0]);
+        if(ctmp == neg_inf){
+          break;
+        }
+        if(letter_ends[t0+t]){
+          ealphal(t, 0) = ctmp + ealDl(t, word[0]);
+        }
+      }
+
+      for(int j=0; j<L-1; j++){
+        nc = 0;
+        for(int tau=0; tau<W; tau++){
+          if(ealphal(j+tau, j) > neg_inf){
+            cand(nc++) = tau;
+          }
+        }
+        // letter j+1 covers the frames j+1+cand(k) .. j+1+t for klo <= k < khi.
+        klo = 0;
+        khi = 0;
+        for(int t=0; t<W; t++){
+          while(khi < nc && cand(khi) <= t){
+            sumsofar(khi++) = 0.0;
+          }
+          a = eaBl(t0+t+j+1, word[j+1]);
+          if(a == neg_inf){
+            klo = khi;
+            continue;
+          }
+          for(int k=klo; k<khi; k++){
+            sumsofar(k) += a;
+          }
+          if(klo == khi || !letter_ends[t0+t+j+1]){
+            continue;
+          }
+          for(int k=klo; k<khi; k++){
+            result(k) = sumsofar(k) + ealDl(t-cand(k), word[j+1]) + ealphal(j+cand(k), j);
+          }
+          cmax = result.segment(klo, khi-klo).maxCoeff();
+          if(MAX){
+            ealphal(t+j+1, j+1) = cmax;
+          } else {
+            ealphal(t+j+1, j+1) = log((result.segment(klo, khi-klo) - cmax).exp().sum()) + cmax;
+            if(ealphal(t+j+1, j+1) != ealphal(t+j+1, j+1)){
+              ealphal(t+j+1, j+1) = neg_inf;
+            }
+          }
+        }
+      }
+    }
+}
+
+#endif
@@ -6,8 +6,78 @@ from pyhsmm.internals.transitions import WeakLimitHDPHMMTransitions
 from pyhsmm.internals.initial_state import HMMInitialState
 
 from pyhlm.internals import hlm_states
+from pyhlm.internals.emissions import letter_log_likelihoods
+
+class SegmentationMixin(object):
+    # Segmentation of new data with the current parameters, shared by the trained and
+    # the exported (pyhlm.inference) models.
+
+    def segment(self, datas, mode="sample", num_procs=0, word_boundaries=None, letter_boundaries=None, **kwargs):
+        # Segments datas with the current parameters without adding them to the model.
+        # mode is "sample" (a draw from the posterior) or "viterbi" (the best segmentation).
+        # word_boundaries, letter_boundaries: optional lists with a boundary mask (or None)
+        # per utterance, see WeakLimitHDPHLMStatesPython.
+        if mode not in ("sample", "viterbi"):
+            raise ValueError("mode must be 'sample' or 'viterbi', got {}".format(mode))
+        word_boundaries = [None] * len(datas) if word_boundaries is None else word_boundaries
+        letter_boundaries = [None] * len(datas) if letter_boundaries is None else letter_boundaries
+        kwargs_list = [dict(kwargs, word_boundaries=wb, letter_boundaries=lb)
+                       for wb, lb in zip(word_boundaries, letter_boundaries)]
+        if num_procs == 0:
+            return [self._segment(data, mode, **kw) for data, kw in zip(datas, kwargs_list)]
+        return self._joblib_segment(datas, mode, num_procs, kwargs_list)
+
+    def segment_stream(self, frames, lag, trunc, mode="viterbi", step=None):
+        # Fixed-lag online segmentation, see pyhlm.streaming.FixedLagSegmenter.
+        from pyhlm.streaming import segment_stream
+        return segment_stream(self, frames, lag, trunc, mode=mode, step=step)
+
+    def _segment(self, data, mode, **kwargs):
+        return self._segment_state(self._states_class(self, data, generate=False, **kwargs), mode)
+
+    def _segment_batch(self, datas, mode, kwargs_list):
+        # Segments datas like _segment, but the letter emissions of all frames are computed in
+        # one pass and the duration tables once for the longest input. The tables only depend
+        # on the frames and the parameters, so every input gets the same tables as on its own.
+        states = [self._states_class(self, data, generate=False, **kw) for data, kw in zip(datas, kwargs_list)]
+        if len(states) == 0:
+            return []
+        longest = max(states, key=lambda state: state.T)
+        aDl, alDl = longest.aDl, longest.alDl
+        aBl = letter_log_likelihoods(np.concatenate([state.data for state in states]), self.letter_obs_distns)
+        ends = np.cumsum([state.T for state in states])
+        for state, start, end in zip(states, np.concatenate(([0], ends[:-1])), ends):
+            state.share_tables(aBl[start:end], aDl[:state.T], alDl[:state.T])
+        return [self._segment_state(state, mode) for state in states]
+
+    def _segment_state(self, state, mode):
+        if mode == "viterbi":
+            return state.segmentation(normalizer=state.Viterbi())
+        state.resample()
+        state.sample_letter_stateseq()
+        return state.segmentation()
+
+    def _joblib_segment(self, datas, mode, num_procs, kwargs_list):
+        from joblib import Parallel, delayed
+        from . import parallel
+
+        if len(datas) == 0:
+            return []
+
+        num_procs = min(num_procs, len(datas))
+        joblib_args = list_split([(data, mode, kw) for data, kw in zip(datas, kwargs_list)], num_procs)
+
+        parallel.model = self
+        parallel.args = joblib_args
 
-class WeakLimitHDPHLMPython(object):
+        segmentations = Parallel(n_jobs=num_procs,backend='multiprocessing')\
+                (delayed(parallel._get_segmentations)(idx)
+                        for idx in range(len(joblib_args)))
+
+        # list_split cuts the inputs into consecutive groups.
+        return [seg for grp in segmentations for seg in grp]
+
+class WeakLimitHDPHLMPython(SegmentationMixin):
     _states_class = hlm_states.WeakLimitHDPHLMStatesPython
 
     def __init__(self, num_states, alpha, gamma, init_state_concentration, letter_hsmm, dur_distns, length_distn):
@@ -19,6 +89,14 @@ class WeakLimitHDPHLMPython(object):
         self._init_state_distn = HMMInitialState(self, init_state_concentration=init_state_concentration)
         self._trans_distn = WeakLimitHDPHMMTransitions(num_states=num_states, alpha=alpha, gamma=gamma)
         self.states_list = []
+        # Policy of pyhlm.sweep choosing the utterances resampled per iteration, None for all.
+        self.sweep = None
+        # Incremented whenever resample_model updates the parameters, cached normalizers
+        # of the utterances are tagged with it.
+        self.params_version = 0
+        # pyhlm.internals.table_cache.TableCache bounding the memory of the likelihood
+        # tables of the utterances, None keeps the tables of all utterances.
+        self.table_cache = None
 
         self.word_list = [None] * self.num_states
         for i in range(self.num_states):
@@ -79,8 +157,43 @@ class WeakLimitHDPHLMPython(object):
         length_hypparams = self.length_distn.hypparams
         return {"letter_hsmm": letter_hsmm_hypparams, "word_length": length_hypparams, "bigram": bigram_hypparams}
 
-    def log_likelihood(self):
-        return sum(word_state.log_likelihood() for word_state in self.states_list)
+    def log_likelihood(self, mode="stale", num_procs=0):
+        # mode "stale" sums the normalizers cached by the last resampling of each utterance,
+        # which is free but may be computed under older parameters (e.g. with a sweep policy).
+        # mode "current" recomputes the stale ones under the current parameters.
+        # Only the utterances which need a backward pass are scored, with num_procs workers.
+        if mode not in ("stale", "current"):
+            raise ValueError("mode must be 'stale' or 'current', got {}".format(mode))
+        if mode == "stale":
+            outdated = [state for state in self.states_list if state._normalizer is None]
+        else:
+            outdated = [state for state in self.states_list if state._normalizer is None or state.normalizer_is_stale]
+        self._update_normalizers(outdated, num_procs)
+        return sum(word_state._normalizer for word_state in self.states_list)
+
+    def _update_normalizers(self, states_list, num_procs=0):
+        if num_procs == 0 or len(states_list) == 0:
+            for state in states_list:
+                state.log_likelihood(current=True)
+            return
+
+        from joblib import Parallel, delayed
+        from . import parallel
+
+        num_procs = min(num_procs, len(states_list))
+        joblib_args = list_split([self._get_joblib_pair(s) for s in states_list], num_procs)
+
+        parallel.model = self
+        parallel.args = joblib_args
+
+        normalizers = Parallel(n_jobs=num_procs,backend='multiprocessing')\
+                (delayed(parallel._get_normalizers)(idx)
+                        for idx in range(len(joblib_args)))
+
+        for s, normalizer in zip(
+                [s for grp in list_split(states_list,num_procs) for s in grp],
+                [normalizer for grp in normalizers for normalizer in grp]):
+            s.set_normalizer(normalizer)
 
     def word_counts(self):
         r = np.zeros(self.num_states, dtype=np.int32)
@@ -96,29 +209,63 @@ class WeakLimitHDPHLMPython(object):
     def add_data(self, data, **kwargs):
         self.states_list.append(self._states_class(self, data, **kwargs))
 
+    def export(self, path, keep_unused=False):
+        # Parameters for segmentation only, loaded by pyhlm.inference.InferenceModel.
+        from pyhlm.inference import export_model
+        export_model(self, path, keep_unused=keep_unused)
+
+    def save_checkpoint(self, path, info=None):
+        # Binary checkpoint of the chain, see pyhlm.checkpoint.
+        from pyhlm.checkpoint import save_checkpoint
+        save_checkpoint(self, path, info=info)
+
+    @classmethod
+    def load_checkpoint(cls, path, mmap_data=False):
+        from pyhlm.checkpoint import load_checkpoint
+        model = load_checkpoint(path, mmap_data=mmap_data)
+        if not isinstance(model, cls):
+            raise TypeError("checkpoint holds a {}, not a {}".format(type(model).__name__, cls.__name__))
+        return model
+
     def add_word_data(self, data, **kwargs):
         self.letter_hsmm.add_data(data, **kwargs)
 
     def resample_model(self, num_procs=0):
         self.letter_hsmm.states_list = []
         [state.add_word_datas(generate=False) for state in self.states_list]
-        self.letter_hsmm.resample_states(num_procs=num_procs)
-        [letter_state.reflect_letter_stateseq() for letter_state in self.letter_hsmm.states_list]
+        self.letter_hsmm.resample_states_by_segments(num_procs=num_procs)
         self.resample_words(num_procs=num_procs)
-        self.letter_hsmm.resample_parameters_by_sampled_words(self.word_list)
+        self.letter_hsmm.resample_parameters_by_sampled_words(self.word_list, num_procs=num_procs)
         self.resample_length_distn()
         self.resample_dur_distns()
         self.resample_trans_distn()
         self.resample_init_state_distn()
+        self.params_version += 1
         self.resample_states(num_procs=num_procs)
         self._clear_caches()
 
-    def resample_states(self, num_procs=0):
+    def resample_states(self, num_procs=0, sweep=None):
+        # sweep overrides self.sweep for this call. Utterances without a normalizer (never
+        # resampled) are always visited, the others keep their segmentations when not selected.
+        # Only the word-level backward passes get cheaper: the letter HSMM and the parameter
+        # updates of resample_model still go over the segments of all utterances.
+        sweep = self.sweep if sweep is None else sweep
+        if sweep is None:
+            states_list = self.states_list
+        else:
+            never_scored = np.array([idx for idx, state in enumerate(self.states_list) if state._normalizer is None], dtype=np.int64)
+            visited = np.union1d(np.asarray(sweep.select(self.states_list), dtype=np.int64), never_scored)
+            states_list = [self.states_list[idx] for idx in visited]
+            old_normalizers = [state._normalizer for state in states_list]
+
         if num_procs == 0:
-            for state in self.states_list:
+            for state in states_list:
                 state.resample()
         else:
-            self._joblib_resample_states(self.states_list, num_procs)
+            self._joblib_resample_states(states_list, num_procs)
+
+        if sweep is not None:
+            sweep.update(self.states_list, visited, old_normalizers)
 
     def _joblib_resample_states(self, states_list, num_procs):
         from joblib import Parallel, delayed
@@ -127,6 +274,7 @@ class WeakLimitHDPHLMPython(object):
         # warn('joblib is segfaulting on OS X only, not sure why')
 
         if len(states_list) > 0:
+            num_procs = min(num_procs, len(states_list))
             joblib_args = list_split(
                     [self._get_joblib_pair(s) for s in states_list],
                     num_procs)
@@ -141,10 +289,12 @@ class WeakLimitHDPHLMPython(object):
             for s, (stateseq, stateseq_norep, durations_censored, log_likelihood) in zip(
                     [s for grp in list_split(states_list,num_procs) for s in grp],
                     [seq for grp in raw_stateseqs for seq in grp]):
-                s.stateseq, s._stateseq_norep, s._durations_censored, s._normalizer = stateseq, stateseq_norep, durations_censored, log_likelihood
+                s.stateseq, s._stateseq_norep, s._durations_censored = stateseq, stateseq_norep, durations_censored
+                s.set_normalizer(log_likelihood)
 
+    # The per-utterance pi_0 travels with the data, the workers rebuild the states from them.
     def _get_joblib_pair(self,states_obj):
-        return (states_obj.data, states_obj._kwargs)
+        return (states_obj.data, states_obj._kwargs, states_obj._pi_0)
 
     def resample_words(self, num_procs=0):
         if num_procs == 0:
@@ -1,3 +1,9 @@
+import numpy as np
+
+from pyhlm.internals.emissions import letter_log_likelihoods
+from pyhlm.internals.internal_hsmm_states import letter_duration_survival
+from pyhlm.internals.statistics import letter_statistics, reduce_letter_statistics
+
 # NOTE: pass arguments through global variables instead of arguments to exploit
 # the fact that they're read-only and multiprocessing/joblib uses fork
 
@@ -10,11 +16,49 @@ def _get_sampled_stateseq_norep_and_durations_censored(idx):
     if len(grp) == 0:
         return []
 
-    datas, kwargss = zip(*grp)
-
     states_list = []
-    for data, kwargs in zip(datas,kwargss):
-        model.add_data(data, initialize_from_prior=False, **kwargs)
-        states_list.append(model.states_list.pop())
+    for data, kwargs, pi_0 in grp:
+        state = model._states_class(model, data, generate=False, **kwargs)
+        state.pi_0 = pi_0
+        state.resample()
+        states_list.append(state)
 
     return [(s.stateseq, s.stateseq_norep, s.durations_censored, s.log_likelihood()) for s in states_list]
+
+def _get_normalizers(idx):
+    grp = args[idx]
+    normalizers = []
+    for data, kwargs, pi_0 in grp:
+        state = model._states_class(model, data, generate=False, **kwargs)
+        state.pi_0 = pi_0
+        normalizers.append(state.log_likelihood())
+    return normalizers
+
+def _get_sampled_letter_stateseqs(idx):
+    grp = args[idx]
+
+    if len(grp) == 0:
+        return []
+
+    results = []
+    for data, segs, trunc, letter_ends in grp:
+        aBl = letter_log_likelihoods(data, model.obs_distns)
+        alDl = np.empty((data.shape[0], model.num_states))
+        possible_durations = np.arange(1, data.shape[0] + 1, dtype=np.float64)
+        for state, dur_distn in enumerate(model.dur_distns):
+            alDl[:,state] = dur_distn.log_pmf(possible_durations)
+        alDsl = letter_duration_survival(model.dur_distns, data.shape[0])
+        results.append(model._states_class.sample_segments(model, aBl, alDl, alDsl, segs, trunc, letter_ends))
+
+    return results
+
+def _get_letter_statistics(idx):
+    grp = args[idx]
+    D = grp[0][0].shape[1] if len(grp) > 0 else len(model.obs_distns[0].mu_0)
+    return reduce_letter_statistics(
+        [letter_statistics(data, stateseq, segs, model.num_states) for data, stateseq, segs in grp],
+        model.num_states, D)
+
+def _get_segmentations(idx):
+    grp = args[idx]
+    return [model._segment(data, mode, **kwargs) for data, mode, kwargs in grp]
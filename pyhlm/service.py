@@ -0,0 +1,237 @@
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# Long-lived segmentation service. A model exported with model.export is loaded once.
+# Requests arriving within max_wait of each other are collected into micro-batches of at
+# most max_batch; the requests of a batch with the same mode and trunc are segmented by one
+# pool task, which computes the letter emissions of all their frames in one pass and the
+# duration tables once. The native kernels release the GIL, so the pool threads segment
+# in parallel.
+#
+# Protocol: one JSON object per line,
+#   {"id": ..., "data": [[x_11, ..., x_1D], ...], "mode": "viterbi" | "sample",
+#    "trunc": int, "word_boundaries": [...], "letter_boundaries": [...]}
+# where only "data" is required. Each request gets one response line,
+#   {"id": ..., "words": [...], "durations": [...], "letters": [...],
+#    "letter_durations": [...], "normalizer": float, "latency_ms": float}
+# or {"id": ..., "error": "..."}. Responses may come out of order, use "id".
+# Word and letter ids are those of the trained model.
+
+class SegmentationService(object):
+
+    def __init__(self, model, num_threads=4, max_batch=16, max_wait=0.002, trunc=None):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.trunc = trunc
+        self._pool = ThreadPoolExecutor(max_workers=num_threads)
+        self._queue = queue.Queue()
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, request):
+        # Returns a Future of the response dict.
+        future = Future()
+        self._queue.put((time.time(), request, future))
+        return future
+
+    def handle(self, request):
+        return self.submit(request).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._dispatcher.join()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _dispatch(self):
+        # Collects the requests which arrive within max_wait of the first one, at most max_batch.
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._submit_batch(batch)
+                    return
+                batch.append(item)
+            self._submit_batch(batch)
+
+    def _submit_batch(self, batch):
+        # Requests with the same mode and trunc share one pool task, the groups with the
+        # most frames go first.
+        groups = {}
+        for item in batch:
+            groups.setdefault(self._batch_key(item[1]), []).append(item)
+        for group in sorted(groups.values(), key=lambda group: -sum(_request_size(item[1]) for item in group)):
+            self._pool.submit(self._run_batch, group)
+
+    def _batch_key(self, request):
+        try:
+            key = (request.get("mode", "viterbi"), request.get("trunc", self.trunc))
+            hash(key)
+            return key
+        except (AttributeError, TypeError):
+            return None
+
+    def _run_batch(self, group):
+        responses = [None] * len(group)
+        valid, prepared = [], []
+        for idx, (received, request, future) in enumerate(group):
+            try:
+                prepared.append(self._prepare(request))
+                valid.append(idx)
+            except Exception as e:
+                responses[idx] = _error(e)
+        if len(valid) > 0:
+            datas, modes, kwargs_list = zip(*prepared)
+            try:
+                for idx, seg in zip(valid, self.model._segment_batch(datas, modes[0], kwargs_list)):
+                    responses[idx] = self._response(seg)
+            except Exception:
+                # One bad request fails the whole batch, the requests are answered one by one.
+                for idx, data, mode, kw in zip(valid, datas, modes, kwargs_list):
+                    try:
+                        responses[idx] = self._response(self.model._segment(data, mode, **kw))
+                    except Exception as e:
+                        responses[idx] = _error(e)
+        for (received, request, future), response in zip(group, responses):
+            if isinstance(request, dict) and "id" in request:
+                response["id"] = request["id"]
+            response["latency_ms"] = 1000 * (time.time() - received)
+            future.set_result(response)
+
+    def segment(self, request):
+        data, mode, kwargs = self._prepare(request)
+        return self._response(self.model._segment(data, mode, **kwargs))
+
+    def _prepare(self, request):
+        data = np.asarray(request["data"], dtype=np.float64)
+        if data.ndim != 2 or len(data) == 0:
+            raise ValueError("data must be a non-empty list of frames")
+        mode = request.get("mode", "viterbi")
+        if mode not in ("sample", "viterbi"):
+            raise ValueError("mode must be 'sample' or 'viterbi', got {}".format(mode))
+        kwargs = dict(trunc=request.get("trunc", self.trunc),
+                      word_boundaries=request.get("word_boundaries"), letter_boundaries=request.get("letter_boundaries"))
+        return data, mode, kwargs
+
+    def _response(self, seg):
+        words, letters = seg.words, seg.letters
+        if hasattr(self.model, "original_words"):
+            words, letters = self.model.original_words(words), self.model.original_letters(letters)
+        return {
+            "words": [int(w) for w in words], "durations": [int(d) for d in seg.durations],
+            "letters": [int(l) for l in letters], "letter_durations": [int(d) for d in seg.letter_durations],
+            "normalizer": float(seg.normalizer),
+        }
+
+def _error(e):
+    return {"error": "{}: {}".format(type(e).__name__, e)}
+
+def _request_size(request):
+    try:
+        return len(request["data"])
+    except (TypeError, KeyError):
+        return 0
+
+def serve_lines(service, lines, write):
+    # Answers every JSON line of lines, write(response_line) is called from pool threads.
+    lock = threading.Lock()
+    futures = []
+
+    def reply(response):
+        line = json.dumps(response)
+        with lock:
+            write(line + "\n")
+
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            reply({"error": "invalid JSON: {}".format(e)})
+            continue
+        future = service.submit(request)
+        future.add_done_callback(lambda future: reply(future.result()))
+        futures.append(future)
+    for future in futures:
+        future.result()
+
+def serve_stdio(service, stdin=None, stdout=None):
+    stdin = sys.stdin if stdin is None else stdin
+    stdout = sys.stdout if stdout is None else stdout
+
+    def write(line):
+        stdout.write(line)
+        stdout.flush()
+
+    serve_lines(service, stdin, write)
+
+def serve_unix(service, socket_path):
+    # Every connection is a stream of JSON lines, connections are served concurrently.
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            def write(line):
+                self.wfile.write(line.encode())
+                self.wfile.flush()
+            serve_lines(service, (line.decode() for line in self.rfile), write)
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+    server.daemon_threads = True
+    return server
+
+def main(argv=None):
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+    from pyhlm.inference import InferenceModel, InferenceModelPython
+
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter, description="pyhlm segmentation service")
+    parser.add_argument("model", help="directory written by model.export")
+    parser.add_argument("--socket", default=None, help="Unix domain socket to listen on, stdin/stdout if not given")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="worker threads")
+    parser.add_argument("--max_batch", type=int, default=16, help="requests per micro-batch")
+    parser.add_argument("--max_wait_ms", type=float, default=2.0, help="time to fill a micro-batch")
+    parser.add_argument("--trunc", type=int, default=None, help="default maximum word duration")
+    parser.add_argument("--python", action="store_true", help="use the numpy reference kernels")
+    args = parser.parse_args(argv)
+
+    model = (InferenceModelPython if args.python else InferenceModel).load(args.model)
+    with SegmentationService(model, num_threads=args.threads, max_batch=args.max_batch,
+                             max_wait=args.max_wait_ms / 1000, trunc=args.trunc) as service:
+        if args.socket is None:
+            serve_stdio(service)
+        else:
+            server = serve_unix(service, args.socket)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+                os.unlink(args.socket)
+
+if __name__ == "__main__":
+    main()
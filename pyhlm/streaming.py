@@ -0,0 +1,164 @@
+from collections import namedtuple
+
+import numpy as np
+
+from pyhsmm.util.general import rle
+from pyhsmm.util.stats import sample_discrete_from_log
+from pyhlm.internals.hlm_states import hlm_internal_hsmm_backtrace
+
+# A finalized word of a stream: start is the absolute frame index of the word,
+# letters and letter_durations are the letter segments inside the word.
+StreamSegment = namedtuple("StreamSegment", ["word", "start", "duration", "letters", "letter_durations"])
+
+class FixedLagSegmenter(object):
+    # Online segmentation of a frame stream with a fixed lag.
+    # Every step frames the window of the frames after the last finalized word is decoded
+    # from its forward messages, and the words which end more than lag frames before the
+    # end of the window are finalized. The next window starts from trans_matrix[last finalized word].
+    def __init__(self, model, lag, trunc, mode="viterbi", step=None):
+        if mode not in ("sample", "viterbi"):
+            raise ValueError("mode must be 'sample' or 'viterbi', got {}".format(mode))
+        if lag < 0 or trunc < 1:
+            raise ValueError("lag must be >= 0 and trunc must be >= 1")
+        self.model = model
+        self.lag = lag
+        self.trunc = trunc
+        self.mode = mode
+        self.step = step if step is not None else max(lag // 2, 1)
+        self.reset()
+
+    def reset(self):
+        self._buffer = None
+        self._offset = 0
+        self._pending = 0
+        self._pi_0 = None
+        self._clear_messages()
+
+    def _clear_messages(self):
+        # _likes[s]: log likelihoods of the words starting at the absolute frame s, one row
+        # per duration. They only depend on the frames, so they outlive the window.
+        # _alpha, _alphastar: forward messages of the window, extended as frames arrive.
+        self._likes = {}
+        self._alpha = None
+        self._alphastar = None
+        self._params_version = getattr(self.model, "params_version", None)
+
+    @property
+    def offset(self):
+        # Absolute frame index of the first frame which is not finalized yet.
+        return self._offset
+
+    @property
+    def buffered(self):
+        return 0 if self._buffer is None else len(self._buffer)
+
+    def push(self, frames):
+        # frames: one frame (D,) or a chunk of frames (N, D).
+        # Returns the list of the words which are finalized by these frames.
+        frames = np.atleast_2d(np.asarray(frames, dtype=np.float64))
+        if len(frames) == 0:
+            return []
+        self._buffer = frames.copy() if self._buffer is None else np.concatenate((self._buffer, frames))
+        self._pending += len(frames)
+        if self._pending < self.step or len(self._buffer) <= self.lag:
+            return []
+        self._pending = 0
+        return self._finalize(len(self._buffer) - self.lag)
+
+    def flush(self):
+        # Finalizes all buffered frames, as if the stream ended here.
+        if self.buffered == 0:
+            return []
+        out = self._finalize(len(self._buffer))
+        self.reset()
+        return out
+
+    def _forwards(self, state):
+        # Extends the forward messages to the whole window. Only the words starting
+        # within trunc frames of the previous end of the window are scored again.
+        if self._params_version != getattr(self.model, "params_version", None):
+            self._clear_messages()
+        T, N, trunc = state.T, self.model.num_states, self.trunc
+        reduce = np.max if self.mode == "viterbi" else np.logaddexp.reduce
+        for t in range(T):
+            likes = self._likes.get(self._offset + t)
+            if likes is None or len(likes) < min(trunc, T - t):
+                if self.mode == "viterbi":
+                    self._likes[self._offset + t] = state.cumulative_likelihoods_max(t, t + trunc)
+                else:
+                    self._likes[self._offset + t] = state.cumulative_likelihoods(t, t + trunc)
+
+        start = 0 if self._alpha is None else len(self._alpha)
+        alpha = np.empty((T, N), dtype=np.float64)
+        alphastar = np.empty((T, N), dtype=np.float64)
+        if start > 0:
+            alpha[:start] = self._alpha
+            alphastar[:start] = self._alphastar
+        aDl = state.aDl
+        for t in range(start, T):
+            if t == 0:
+                alphastar[t] = np.log(state.pi_0)
+            else:
+                alphastar[t] = reduce(alpha[t-1][:, None] + state.log_trans_matrix, axis=0)
+            starts = np.arange(max(t - trunc + 1, 0), t + 1)
+            alpha[t] = reduce(alphastar[starts] + self._word_likes(starts, t) + aDl[t - starts], axis=0)
+        self._alpha, self._alphastar = alpha, alphastar
+        return alpha, alphastar
+
+    def _word_likes(self, starts, t):
+        return np.array([self._likes[self._offset + s][t - s] for s in starts])
+
+    def _decode(self, data):
+        # Backtraces the words of the window from the forward messages, last word first.
+        state = self.model._states_class(self.model, data, trunc=self.trunc, generate=False)
+        if self._pi_0 is not None:
+            state.pi_0 = self._pi_0
+        alpha, alphastar = self._forwards(state)
+        choose = np.argmax if self.mode == "viterbi" else sample_discrete_from_log
+        words = []
+        t, scores = state.T - 1, alpha[-1]
+        while t >= 0:
+            word = choose(scores)
+            starts = np.arange(max(t - self.trunc + 1, 0), t + 1)
+            start = starts[choose(alphastar[starts, word] + self._word_likes(starts, t)[:, word] + state.aDl[t - starts, word])]
+            words.append((word, start, t + 1 - start))
+            t, scores = start - 1, alpha[start - 1] + state.log_trans_matrix[:, word]
+        return state, words[::-1]
+
+    def _letters(self, state, word, start, duration):
+        letters = self.model.word_list[word]
+        if self.mode == "viterbi":
+            alphal = state.internal_maxsum_messages_forwards(start, start + duration, letters)
+        else:
+            alphal = state.internal_messages_forwards(start, start + duration, letters)
+        ldurs = hlm_internal_hsmm_backtrace(
+            state.lattice_aBl[start:start+duration], state.lattice_alDl, state.lattice_word(letters),
+            alphal, viterbi=self.mode == "viterbi")
+        return rle(np.repeat(letters, ldurs))
+
+    def _finalize(self, horizon):
+        state, words = self._decode(self._buffer)
+        num_words = np.searchsorted([start + duration for _, start, duration in words], horizon, side="right")
+        if num_words == 0:
+            return []
+
+        out = [StreamSegment(int(word), self._offset + int(start), int(duration), *self._letters(state, word, start, duration))
+               for word, start, duration in words[:num_words]]
+
+        word, start, duration = words[num_words-1]
+        end = int(start + duration)
+        self._buffer = self._buffer[end:].copy()
+        self._offset += end
+        self._pi_0 = self.model.trans_distn.trans_matrix[word]
+        # The next window is pinned to the finalized words, its forward messages start over.
+        self._likes = {s: likes for s, likes in self._likes.items() if s >= self._offset}
+        self._alpha = self._alphastar = None
+        return out
+
+def segment_stream(model, frames, lag, trunc, mode="viterbi", step=None):
+    # frames: iterable of frames or chunks of frames.
+    # Yields StreamSegment objects in order as soon as they are finalized.
+    segmenter = FixedLagSegmenter(model, lag, trunc, mode=mode, step=step)
+    for chunk in frames:
+        yield from segmenter.push(chunk)
+    yield from segmenter.flush()
@@ -0,0 +1,152 @@
+import os
+
+import numpy as np
+
+from pyhlm.trace import TraceReader
+from pyhlm.evaluation import SegmentationEvaluator
+
+# Summaries of finished chains for the summary scripts of the samples.
+#   trace_scores          letter and word scores of every traced iteration, computed
+#                         from the run-length records in chunks of iterations, in parallel
+#   plot_trace_figures    the per-utterance figures of a trace, rendered in a process pool
+#   load_run_summary      the curves of a run directory, cached in one .npz file
+#   stack_curves          the curves of several runs, cut to the shortest run
+
+def _score_chunk(prefix, names, evaluator, iterations):
+    # Workers open the trace themselves, its memory maps are shared through the page cache.
+    trace = TraceReader(prefix)
+    return [evaluator.evaluate([trace.segmentation(name, iteration)[:4] for name in names])
+            for iteration in iterations]
+
+def trace_scores(prefix, names, letter_labels, word_labels, letter_num, word_num, num_procs=0, chunksize=16):
+    # Returns the iterations of the trace and a dict of arrays over them, keyed as
+    # SegmentationEvaluator.evaluate (letter_ARI, letter_macro_F1, ..., word_micro_F1).
+    names = [str(name) for name in names]
+    iterations = TraceReader(prefix).iterations
+    evaluator = SegmentationEvaluator(letter_labels, word_labels, letter_num, word_num)
+    chunks = [iterations[i:i+chunksize] for i in range(0, len(iterations), chunksize)]
+    if num_procs == 0:
+        results = [_score_chunk(prefix, names, evaluator, chunk) for chunk in chunks]
+    else:
+        from joblib import Parallel, delayed
+        results = Parallel(n_jobs=num_procs)(delayed(_score_chunk)(prefix, names, evaluator, chunk) for chunk in chunks)
+    rows = [row for chunk in results for row in chunk]
+    keys = rows[0].keys() if rows else []
+    return iterations, {key: np.array([row[key] for row in rows]) for key in keys}
+
+def downsample_rows(num_rows, max_rows):
+    # Evenly spaced row indices (first and last included) of at most max_rows rows.
+    if max_rows is None or num_rows <= max_rows:
+        return np.arange(num_rows)
+    return np.unique(np.linspace(0, num_rows - 1, max_rows).round().astype(np.int64))
+
+def _boundary(label):
+    diff = np.diff(label)
+    diff[diff!=0] = 1
+    return np.concatenate((diff, [0]))
+
+def _plot_discreate_sequence(true_data, title, sample_data, cmap=None, cmap2=None, label_cmap=None):
+    import matplotlib.pyplot as plt
+    ax = plt.subplot2grid((10, 1), (1, 0))
+    plt.sca(ax)
+    if label_cmap is None:
+        label_cmap = cmap
+    ax.matshow([true_data], aspect='auto', cmap=label_cmap)
+    plt.ylabel('Truth Label')
+    #label matrix
+    ax = plt.subplot2grid((10, 1), (2, 0), rowspan = 8)
+    plt.suptitle(title)
+    plt.sca(ax)
+    if cmap2 is not None:
+        cmap = cmap2
+    ax.matshow(sample_data, aspect='auto', cmap=cmap)
+    #write x&y label
+    plt.xlabel('Frame')
+    plt.ylabel('Iteration')
+    plt.xticks(())
+
+def _plot_utterance(prefix, name, letter_label, word_label, letter_num, word_num, out_dir, max_rows):
+    import matplotlib.pyplot as plt
+    import matplotlib.cm as cm
+    from matplotlib.colors import ListedColormap
+
+    lcolors = ListedColormap([cm.tab20(float(i)/letter_num) for i in range(letter_num)])
+    wcolors = ListedColormap([cm.tab20(float(i)/word_num) for i in range(word_num)])
+    trace = TraceReader(prefix)
+    rows = trace.iterations[downsample_rows(trace.num_iterations, max_rows)]
+    segs = [trace.segmentation(name, iteration) for iteration in rows]
+    letters = np.array([np.repeat(seg.letters, seg.letter_durations) for seg in segs])
+    words = np.array([np.repeat(seg.words, seg.durations) for seg in segs])
+    boundaries = np.zeros(words.shape)
+    for row, seg in zip(boundaries, segs):
+        row[np.cumsum(seg.durations) - 1] = 1.0
+
+    for suffix, label, sample, kwargs in (
+            ("_l", letter_label, letters, dict(cmap=lcolors)),
+            ("_s", word_label, words, dict(cmap=wcolors)),
+            ("_d", word_label, boundaries, dict(cmap2=cm.binary))):
+        plt.clf()
+        _plot_discreate_sequence(_boundary(label), name + suffix, sample, label_cmap=cm.binary, **kwargs)
+        plt.savefig(os.path.join(out_dir, name + suffix + ".png"))
+    plt.close("all")
+
+def plot_trace_figures(prefix, names, letter_labels, word_labels, letter_num, word_num, out_dir="figures",
+                       num_procs=0, max_rows=500):
+    # <name>_l.png, <name>_s.png and <name>_d.png of every utterance, with at most
+    # max_rows iterations per figure (None for all).
+    args = [(prefix, str(name), letter_label, word_label, letter_num, word_num, out_dir, max_rows)
+            for name, letter_label, word_label in zip(names, letter_labels, word_labels)]
+    if num_procs == 0:
+        for arg in args:
+            _plot_utterance(*arg)
+    else:
+        from joblib import Parallel, delayed
+        Parallel(n_jobs=num_procs)(delayed(_plot_utterance)(*arg) for arg in args)
+
+# Curves of a run directory, the text files its summary_files hold.
+RUN_SUMMARY_FILES = {
+    "iterations": "Iterations.txt",
+    "resample_times": "resample_times.txt",
+    "log_likelihoods": "log_likelihood.txt",
+    "letter_ARI": "Letter_ARI.txt",
+    "letter_macro_F1": "Letter_macro_F1_score.txt",
+    "letter_micro_F1": "Letter_micro_F1_score.txt",
+    "word_ARI": "Word_ARI.txt",
+    "word_macro_F1": "Word_macro_F1_score.txt",
+    "word_micro_F1": "Word_micro_F1_score.txt",
+}
+
+_CACHE_NAME = "summary_cache.npz"
+
+def load_run_summary(run_dir, keys=None):
+    # The curves keys (all of RUN_SUMMARY_FILES by default) of run_dir. They are read
+    # from summary_files/summary_cache.npz, which is rebuilt when any of the text files
+    # changed since, so aggregating many runs only parses the runs which changed.
+    keys = list(RUN_SUMMARY_FILES) if keys is None else list(keys)
+    summary_dir = os.path.join(str(run_dir), "summary_files")
+    paths = [os.path.join(summary_dir, RUN_SUMMARY_FILES[key]) for key in keys]
+    stats = np.array([[os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in paths], dtype=np.int64)
+    cache_path = os.path.join(summary_dir, _CACHE_NAME)
+    cached = {}
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            cached = {key: cache[key] for key in cache.files}
+    out = {}
+    changed = False
+    for key, path, stat in zip(keys, paths, stats):
+        if key in cached and np.array_equal(cached.get("_stat_" + key), stat):
+            out[key] = cached[key]
+        else:
+            out[key] = np.atleast_1d(np.loadtxt(path))
+            cached[key] = out[key]
+            cached["_stat_" + key] = stat
+            changed = True
+    if changed:
+        np.savez(cache_path + ".tmp.npz", **cached)
+        os.replace(cache_path + ".tmp.npz", cache_path)
+    return out
+
+def stack_curves(curves):
+    # One row per run, cut to the shortest run (e.g. one which is still sampling).
+    length = min(len(curve) for curve in curves)
+    return np.array([curve[:length] for curve in curves])
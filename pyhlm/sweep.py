@@ -0,0 +1,78 @@
+import numpy as np
+
+# Sweep policies choose the utterances which resample_states visits in an iteration.
+# The other utterances keep their segmentations, which still enter the global parameter
+# updates of resample_model, so only the word-level backward passes get cheaper.
+
+def _num_visits(num_states, fraction):
+    return min(num_states, max(1, int(np.ceil(fraction * num_states))))
+
+class FullSweep(object):
+
+    def select(self, states_list):
+        return np.arange(len(states_list))
+
+    def update(self, states_list, visited, old_normalizers):
+        pass
+
+class RandomSweep(FullSweep):
+
+    def __init__(self, fraction):
+        if not 0 < fraction <= 1:
+            raise ValueError("fraction must be in (0, 1], got {}".format(fraction))
+        self.fraction = fraction
+
+    def select(self, states_list):
+        num_states = len(states_list)
+        return np.sort(np.random.choice(num_states, _num_visits(num_states, self.fraction), replace=False))
+
+class RoundRobinSweep(RandomSweep):
+    # Visits consecutive blocks, the whole corpus every ceil(1/fraction) iterations.
+
+    def __init__(self, fraction):
+        super(RoundRobinSweep, self).__init__(fraction)
+        self._next = 0
+
+    def select(self, states_list):
+        num_states = len(states_list)
+        if num_states == 0:
+            return np.arange(0)
+        k = _num_visits(num_states, self.fraction)
+        visited = (self._next + np.arange(k)) % num_states
+        self._next = (self._next + k) % num_states
+        return np.sort(visited)
+
+class PrioritySweep(RandomSweep):
+    # Visits the utterances whose normalizer (per frame) changed most the last time
+    # they were resampled. Utterances which were never resampled, or not within
+    # max_age iterations (default 2/fraction), come first so that none is starved.
+
+    def __init__(self, fraction, max_age=None):
+        super(PrioritySweep, self).__init__(fraction)
+        self.max_age = max_age if max_age is not None else int(np.ceil(2.0 / fraction))
+        self._change = np.empty(0)
+        self._age = np.empty(0, dtype=np.int64)
+
+    def _grow(self, num_states):
+        if len(self._change) < num_states:
+            extra = num_states - len(self._change)
+            self._change = np.concatenate((self._change, np.full(extra, np.nan)))
+            self._age = np.concatenate((self._age, np.zeros(extra, dtype=np.int64)))
+
+    def select(self, states_list):
+        num_states = len(states_list)
+        self._grow(num_states)
+        change, age = self._change[:num_states], self._age[:num_states]
+        priority = np.where(np.isnan(change) | (age >= self.max_age), np.inf, change)
+        return np.sort(np.argsort(-priority, kind="stable")[:_num_visits(num_states, self.fraction)])
+
+    def update(self, states_list, visited, old_normalizers):
+        self._grow(len(states_list))
+        self._age[:len(states_list)] += 1
+        for idx, old in zip(visited, old_normalizers):
+            new = states_list[idx]._normalizer
+            if old is None or new is None or not np.isfinite(old) or not np.isfinite(new):
+                self._change[idx] = np.nan
+            else:
+                self._change[idx] = abs(new - old) / states_list[idx].T
+            self._age[idx] = 0
@@ -0,0 +1,135 @@
+import os
+
+import numpy as np
+
+from pyhlm.internals.hlm_states import Segmentation
+
+# Append-only store of the sampled segmentations of every iteration.
+# <prefix>.bin holds, per iteration and utterance, the int32 record
+#   words, durations, letters, letter_durations
+# (the run-length encoded word and letter sequences) and <prefix>.idx one int64 row
+#   iteration, utterance, offset (in int32 elements), number of words, number of letters
+# per record. The records of an iteration are written before their index rows, so an
+# interrupted write leaves at most unindexed bytes behind. <prefix>.names lists the
+# utterance names, one per line.
+
+_INDEX_COLUMNS = 5
+
+def _paths(prefix):
+    return prefix + ".bin", prefix + ".idx", prefix + ".names"
+
+class TraceWriter(object):
+
+    def __init__(self, prefix, names=None):
+        data_path, index_path, names_path = _paths(prefix)
+        dirname = os.path.dirname(data_path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        if names is not None and not os.path.exists(names_path):
+            with open(names_path, "w") as f:
+                f.writelines(str(name) + "\n" for name in names)
+        # Drops a partially written index row of an interrupted run.
+        row_bytes = 8 * _INDEX_COLUMNS
+        if os.path.exists(index_path) and os.path.getsize(index_path) % row_bytes:
+            with open(index_path, "r+b") as f:
+                f.truncate(os.path.getsize(index_path) // row_bytes * row_bytes)
+        self._data = open(data_path, "ab")
+        self._index = open(index_path, "ab")
+        self._offset = self._data.tell() // 4
+
+    def append(self, iteration, segmentations):
+        # segmentations: per utterance, (words, durations, letters, letter_durations),
+        # e.g. Segmentation objects. Utterances are numbered in order.
+        records = []
+        rows = np.empty((len(segmentations), _INDEX_COLUMNS), dtype=np.int64)
+        offset = self._offset
+        for utterance, seg in enumerate(segmentations):
+            words, durations, letters, letter_durations = seg[:4]
+            records.extend((words, durations, letters, letter_durations))
+            rows[utterance] = (iteration, utterance, offset, len(words), len(letters))
+            offset += 2 * (len(words) + len(letters))
+        if records:
+            self._data.write(np.concatenate(records).astype(np.int32).tobytes())
+        self._data.flush()
+        self._index.write(rows.tobytes())
+        self._index.flush()
+        self._offset = offset
+
+    def append_model(self, iteration, model):
+        self.append(iteration, [
+            (state.stateseq_norep, state.durations_censored, state.letter_stateseq_norep, state.letter_durations)
+            for state in model.states_list])
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class TraceReader(object):
+    # The arrays returned are views into memory maps of the files, valid while the reader is.
+    # If an iteration was written twice (e.g. after a resume), the last record is used.
+
+    def __init__(self, prefix):
+        data_path, index_path, names_path = _paths(prefix)
+        self._data = self._memmap(data_path, np.int32)
+        index = self._memmap(index_path, np.int64)
+        self._rows = index[:len(index) // _INDEX_COLUMNS * _INDEX_COLUMNS].reshape((-1, _INDEX_COLUMNS))
+        if os.path.exists(names_path):
+            with open(names_path) as f:
+                self.names = [line.rstrip("\n") for line in f]
+        else:
+            self.names = [str(i) for i in range(int(self._rows[:, 1].max()) + 1 if len(self._rows) else 0)]
+        self._name_to_idx = {name: i for i, name in enumerate(self.names)}
+
+        self.iterations = np.unique(self._rows[:, 0])
+        keys = self._rows[:, 0] * len(self.names) + self._rows[:, 1]
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    @staticmethod
+    def _memmap(path, dtype):
+        if not os.path.exists(path) or os.path.getsize(path) < np.dtype(dtype).itemsize:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(os.path.getsize(path) // np.dtype(dtype).itemsize,))
+
+    @property
+    def num_iterations(self):
+        return len(self.iterations)
+
+    def _utterance_idx(self, utterance):
+        return self._name_to_idx[utterance] if isinstance(utterance, str) else int(utterance)
+
+    def segmentation(self, utterance, iteration):
+        # utterance: index or name.
+        key = iteration * len(self.names) + self._utterance_idx(utterance)
+        pos = np.searchsorted(self._keys, key, side="right") - 1
+        if pos < 0 or self._keys[pos] != key:
+            raise KeyError("no record of utterance {} at iteration {}".format(utterance, iteration))
+        _, _, offset, num_words, num_letters = self._rows[self._order[pos]]
+        words, durations, letters, letter_durations = np.split(
+            self._data[offset:offset + 2 * (num_words + num_letters)],
+            np.cumsum((num_words, num_words, num_letters)))
+        return Segmentation(words, durations, letters, letter_durations, None)
+
+    def segmentations(self, utterance):
+        return [self.segmentation(utterance, iteration) for iteration in self.iterations]
+
+    # Frame-level sequences, one row per iteration.
+    def stateseqs(self, utterance):
+        return np.array([np.repeat(seg.words, seg.durations) for seg in self.segmentations(utterance)])
+
+    def letter_stateseqs(self, utterance):
+        return np.array([np.repeat(seg.letters, seg.letter_durations) for seg in self.segmentations(utterance)])
+
+    def word_boundaries(self, utterance):
+        # 1 at the last frame of every word, as the _d.txt files of the samples.
+        segs = self.segmentations(utterance)
+        out = np.zeros((len(segs), segs[0].durations.sum() if segs else 0))
+        for row, seg in zip(out, segs):
+            row[np.cumsum(seg.durations) - 1] = 1.0
+        return out
@@ -0,0 +1,10 @@
+import numpy as np
+
+def rle_with_boundaries(stateseq, starts):
+    # Run-length encoding of stateseq where every index in starts also begins a new run,
+    # e.g. word boundaries for a letter sequence, since a letter never continues over them.
+    starts = np.union1d(np.flatnonzero(np.diff(stateseq)) + 1, starts).astype(np.int64)
+    starts = starts[starts < len(stateseq)]
+    if len(stateseq) > 0 and (len(starts) == 0 or starts[0] != 0):
+        starts = np.concatenate(([0], starts))
+    return stateseq[starts], np.diff(np.append(starts, len(stateseq))).astype(np.int32)
@@ -1,10 +1,22 @@
+import copy
+
 import numpy as np
 
 from pyhsmm.models import WeakLimitHDPHSMMPython
 from pyhsmm.models import WeakLimitHDPHSMM
 from pybasicbayes.distributions.poisson import Poisson
+from pyhsmm.basic.distributions import PoissonDuration
 from pyhsmm.util.stats import sample_discrete
+from pyhsmm.util.general import list_split
 from pyhlm.internals.internal_hsmm_states import LetterHSMMStatesPython, LetterHSMMStatesEigen
+from pyhlm.internals.statistics import letter_statistics, reduce_letter_statistics, gaussian_natural_statistics
+
+def _resample_gaussian(obs_distn, stats):
+    # Gaussian.resample only takes data, a copy carries the posterior as its prior.
+    posterior = copy.copy(obs_distn)
+    posterior.natural_hypparam = obs_distn.natural_hypparam + stats
+    posterior.resample()
+    obs_distn.mu, obs_distn.sigma = posterior.mu, posterior.sigma
 
 class LetterHSMMPython(WeakLimitHDPHSMMPython):
     _states_class = LetterHSMMStatesPython
@@ -17,12 +29,102 @@ class LetterHSMMPython(WeakLimitHDPHSMMPython):
         self.init_state_distn.resample([word[0] for word in word_list])
         self._clear_caches()
 
-    def resample_parameters_by_sampled_words(self, word_list):
-        self.resample_dur_distns()
-        self.resample_obs_distns()
+    def resample_parameters_by_sampled_words(self, word_list, num_procs=0):
+        self.resample_obs_and_dur_distns_by_statistics(num_procs=num_procs)
         self.resample_trans_distn_by_sampled_words(word_list)
         self.resample_init_state_distn_by_sampled_words(word_list)
 
+    def resample_states_by_segments(self, num_procs=0):
+        # Word segments cut out of the same utterance are resampled together in one batched call.
+        segments = {}
+        for letter_state in self.states_list:
+            if letter_state._hlmstate is None:
+                letter_state.resample()
+            else:
+                segments.setdefault(id(letter_state._hlmstate), []).append(letter_state)
+        segments = list(segments.values())
+        if num_procs == 0:
+            for letter_states in segments:
+                self._states_class.resample_segments(letter_states)
+        else:
+            self._joblib_resample_segments(segments, num_procs)
+
+    def _joblib_resample_segments(self, segments, num_procs):
+        from joblib import Parallel, delayed
+        from pyhlm import parallel
+
+        if len(segments) > 0:
+            joblib_args = list_split(
+                    [self._get_joblib_segments(letter_states) for letter_states in segments],
+                    num_procs)
+
+            parallel.model = self
+            parallel.args = joblib_args
+
+            raw_stateseqs = Parallel(n_jobs=num_procs,backend='multiprocessing')\
+                    (delayed(parallel._get_sampled_letter_stateseqs)(idx)
+                            for idx in range(len(joblib_args)))
+
+            for letter_states, (stateseq, normalizers) in zip(
+                    [s for grp in list_split(segments,num_procs) for s in grp],
+                    [seq for grp in raw_stateseqs for seq in grp]):
+                self._states_class.set_segments(letter_states[0]._hlmstate, letter_states, stateseq, normalizers)
+
+    def _get_joblib_segments(self, letter_states):
+        hlmstate = letter_states[0]._hlmstate
+        segs = np.array([s._d0 for s in letter_states] + [letter_states[-1]._d1], dtype=np.int32)
+        trunc = letter_states[0].trunc if letter_states[0].trunc is not None else hlmstate.T
+        return (hlmstate.data, segs, trunc, hlmstate.letter_ends)
+
+    def resample_obs_and_dur_distns_by_statistics(self, num_procs=0):
+        if not all(hasattr(obs_distn, "natural_hypparam") for obs_distn in self.obs_distns) or \
+                not all(isinstance(dur_distn, PoissonDuration) for dur_distn in self.dur_distns):
+            self.resample_dur_distns()
+            self.resample_obs_distns()
+            return
+
+        args = self._get_statistics_args()
+        D = args[0][0].shape[1] if len(args) > 0 else len(self.obs_distns[0].mu_0)
+        if num_procs == 0 or len(args) == 0:
+            statistics = [letter_statistics(data, stateseq, segs, self.num_states) for data, stateseq, segs in args]
+        else:
+            from joblib import Parallel, delayed
+            from pyhlm import parallel
+
+            parallel.model = self
+            parallel.args = list_split(args, num_procs)
+
+            statistics = Parallel(n_jobs=num_procs,backend='multiprocessing')\
+                    (delayed(parallel._get_letter_statistics)(idx)
+                            for idx in range(len(parallel.args)))
+        n, sumx, sumxxT, dur_n, dur_tot = reduce_letter_statistics(statistics, self.num_states, D)
+
+        for state, obs_distn in enumerate(self.obs_distns):
+            _resample_gaussian(obs_distn, gaussian_natural_statistics(n[state], sumx[state], sumxxT[state]))
+        for state, dur_distn in enumerate(self.dur_distns):
+            # PoissonDuration starts at one, so the Poisson sees duration - 1.
+            dur_distn.resample(stats=(dur_n[state], dur_tot[state] - dur_n[state]))
+        self._clear_caches()
+
+    def _get_statistics_args(self):
+        args = []
+        hlmstates = {}
+        for letter_state in self.states_list:
+            hlmstate = letter_state._hlmstate
+            if hlmstate is None:
+                args.append((letter_state.data, letter_state.stateseq, np.array([0, letter_state.T])))
+            elif id(hlmstate) not in hlmstates:
+                hlmstates[id(hlmstate)] = hlmstate
+                segs = np.concatenate(([0], hlmstate.durations_censored)).cumsum()
+                args.append((hlmstate.data, hlmstate.letter_stateseq, segs))
+        return args
+
+    def _clear_caches(self):
+        super(LetterHSMMPython, self)._clear_caches()
+        hlmstates = {id(s._hlmstate): s._hlmstate for s in self.states_list if getattr(s, "_hlmstate", None) is not None}
+        for hlmstate in hlmstates.values():
+            hlmstate.clear_caches()
+
     def generate_word(self, word_size):
         nextstate_distn = self.init_state_distn.pi_0
         A = self.trans_distn.trans_matrix
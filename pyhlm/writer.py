@@ -0,0 +1,92 @@
+import queue
+import threading
+
+import numpy as np
+
+# Output of a Gibbs chain written by a background thread, so that sampling does not
+# wait for the disk. Jobs run in submission order. The queue is bounded: submit blocks
+# when maxsize jobs are pending, which keeps memory use flat if the disk falls behind.
+# Arguments must not change after submission, pass snapshots of the model state.
+
+def snapshot(obj):
+    # Copies the arrays of (nested dicts, lists and tuples of) model outputs, e.g. model.params.
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+def snapshot_segmentations(model):
+    # Run-length encoded segmentations of model.states_list, as TraceWriter.append takes them.
+    return [(state.stateseq_norep.copy(), state.durations_censored.copy(),
+             state.letter_stateseq_norep, state.letter_durations)
+            for state in model.states_list]
+
+class AsyncWriter(object):
+
+    def __init__(self, maxsize=4, thin=1):
+        # maxsize: submit blocks while that many jobs are pending.
+        # thin: submit_thinned only keeps the iterations which are multiples of it.
+        if thin < 1:
+            raise ValueError("thin must be >= 1, got {}".format(thin))
+        self.thin = thin
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                if self._error is None:
+                    func, args, kwargs = job
+                    func(*args, **kwargs)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, func, *args, **kwargs):
+        # The error of a failed job is raised by the next submit, flush or close,
+        # the jobs queued behind the failed one are dropped.
+        self._raise_error()
+        if not self._thread.is_alive():
+            raise RuntimeError("writer is closed")
+        self._queue.put((func, args, kwargs))
+
+    def due(self, itr_idx):
+        return itr_idx % self.thin == 0
+
+    def submit_thinned(self, itr_idx, func, *args, **kwargs):
+        if self.due(itr_idx):
+            self.submit(func, *args, **kwargs)
+
+    @property
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -13,7 +13,9 @@ do
   esac
 done
 
-bash runner.sh -l ${label} -b ${begin} -e ${end}
+python multi_runner.py -l ${label} -b ${begin} -e ${end}
+# or, one trial after another:
+# bash runner.sh -l ${label} -b ${begin} -e ${end}
 
 bash summary_runner.sh -l ${label}
 
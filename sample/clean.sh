@@ -3,6 +3,7 @@
 rm -rf results/
 rm -rf summary_files/
 rm -rf parameters/
+rm -rf checkpoint/
 rm -rf figures/
 rm -rf log.txt
 rm -rf continue.sh
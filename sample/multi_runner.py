@@ -0,0 +1,152 @@
+#%%
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+import numpy as np
+from util.config_parser import ConfigParser_with_eval
+from pyhlm.corpus import load_corpus
+
+# Runs the trials begin..end of pyhlm_sample.py concurrently, as many at a time as the
+# CPU budget allows with thread_num threads each. Every trial runs in <label>/<NN>/
+# (the layout runner.sh produces) with links to the DATA/, LABEL/, hypparams/ and
+# files.txt copied once into <label>/, so all trials memory-map the same corpus cache.
+# Trial i is seeded from (seed, i), independently of which trials run together.
+# Running it again skips the finished trials and resumes the interrupted ones from their
+# checkpoint (checkpoint_interval in model.config), the others start over. The wall
+# time, exit code and seed of every trial are written to <NN>/chain.json and
+# collected in <label>/chains.json.
+
+#%% parse arguments
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+parser.add_argument("-l", "--label", default="sample_results", help="output directory of the experiment")
+parser.add_argument("-b", "--begin", type=int, default=1, help="first trial")
+parser.add_argument("-e", "--end", type=int, default=20, help="last trial")
+parser.add_argument("--cpus", type=int, default=os.cpu_count() or 1, help="CPUs shared by all trials")
+parser.add_argument("--thread_num", type=int, default=None, help="threads per trial, thread_num of the model config if not given")
+parser.add_argument("--seed", type=int, default=0, help="seed the trial seeds are derived from")
+parser.add_argument("--restart", action="store_true", help="run finished trials again")
+args = parser.parse_args()
+
+sample_dir = Path(__file__).resolve().parent
+label = Path(args.label).resolve()
+SHARED = ["DATA", "LABEL", "hypparams", "files.txt"]
+OUTPUTS = ["results", "parameters", "summary_files", "checkpoint", "log.txt"]
+
+#%%
+def load_config(filename):
+    cp = ConfigParser_with_eval()
+    cp.read(filename)
+    return cp
+
+def prepare_experiment():
+    # Copies the inputs as runner.sh does and builds the corpus cache once, before the
+    # trials would race to build it.
+    label.mkdir(parents=True, exist_ok=True)
+    for name in SHARED:
+        if (sample_dir / name).is_dir():
+            shutil.copytree(sample_dir / name, label / name, dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns(".corpus.*"))
+        else:
+            shutil.copy2(sample_dir / name, label / name)
+    names = np.loadtxt(label / "files.txt", dtype=str)
+    load_corpus(names, data_dir=str(label / "DATA"))
+
+def chain_seed(i):
+    return int(np.random.SeedSequence([args.seed, i]).generate_state(1)[0])
+
+def chain_dir(i):
+    return label / "{:02d}".format(i)
+
+def load_record(i):
+    path = chain_dir(i) / "chain.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def prepare_chain(i):
+    # Returns True if the trial resumes from its checkpoint.
+    root = chain_dir(i)
+    root.mkdir(exist_ok=True)
+    for name in SHARED:
+        link = root / name
+        if not link.is_symlink():
+            link.symlink_to(Path("..") / name)
+    resume = (root / "checkpoint").is_dir()
+    if not resume:
+        for name in OUTPUTS:
+            path = root / name
+            if path.is_dir():
+                shutil.rmtree(path)
+            elif path.exists():
+                path.unlink()
+    return resume
+
+def run_chain(i, thread_num):
+    root = chain_dir(i)
+    resume = prepare_chain(i)
+    seed = chain_seed(i)
+    env = dict(os.environ)
+    # The trials share the CPUs, BLAS must not start a thread per core in every one of them.
+    for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        env.setdefault(name, "1")
+    command = [sys.executable, str(sample_dir / "pyhlm_sample.py"), "--seed", str(seed), "--thread_num", str(thread_num)]
+
+    print("start trial {} (seed {}{})".format(i, seed, ", resumed" if resume else ""), flush=True)
+    started = time.time()
+    with open(root / "log.txt", "a" if resume else "w") as log:
+        returncode = subprocess.call(command, cwd=str(root), env=env, stdout=log, stderr=subprocess.STDOUT)
+    elapsed = time.time() - started
+    previous = load_record(i) if resume else None
+
+    record = {
+        "trial": i,
+        "seed": seed,
+        "thread_num": thread_num,
+        "status": "done" if returncode == 0 else "failed",
+        "returncode": returncode,
+        "started": started,
+        "elapsed": elapsed,
+        # Wall time of all attempts, the interrupted ones included.
+        "total_elapsed": elapsed + (previous["total_elapsed"] if previous else 0.0),
+        "resumed": resume,
+    }
+    with open(root / "chain.json", "w") as f:
+        json.dump(record, f, indent=2)
+    if returncode == 0:
+        shutil.rmtree(root / "checkpoint", ignore_errors=True)
+    print("{} trial {} in {:.1f} sec".format(record["status"], i, elapsed), flush=True)
+    return record
+
+#%%
+prepare_experiment()
+thread_num = args.thread_num
+if thread_num is None:
+    thread_num = load_config(str(label / "hypparams/model.config"))["model"]["thread_num"]
+thread_num = max(1, min(thread_num, args.cpus))
+num_chains = max(1, args.cpus // thread_num)
+
+trials = list(range(args.begin, args.end + 1))
+pending = [i for i in trials if args.restart or (load_record(i) or {}).get("status") != "done"]
+print("{} of {} trials to run, {} at a time with {} threads each".format(len(pending), len(trials), num_chains, thread_num))
+
+#%%
+with ThreadPoolExecutor(max_workers=num_chains) as pool:
+    list(pool.map(lambda i: run_chain(i, thread_num), pending))
+
+records = [record for record in (load_record(i) for i in trials) if record is not None]
+with open(label / "chains.json", "w") as f:
+    json.dump(records, f, indent=2)
+
+failed = [record["trial"] for record in records if record["status"] != "done"]
+print("Done! {} trials, {:.1f} sec of chains in total".format(len(records), sum(record["total_elapsed"] for record in records)))
+if failed:
+    print("failed trials: {}".format(failed))
+    sys.exit(1)
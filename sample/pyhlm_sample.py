@@ -2,6 +2,13 @@ import numpy as np
 from pyhlm.model import WeakLimitHDPHLM, WeakLimitHDPHLMPython
 from pyhlm.internals.hlm_states import WeakLimitHDPHLMStates
 from pyhlm.word_model import LetterHSMM, LetterHSMMPython
+from pyhlm.trace import TraceWriter
+from pyhlm.writer import AsyncWriter, snapshot, snapshot_segmentations
+from pyhlm.decimation import CoarseToFine
+from pyhlm.checkpoint import load_checkpoint_info
+from pyhlm.corpus import load_corpus
+from pyhlm.internals.table_cache import TableCache
+from pyhlm.evaluation import SegmentationEvaluator
 import pyhsmm
 from tqdm import trange
 import warnings
@@ -29,6 +36,8 @@ parser.add_argument("--letter_observation", default=hypparams_letter_observation
 parser.add_argument("--pyhlm", default=hypparams_pyhlm, help="hyper parameters of pyhlm")
 parser.add_argument("--word_length", default=hypparams_word_length, help="hyper parameters of word length")
 parser.add_argument("--superstate", default=hypparams_superstate, help="hyper parameters of superstate")
+parser.add_argument("--seed", type=int, default=None, help="seed of np.random, random if not given")
+parser.add_argument("--thread_num", type=int, default=None, help="overrides thread_num of the model config")
 
 args = parser.parse_args()
 
@@ -39,6 +48,8 @@ hypparams_letter_observation = args.letter_observation
 hypparams_pyhlm = args.pyhlm
 hypparams_word_length = args.word_length
 hypparams_superstate = args.superstate
+if args.seed is not None:
+    np.random.seed(args.seed)
 
 #%%
 def load_config(filename):
@@ -47,37 +58,20 @@ def load_config(filename):
     return cp
 
 #%%
-def load_datas():
-    data = []
+def load_datas(num_procs=0):
+    # Frames are read from the binary cache of DATA (see pyhlm.corpus), built on first use.
     names = np.loadtxt("files.txt", dtype=str)
-    files = names
-    for name in names:
-        data.append(np.loadtxt("DATA/" + name + ".txt"))
-    return data
-
-def unpack_durations(dur):
-    unpacked = np.zeros(dur.sum())
-    d = np.cumsum(dur)
-    unpacked[d-1] = 1.0
-    return unpacked
-
-def save_stateseq(model):
-    # Save sampled states sequences.
-    names = np.loadtxt("files.txt", dtype=str)
-    for i, s in enumerate(model.states_list):
-        with open("results/" + names[i] + "_s.txt", "a") as f:
-            np.savetxt(f, s.stateseq, fmt="%d")
-        with open("results/" + names[i] + "_l.txt", "a") as f:
-            np.savetxt(f, s.letter_stateseq, fmt="%d")
-        with open("results/" + names[i] + "_d.txt", "a") as f:
-            np.savetxt(f, unpack_durations(s.durations_censored), fmt="%d")
-
-def save_params_as_text(itr_idx, model):
+    return load_corpus(names, num_procs=num_procs).datas()
+
+def save_stateseq(trace, itr_idx, segmentations):
+    # Save sampled segmentations, run-length encoded (see pyhlm.trace).
+    trace.append(itr_idx, segmentations)
+
+def save_params_as_text(itr_idx, params):
     with open("parameters/ITR_{0:04d}.txt".format(itr_idx), "w") as f:
-        f.write(str(model.params))
+        f.write(str(params))
 
-def save_params_as_file(iter_idx, model):
-    params = model.params
+def save_params_as_file(iter_idx, params):
     root_dir = Path("parameters/ITR_{0:04d}".format(iter_idx))
     root_dir.mkdir(exist_ok=True)
     save_json(root_dir, params)
@@ -99,8 +93,7 @@ def save_json(root_dir, json_obj):
             else:
                 savefile.write_text(str(subjson))
 
-def save_params_as_npz(iter_idx, model):
-    params = model.params
+def save_params_as_npz(iter_idx, params):
     flatten_params = flatten_json(params)
     # flatten_params = copy_flatten_json(flatten_params)
     np.savez(f"parameters/ITR_{iter_idx:04d}.npz", **flatten_params)
@@ -144,14 +137,33 @@ def copy_flatten_json(json_obj):
             raise NotImplementedError(f"type :{type_of_subjson} can not copy. Plz implement here!")
     return new_json
 
-def save_loglikelihood(model):
+def save_loglikelihood(log_likelihood):
     with open("summary_files/log_likelihood.txt", "a") as f:
-        f.write(str(model.log_likelihood()) + "\n")
+        f.write(str(log_likelihood) + "\n")
 
 def save_resample_times(resample_time):
     with open("summary_files/resample_times.txt", "a") as f:
         f.write(str(resample_time) + "\n")
 
+def load_evaluator(names, letter_num, word_num):
+    letter_labels = [np.loadtxt("LABEL/" + name + ".lab") for name in names]
+    word_labels = [np.loadtxt("LABEL/" + name + ".lab2") for name in names]
+    return SegmentationEvaluator(letter_labels, word_labels, letter_num, word_num)
+
+def save_live_scores(evaluator, segmentations):
+    scores = evaluator.evaluate(segmentations)
+    with open("summary_files/live_scores.txt", "a") as f:
+        if f.tell() == 0:
+            f.write(" ".join(scores.keys()) + "\n")
+        f.write(" ".join(str(value) for value in scores.values()) + "\n")
+
+def truncate_lines(filename, num_lines):
+    # Drops the lines written after the checkpoint we resume from.
+    with open(filename) as f:
+        lines = f.readlines()[:num_lines]
+    with open(filename, "w") as f:
+        f.writelines(lines)
+
 #%%
 Path("results").mkdir(exist_ok=True)
 Path("parameters").mkdir(exist_ok=True)
@@ -160,12 +172,21 @@ Path("summary_files").mkdir(exist_ok=True)
 #%% config parse
 config_parser = load_config(hypparams_model)
 section         = config_parser["model"]
-thread_num      = section["thread_num"]
+thread_num      = section["thread_num"] if args.thread_num is None else args.thread_num
 pretrain_iter   = section["pretrain_iter"]
 train_iter      = section["train_iter"]
 word_num        = section["word_num"]
 letter_num      = section["letter_num"]
 observation_dim = section["observation_dim"]
+save_thin = section["save_thin"] if "save_thin" in section else 1
+# A checkpoint is saved every checkpoint_interval iterations (0 for never) and resumed from.
+checkpoint_interval = section["checkpoint_interval"] if "checkpoint_interval" in section else 0
+# [(factor, iterations), ...]: early iterations on frame-pooled utterances, coarsest first.
+coarse_schedule = section["coarse_schedule"] if "coarse_schedule" in section else []
+# Memory budget (MiB) of the per-utterance likelihood tables, None keeps all of them.
+table_budget_mb = section["table_budget_mb"] if "table_budget_mb" in section else None
+# Scores the segmentations against LABEL/ after every iteration (summary_files/live_scores.txt).
+live_evaluation = section["live_evaluation"] if "live_evaluation" in section else False
 
 hlm_hypparams = load_config(hypparams_pyhlm)["pyhlm"]
 
@@ -189,46 +210,84 @@ length_distn = pyhsmm.distributions.PoissonDuration(**len_hypparams)
 
 letter_hsmm = LetterHSMM(**letter_hsmm_hypparams, obs_distns=letter_obs_distns, dur_distns=letter_dur_distns)
 model = WeakLimitHDPHLM(**hlm_hypparams, letter_hsmm=letter_hsmm, dur_distns=dur_distns, length_distn=length_distn)
+table_cache = TableCache(int(table_budget_mb * 2**20)) if table_budget_mb is not None else None
+model.table_cache = table_cache
 
 #%%
 files = np.loadtxt("files.txt", dtype=str)
-datas = load_datas()
-
-#%% Pre training.
-for data in datas:
-    letter_hsmm.add_data(data, **superstate_config["DEFAULT"])
-for t in trange(pretrain_iter):
-    letter_hsmm.resample_model(num_procs=thread_num)
-letter_hsmm.states_list = []
+datas = load_datas(num_procs=thread_num)
+trace = TraceWriter("results/trace", names=files)
+# Outputs are written in the background, segmentations and parameters every save_thin iterations.
+writer = AsyncWriter(thin=save_thin)
+evaluator = load_evaluator(files, letter_num, word_num) if live_evaluation else None
 
 #%%
-print("Add datas...")
-for name, data in zip(files, datas):
-    model.add_data(data, **superstate_config[name], generate=False)
-model.resample_states(num_procs=thread_num)
-# # or
-# for name, data in zip(files, datas):
-#     model.add_data(data, **superstate_config[name], initialize_from_prior=False)
-print("Done!")
-
-#%% Save init params
-# save_params_as_text(0, model)
-# save_params_as_file(0, model)
-save_params_as_npz(0, model)
-save_loglikelihood(model)
+start_iter = 0
+if checkpoint_interval and Path("checkpoint").exists():
+    print("Resume from checkpoint...")
+    start_iter = load_checkpoint_info("checkpoint")["iteration"]
+    model = WeakLimitHDPHLM.load_checkpoint("checkpoint", mmap_data=table_cache is not None)
+    model.table_cache = table_cache
+    truncate_lines("summary_files/log_likelihood.txt", start_iter + 1)
+    truncate_lines("summary_files/resample_times.txt", start_iter)
+    if evaluator is not None and Path("summary_files/live_scores.txt").exists():
+        # One header line, then the scores of the initial segmentations and of every iteration.
+        truncate_lines("summary_files/live_scores.txt", start_iter + 2)
+    print("Done!")
+else:
+    # Pre training.
+    for data in datas:
+        letter_hsmm.add_data(data, **superstate_config["DEFAULT"])
+    for t in trange(pretrain_iter):
+        letter_hsmm.resample_model(num_procs=thread_num)
+    letter_hsmm.states_list = []
+
+    print("Add datas...")
+    for name, data in zip(files, datas):
+        model.add_data(data, **superstate_config[name], generate=False)
+    if coarse_schedule:
+        CoarseToFine(model, coarse_schedule).run(num_procs=thread_num)
+    else:
+        model.resample_states(num_procs=thread_num)
+    # # or
+    # for name, data in zip(files, datas):
+    #     model.add_data(data, **superstate_config[name], initialize_from_prior=False)
+    print("Done!")
+
+    # Save init params
+    params = snapshot(model.params)
+    # writer.submit(save_params_as_text, 0, params)
+    # writer.submit(save_params_as_file, 0, params)
+    writer.submit(save_params_as_npz, 0, params)
+    # Normalizers cached by the last resampling, only unscored utterances need a backward pass.
+    writer.submit(save_loglikelihood, model.log_likelihood(num_procs=thread_num))
+    if evaluator is not None:
+        writer.submit(save_live_scores, evaluator, snapshot_segmentations(model))
 
 #%%
-for t in trange(train_iter):
+for t in trange(start_iter, train_iter):
     st = time.time()
     model.resample_model(num_procs=thread_num)
     resample_model_time = time.time() - st
-    save_stateseq(model)
-    save_loglikelihood(model)
-    # save_params_as_text(t+1, model)
-    # save_params_as_file(t+1, model)
-    save_params_as_npz(t+1, model)
-    save_resample_times(resample_model_time)
+    log_likelihood = model.log_likelihood(num_procs=thread_num)
+    segmentations = snapshot_segmentations(model) if writer.due(t+1) or evaluator is not None else None
+    if writer.due(t+1):
+        writer.submit(save_stateseq, trace, t+1, segmentations)
+        params = snapshot(model.params)
+        # writer.submit(save_params_as_text, t+1, params)
+        # writer.submit(save_params_as_file, t+1, params)
+        writer.submit(save_params_as_npz, t+1, params)
+    writer.submit(save_loglikelihood, log_likelihood)
+    writer.submit(save_resample_times, resample_model_time)
+    if evaluator is not None:
+        writer.submit(save_live_scores, evaluator, segmentations)
     print(model.word_list)
     print(model.word_counts())
-    print(f"log_likelihood:{model.log_likelihood()}")
+    print(f"log_likelihood:{log_likelihood}")
     print(f"resample_model:{resample_model_time}")
+    if checkpoint_interval and (t+1) % checkpoint_interval == 0:
+        # The outputs up to this iteration are on disk before the checkpoint claims it.
+        writer.flush()
+        model.save_checkpoint("checkpoint", info={"iteration": t+1})
+writer.close()
+trace.close()
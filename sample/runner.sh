@@ -3,13 +3,15 @@
 label=sample_results
 begin=1
 end=20
+resume=0
 
-while getopts l:b:e: OPT
+while getopts l:b:e:r OPT
 do
   case $OPT in
     "l" ) label="${OPTARG}" ;;
     "b" ) begin="${OPTARG}" ;;
     "e" ) end="${OPTARG}" ;;
+    "r" ) resume=1 ;;
   esac
 done
 
@@ -27,26 +29,35 @@ do
   echo ${i}
 
   i_str=$( printf '%02d' $i )
-  rm -f results/*
-  rm -rf parameters/*
-  rm -f summary_files/*
-  rm -f log.txt
-  touch log.txt
+  # The first trial of a continued run resumes from its checkpoint (checkpoint_interval in model.config).
+  if [ ${resume} -eq 1 ] && [ ${i} -eq ${begin} ] && [ -d checkpoint ]; then
+    tee_opt="-a"
+  else
+    rm -f results/*
+    rm -rf parameters/*
+    rm -f summary_files/*
+    rm -rf checkpoint
+    rm -f log.txt
+    touch log.txt
+    tee_opt=""
+  fi
 
   echo "#!/bin/bash" > continue.sh
-  echo "bash runner.sh -l ${label} -b ${i} -e ${end}" >> continue.sh
+  echo "bash runner.sh -l ${label} -b ${i} -e ${end} -r" >> continue.sh
 
-  python pyhlm_sample.py | tee log.txt
+  python pyhlm_sample.py | tee ${tee_opt} log.txt
 
   mkdir -p ${label}/${i_str}/
   cp -r results/ ${label}/${i_str}/
   cp -r parameters/ ${label}/${i_str}/
   cp -r summary_files/ ${label}/${i_str}/
   cp log.txt ${label}/${i_str}/
+  rm -rf checkpoint
 
 done
 
 rm -f results/*
 rm -rf parameters/*
 rm -f summary_files/*
+rm -rf checkpoint
 rm -f log.txt
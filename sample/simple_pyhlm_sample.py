@@ -9,6 +9,9 @@ from util.config_parser import ConfigParser_with_eval
 
 from pyhlm.model import WeakLimitHDPHLM
 from pyhlm.word_model import LetterHSMM
+from pyhlm.trace import TraceWriter
+from pyhlm.writer import AsyncWriter, snapshot, snapshot_segmentations
+from pyhlm.corpus import load_corpus
 
 warnings.filterwarnings('ignore')
 
@@ -23,41 +26,23 @@ def load_config(filename):
     return cp
 
 
-def load_datas():
-    data = []
+def load_datas(num_procs=0):
+    # Frames are read from the binary cache of DATA (see pyhlm.corpus), built on first use.
     names = np.loadtxt("files.txt", dtype=str)
-    files = names
-    for name in names:
-        data.append(np.loadtxt("DATA/" + name + ".txt"))
-    return data
+    return load_corpus(names, num_procs=num_procs).datas()
 
 
-def unpack_durations(dur):
-    unpacked = np.zeros(dur.sum())
-    d = np.cumsum(dur)
-    unpacked[d - 1] = 1.0
-    return unpacked
+def save_stateseq(trace, itr_idx, segmentations):
+    # Save sampled segmentations, run-length encoded (see pyhlm.trace).
+    trace.append(itr_idx, segmentations)
 
 
-def save_stateseq(model):
-    # Save sampled states sequences.
-    names = np.loadtxt("files.txt", dtype=str)
-    for i, s in enumerate(model.states_list):
-        with open("results/" + names[i] + "_s.txt", "a") as f:
-            np.savetxt(f, s.stateseq, fmt="%d")
-        with open("results/" + names[i] + "_l.txt", "a") as f:
-            np.savetxt(f, s.letter_stateseq, fmt="%d")
-        with open("results/" + names[i] + "_d.txt", "a") as f:
-            np.savetxt(f, unpack_durations(s.durations_censored), fmt="%d")
-
-
-def save_params_as_text(itr_idx, model):
+def save_params_as_text(itr_idx, params):
     with open("parameters/ITR_{0:04d}.txt".format(itr_idx), "w") as f:
-        f.write(str(model.params))
+        f.write(str(params))
 
 
-def save_params_as_file(iter_idx, model):
-    params = model.params
+def save_params_as_file(iter_idx, params):
     root_dir = Path("parameters/ITR_{0:04d}".format(iter_idx))
     root_dir.mkdir(exist_ok=True)
     save_json(root_dir, params)
@@ -81,8 +66,7 @@ def save_json(root_dir, json_obj):
                 savefile.write_text(str(subjson))
 
 
-def save_params_as_npz(iter_idx, model):
-    params = model.params
+def save_params_as_npz(iter_idx, params):
     flatten_params = flatten_json(params)
     # flatten_params = copy_flatten_json(flatten_params)
     np.savez(f"parameters/ITR_{iter_idx:04d}.npz", **flatten_params)
@@ -130,9 +114,9 @@ def copy_flatten_json(json_obj):
     return new_json
 
 
-def save_loglikelihood(model):
+def save_loglikelihood(log_likelihood):
     with open("summary_files/log_likelihood.txt", "a") as f:
-        f.write(str(model.log_likelihood()) + "\n")
+        f.write(str(log_likelihood) + "\n")
 
 
 def save_resample_times(resample_time):
@@ -165,6 +149,7 @@ def main():
     word_num: int = section["word_num"]
     letter_num: int = section["letter_num"]
     observation_dim = section["observation_dim"]
+    save_thin = section["save_thin"] if "save_thin" in section else 1
 
     # コンフィグ(Sectionというクラス. dictのように使える)だけを返す.
     hlm_hypparams = load_config(hypparams_pyhlm)["pyhlm"]
@@ -220,7 +205,10 @@ def main():
     #   1. 上の3のハイパーパラメータを設定するステップに関するドキュメントは存在するか
     # %%
     files = np.loadtxt("files.txt", dtype=str)
-    datas = load_datas()
+    datas = load_datas(num_procs=thread_num)
+    trace = TraceWriter("results/trace", names=files)
+    # Outputs are written in the background, segmentations and parameters every save_thin iterations.
+    writer = AsyncWriter(thin=save_thin)
 
     # %% Pre training.
     for data in datas:
@@ -240,26 +228,33 @@ def main():
     print("Done!")
 
     # %% Save init params
-    # save_params_as_text(0, model)
-    # save_params_as_file(0, model)
-    save_params_as_npz(0, model)
-    save_loglikelihood(model)
+    params = snapshot(model.params)
+    # writer.submit(save_params_as_text, 0, params)
+    # writer.submit(save_params_as_file, 0, params)
+    writer.submit(save_params_as_npz, 0, params)
+    # Normalizers cached by the last resampling, only unscored utterances need a backward pass.
+    writer.submit(save_loglikelihood, model.log_likelihood(num_procs=thread_num))
 
     # %%
     for t in trange(train_iter):
         st = time.time()
         model.resample_model(num_procs=thread_num)
         resample_model_time = time.time() - st
-        save_stateseq(model)
-        save_loglikelihood(model)
-        # save_params_as_text(t+1, model)
-        # save_params_as_file(t+1, model)
-        save_params_as_npz(t + 1, model)
-        save_resample_times(resample_model_time)
+        log_likelihood = model.log_likelihood(num_procs=thread_num)
+        if writer.due(t+1):
+            writer.submit(save_stateseq, trace, t+1, snapshot_segmentations(model))
+            params = snapshot(model.params)
+            # writer.submit(save_params_as_text, t+1, params)
+            # writer.submit(save_params_as_file, t+1, params)
+            writer.submit(save_params_as_npz, t+1, params)
+        writer.submit(save_loglikelihood, log_likelihood)
+        writer.submit(save_resample_times, resample_model_time)
         print(model.word_list)
         print(model.word_counts())
-        print(f"log_likelihood:{model.log_likelihood()}")
+        print(f"log_likelihood:{log_likelihood}")
         print(f"resample_model:{resample_model_time}")
+    writer.close()
+    trace.close()
 
 
 if __name__ == "__main__":
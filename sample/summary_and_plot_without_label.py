@@ -8,6 +8,8 @@ from tqdm import trange, tqdm
 from sklearn.metrics import adjusted_rand_score
 from argparse import ArgumentParser
 from util.config_parser import ConfigParser_with_eval
+from pyhlm.trace import TraceReader
+from pyhlm.corpus import load_corpus
 
 #%% parse arguments
 def arg_check(value, default):
@@ -32,27 +34,16 @@ def get_names():
     return np.loadtxt("files.txt", dtype=str)
 
 def get_datas_and_length(names):
-    datas = [np.loadtxt("DATA/" + name + ".txt") for name in names]
-    length = [len(d) for d in datas]
-    return datas, length
+    corpus = load_corpus(names)
+    return corpus.datas(), corpus.lengths.tolist()
 
-def get_results_of_word(names, length):
-    return _joblib_get_results(names, length, "s")
-
-def get_results_of_letter(names, length):
-    return _joblib_get_results(names, length, "l")
-
-def get_results_of_duration(names, length):
-    return _joblib_get_results(names, length, "d")
-
-def _get_results(names, lengths, c):
-    return [np.loadtxt("results/" + name + "_" + c + ".txt").reshape((-1, l)) for name, l in zip(names, lengths)]
-
-def _joblib_get_results(names, lengths, c):
-    from joblib import Parallel, delayed
-    def _component(name, length, c):
-        return np.loadtxt("results/" + name + "_" + c + ".txt").reshape((-1, length))
-    return Parallel(n_jobs=-1)([delayed(_component)(n, l, c) for n, l in zip(names, lengths)])
+def get_results(names):
+    # Frame-level letters, words and word boundaries (one row per traced iteration) from the trace.
+    trace = TraceReader("results/trace")
+    return (trace.iterations,
+            [trace.letter_stateseqs(name) for name in names],
+            [trace.stateseqs(name) for name in names],
+            [trace.word_boundaries(name) for name in names])
 
 def _plot_discreate_sequence(feature, title, sample_data, cmap=None):
     ax = plt.subplot2grid((2, 1), (0, 0))
@@ -86,15 +77,15 @@ print("Loading results....")
 names = get_names()
 datas, length = get_datas_and_length(names)
 
-l_results = get_results_of_letter(names, length)
-w_results = get_results_of_word(names, length)
-d_results = get_results_of_duration(names, length)
+iterations, l_results, w_results, d_results = get_results(names)
 
 log_likelihood = np.loadtxt("summary_files/log_likelihood.txt")
 resample_times = np.loadtxt("summary_files/resample_times.txt")
 print("Done!")
 
-train_iter = l_results[0].shape[0]
+# log_likelihood.txt starts with the initial segmentation and resample_times.txt with iteration 1.
+iteration_log_likelihood = log_likelihood[iterations]
+iteration_resample_times = resample_times[iterations - 1]
 
 #%%
 lcolors = ListedColormap([cm.tab20(float(i)/letter_num) for i in range(letter_num)])
@@ -117,13 +108,13 @@ print("Done!")
 #%%
 plt.clf()
 plt.title("Log likelihood")
-plt.plot(range(train_iter+1), log_likelihood, ".-")
+plt.plot(iterations, iteration_log_likelihood, ".-")
 plt.savefig("figures/Log_likelihood.png")
 
 #%%
 plt.clf()
 plt.title("Resample times")
-plt.plot(range(train_iter), resample_times, ".-")
+plt.plot(iterations, iteration_resample_times, ".-")
 plt.savefig("figures/Resample_times.png")
 
 #%%
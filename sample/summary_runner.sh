@@ -1,11 +1,13 @@
 #!/bin/bash
 
 label=sample_results
+force=0
 
-while getopts l: OPT
+while getopts l:f OPT
 do
   case $OPT in
     "l" ) label="${OPTARG}" ;;
+    "f" ) force=1 ;;
   esac
 done
 
@@ -18,6 +20,12 @@ for dir in ${result_dirs}
 do
   echo ${dir}
 
+  # Runs summarized after their last trace write are skipped, -f summarizes all runs.
+  if [ ${force} -eq 0 ] && [ -f ${label}/${dir}/summary_files/Letter_ARI.txt ] \
+     && [ ! ${label}/${dir}/results/trace.idx -nt ${label}/${dir}/summary_files/Letter_ARI.txt ]; then
+    continue
+  fi
+
   rm -f summary_files/*
   rm -f results/*
   rm -f log.txt
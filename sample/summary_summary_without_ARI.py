@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 from pathlib import Path
 import re
+from pyhlm.summary import load_run_summary, stack_curves
 
 #%%
 parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
@@ -19,33 +20,27 @@ Path("figures").mkdir(exist_ok=True)
 Path("summary_files").mkdir(exist_ok=True)
 
 #%%
-print("Initialize variables....")
+print("Loading results....")
+# Per-run curves are cached in <run>/summary_files/summary_cache.npz, see summary_summary.py.
+summaries = [load_run_summary(dir, keys=["resample_times", "log_likelihoods"]) for dir in dirs]
 N = len(dirs)
-tmp = np.loadtxt(dirs[0] / "summary_files/resample_times.txt")
-T = tmp.shape[0]
-
-resample_times  = np.empty((N, T))
-log_likelihoods = np.empty((N, T+1))
-print("Done!")
 
-#%%
-print("Loading results....")
-for i, dir in enumerate(dirs):
-    resample_times[i] = np.loadtxt(dir / "summary_files/resample_times.txt")
-    log_likelihoods[i] = np.loadtxt(dir / "summary_files/log_likelihood.txt")
+# Runs of different lengths are cut to the shortest one.
+resample_times = stack_curves([summary["resample_times"] for summary in summaries])
+log_likelihoods = stack_curves([summary["log_likelihoods"] for summary in summaries])
 print("Done!")
 
 #%%
 print("Ploting...")
 plt.clf()
-plt.errorbar(range(T), resample_times.mean(axis=0), yerr=resample_times.std(axis=0))
+plt.errorbar(np.arange(1, resample_times.shape[1] + 1), resample_times.mean(axis=0), yerr=resample_times.std(axis=0))
 plt.xlabel("Iteration")
 plt.ylabel("Execution time [sec]")
 plt.title("Transitions of the execution time")
 plt.savefig("figures/summary_of_execution_time.png")
 
 plt.clf()
-plt.errorbar(range(T+1), log_likelihoods.mean(axis=0), yerr=log_likelihoods.std(axis=0))
+plt.errorbar(np.arange(log_likelihoods.shape[1]), log_likelihoods.mean(axis=0), yerr=log_likelihoods.std(axis=0))
 plt.xlabel("Iteration")
 plt.ylabel("Log likelihood")
 plt.title("Transitions of the log likelihood")
@@ -0,0 +1,49 @@
+import numpy as np
+import pyhsmm
+from pytest import fixture
+
+from pyhlm.model import WeakLimitHDPHLM
+from pyhlm.word_model import LetterHSMM
+
+
+def build_model(letter_num=4, word_num=3, observation_dim=2, seed=0, words=None):
+    np.random.seed(seed)
+    letter_obs_distns = [pyhsmm.distributions.Gaussian(mu_0=np.zeros(observation_dim), sigma_0=np.identity(observation_dim), kappa_0=0.01, nu_0=observation_dim + 5)
+                         for _ in range(letter_num)]
+    for i, obs_distn in enumerate(letter_obs_distns):
+        # Letters spread on a circle, well apart from each other.
+        obs_distn.mu = np.zeros(observation_dim)
+        obs_distn.mu[:2] = 3.0 * np.array([np.cos(2 * np.pi * i / letter_num), np.sin(2 * np.pi * i / letter_num)])
+        obs_distn.sigma = 0.5 * np.identity(observation_dim)
+    letter_dur_distns = [pyhsmm.distributions.PoissonDuration(alpha_0=20, beta_0=5) for _ in range(letter_num)]
+    dur_distns = [pyhsmm.distributions.PoissonDuration(lmbda=20) for _ in range(word_num)]
+    length_distn = pyhsmm.distributions.PoissonDuration(alpha_0=30, beta_0=10)
+    letter_hsmm = LetterHSMM(alpha=10, gamma=10, init_state_concentration=10, obs_distns=letter_obs_distns, dur_distns=letter_dur_distns)
+    model = WeakLimitHDPHLM(num_states=word_num, alpha=10, gamma=10, init_state_concentration=10,
+                            letter_hsmm=letter_hsmm, dur_distns=dur_distns, length_distn=length_distn)
+    if words is not None:
+        model.word_list = [tuple(word) for word in words]
+        model.resample_dur_distns()
+    return model
+
+
+def generate_data(model, num_words, seed=0, letter_duration=4):
+    # Frames of num_words random words of model.word_list, with their word and letter labels.
+    rng = np.random.RandomState(seed)
+    words = rng.randint(model.num_states, size=num_words)
+    letters = np.concatenate([model.word_list[word] for word in words])
+    durations = rng.randint(letter_duration - 1, letter_duration + 2, size=len(letters))
+    mus = np.array([obs_distn.mu for obs_distn in model.letter_obs_distns])
+    data = mus[np.repeat(letters, durations)] + 0.3 * rng.randn(durations.sum(), mus.shape[1])
+    word_durations = np.add.reduceat(durations, np.cumsum([0] + [len(model.word_list[word]) for word in words[:-1]]))
+    return data, np.repeat(words, word_durations), np.repeat(letters, durations)
+
+
+@fixture
+def model():
+    return build_model(words=[(0, 1), (2,), (3, 0, 2)])
+
+
+@fixture
+def datas(model):
+    return [generate_data(model, 4, seed=i)[0] for i in range(2)]
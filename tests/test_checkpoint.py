@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+from pyhlm.checkpoint import load_checkpoint, load_checkpoint_info, save_checkpoint
+
+
+def _trained(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    model.resample_states()
+    model.resample_model()
+    return model
+
+
+def _run(model, iterations):
+    out = []
+    for _ in range(iterations):
+        model.resample_model()
+        out.append((list(model.word_list), [state.stateseq.copy() for state in model.states_list],
+                    [state.letter_stateseq.copy() for state in model.states_list], model.log_likelihood()))
+    return out
+
+
+def _assert_same(runs, other_runs):
+    for (words, stateseqs, letter_stateseqs, loglike), (other_words, other_stateseqs, other_letter_stateseqs, other_loglike) in zip(runs, other_runs):
+        assert words == other_words
+        for a, b in zip(stateseqs + letter_stateseqs, other_stateseqs + other_letter_stateseqs):
+            assert np.array_equal(a, b)
+        assert loglike == other_loglike
+
+
+def test_resume_is_exact(model, datas, tmp_path):
+    path = str(tmp_path / "checkpoint")
+    _trained(model, datas)
+    save_checkpoint(model, path, info={"iteration": 1})
+    expected = _run(model, 2)
+
+    resumed = load_checkpoint(path)
+    assert load_checkpoint_info(path) == {"iteration": 1}
+    _assert_same(_run(resumed, 2), expected)
+
+    mapped = load_checkpoint(path, mmap_data=True)
+    assert isinstance(mapped.states_list[0].data, np.memmap)
+    _assert_same(_run(mapped, 2), expected)
+
+
+def test_data_is_linked_to_the_previous_checkpoint(model, datas, tmp_path):
+    path = str(tmp_path / "checkpoint")
+    _trained(model, datas)
+    save_checkpoint(model, path)
+    inode = os.stat(os.path.join(path, "data.npy")).st_ino
+    model.resample_model()
+    save_checkpoint(model, path)
+    assert os.stat(os.path.join(path, "data.npy")).st_ino == inode
+
+
+def test_failed_link_writes_a_new_file(model, datas, tmp_path, monkeypatch):
+    path = str(tmp_path / "checkpoint")
+    _trained(model, datas)
+    save_checkpoint(model, path)
+    previous = str(tmp_path / "previous.npy")
+    os.link(os.path.join(path, "data.npy"), previous)
+    # data.npy links, lengths.npy does not.
+    link = os.link
+    calls = []
+    def failing_link(src, dst):
+        calls.append(dst)
+        if len(calls) > 1:
+            raise OSError("cross-device link")
+        link(src, dst)
+    monkeypatch.setattr(os, "link", failing_link)
+    save_checkpoint(model, path)
+
+    assert len(calls) == 2
+    assert os.stat(os.path.join(path, "data.npy")).st_ino != os.stat(previous).st_ino
+    expected = np.concatenate([state.data for state in model.states_list])
+    assert np.array_equal(np.load(previous), expected)
+    assert np.array_equal(np.load(os.path.join(path, "data.npy")), expected)
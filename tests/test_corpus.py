@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+
+from pyhlm.corpus import Corpus, load_corpus
+
+
+def _write(data_dir, name, data):
+    np.savetxt(str(data_dir / (name + ".txt")), data)
+
+
+def test_corpus_round_trip(tmp_path):
+    rng = np.random.RandomState(0)
+    datas = {name: rng.randn(length, 3) for name, length in (("a", 5), ("b", 1), ("c", 8))}
+    for name, data in datas.items():
+        _write(tmp_path, name, data)
+    corpus = load_corpus(["a", "b", "c"], data_dir=str(tmp_path), num_procs=2)
+    assert isinstance(corpus.data, np.memmap)
+    for i, (name, data) in enumerate(datas.items()):
+        assert np.allclose(corpus[name], data)
+        assert np.array_equal(corpus[i], corpus[name])
+    assert [len(data) for data in corpus.datas()] == [5, 1, 8]
+
+
+def test_cache_is_rebuilt_when_a_source_changes(tmp_path):
+    _write(tmp_path, "a", np.zeros((4, 2)))
+    _write(tmp_path, "b", np.ones((3, 2)))
+    prefix = str(tmp_path / ".corpus")
+    load_corpus(["a", "b"], data_dir=str(tmp_path))
+    built = os.stat(prefix + ".bin").st_mtime_ns
+
+    # Unchanged sources reuse the cache.
+    assert np.array_equal(load_corpus(["a", "b"], data_dir=str(tmp_path))["b"], np.ones((3, 2)))
+    assert os.stat(prefix + ".bin").st_mtime_ns == built
+
+    # Same size, new mtime.
+    stat = os.stat(str(tmp_path / "a.txt"))
+    _write(tmp_path, "a", np.full((4, 2), 2.0))
+    assert os.stat(str(tmp_path / "a.txt")).st_size == stat.st_size
+    os.utime(str(tmp_path / "a.txt"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert np.array_equal(load_corpus(["a", "b"], data_dir=str(tmp_path))["a"], np.full((4, 2), 2.0))
+
+    # New size, same mtime.
+    stat = os.stat(str(tmp_path / "b.txt"))
+    _write(tmp_path, "b", np.ones((5, 2)))
+    os.utime(str(tmp_path / "b.txt"), ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(load_corpus(["a", "b"], data_dir=str(tmp_path))["b"]) == 5
+
+    # Another list of names.
+    assert Corpus(prefix).names == ["a", "b"]
+    assert load_corpus(["b"], data_dir=str(tmp_path)).names == ["b"]
@@ -0,0 +1,54 @@
+import numpy as np
+import pyhsmm
+
+from pyhlm.decimation import CoarseToFine, block_sizes, pool_boundaries, pool_frames, rescale_durations
+
+
+def test_pool_frames():
+    assert block_sizes(10, 3).tolist() == [3, 3, 3, 1]
+    assert pool_frames(np.arange(10.0)[:, None], 3).ravel().tolist() == [1.0, 4.0, 7.0, 9.0]
+    assert pool_boundaries([0, 0, 1, 0, 0, 0, 0, 1, 0, 1], 3).tolist() == [True, False, True, True]
+
+
+def test_rescale_durations_scales_mean_duration():
+    dur_distn = pyhsmm.distributions.PoissonDuration(alpha_0=20, beta_0=5, lmbda=7.0)
+    rescale_durations([dur_distn], 0.5)
+    # 1 + lmbda is the mean duration.
+    assert np.isclose(1 + dur_distn.lmbda, 4.0)
+    assert np.isclose(1 + dur_distn.alpha_0 / dur_distn.beta_0, 2.5)
+    rescale_durations([dur_distn], 2.0)
+    assert np.isclose(dur_distn.lmbda, 7.0)
+    assert np.isclose(dur_distn.alpha_0 / dur_distn.beta_0, 4.0)
+
+
+def test_rescale_durations_stays_positive():
+    dur_distn = pyhsmm.distributions.PoissonDuration(alpha_0=20, beta_0=5, lmbda=1.0)
+    rescale_durations([dur_distn], 0.25)
+    assert dur_distn.lmbda > 0
+    assert dur_distn.beta_0 > 0
+
+
+def test_coarse_to_fine(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    seen = []
+    CoarseToFine(model, [(2, 2)]).run(callback=lambda model, factor, itr: seen.append((factor, itr, model.states_list[0].T)))
+    assert seen == [(2, 0, -(-len(datas[0]) // 2)), (2, 1, -(-len(datas[0]) // 2))]
+    for state, data in zip(model.states_list, datas):
+        assert state.T == len(data)
+        assert len(state.stateseq) == len(data) and len(state.letter_stateseq) == len(data)
+        assert state.durations_censored.sum() == len(data)
+
+
+def test_letters_are_refit_on_full_resolution_frames(model, datas, monkeypatch):
+    import pyhlm.word_model
+    for data in datas:
+        model.add_data(data, generate=False)
+    lengths = []
+    letter_statistics = pyhlm.word_model.letter_statistics
+    def recording_letter_statistics(data, stateseq, segs, num_states):
+        lengths.append(len(data))
+        return letter_statistics(data, stateseq, segs, num_states)
+    monkeypatch.setattr(pyhlm.word_model, "letter_statistics", recording_letter_statistics)
+    CoarseToFine(model, [(2, 1)]).run()
+    assert lengths == [-(-len(data) // 2) for data in datas] + [len(data) for data in datas]
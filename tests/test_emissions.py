@@ -0,0 +1,41 @@
+import numpy as np
+import pyhsmm
+
+from pyhlm.internals.emissions import letter_log_likelihoods
+
+
+def _gaussians(rng, P, D):
+    obs_distns = []
+    for _ in range(P):
+        A = rng.randn(D, D)
+        obs_distns.append(pyhsmm.distributions.Gaussian(mu=rng.randn(D), sigma=A.dot(A.T) + np.identity(D)))
+    return obs_distns
+
+
+def test_gaussian_table_matches_each_distribution():
+    rng = np.random.RandomState(0)
+    obs_distns = _gaussians(rng, 5, 3)
+    data = rng.randn(40, 3)
+    data[7, 1] = np.nan
+    expected = np.array([obs_distn.log_likelihood(data) for obs_distn in obs_distns]).T
+    expected[7] = 0.0
+    assert np.allclose(letter_log_likelihoods(data, obs_distns), expected)
+    out = np.empty((40, 5))
+    assert letter_log_likelihoods(data, obs_distns, chunksize=7, out=out) is out
+    assert np.allclose(out, expected)
+
+
+class Laplace(object):
+    def __init__(self, mu):
+        self.mu = mu
+
+    def log_likelihood(self, x):
+        return -np.abs(x - self.mu).sum(axis=1) - len(self.mu) * np.log(2)
+
+
+def test_other_distributions_fall_back_to_log_likelihood():
+    rng = np.random.RandomState(1)
+    obs_distns = _gaussians(rng, 2, 2) + [Laplace(np.ones(2))]
+    data = rng.randn(10, 2)
+    expected = np.array([obs_distn.log_likelihood(data) for obs_distn in obs_distns]).T
+    assert np.allclose(letter_log_likelihoods(data, obs_distns), expected)
@@ -0,0 +1,57 @@
+import numpy as np
+from pytest import mark
+from sklearn.metrics import adjusted_rand_score, f1_score
+
+from pyhlm.evaluation import ContingencyTable, adjusted_rand_index, contingency_table, evaluate, f1_scores
+
+
+def _convert_label(truth, predict, N):
+    # The scoring of the summary scripts.
+    converted_label = np.full_like(truth, N)
+    for true_lab in range(N):
+        counted = [np.sum(predict[truth == true_lab] == pred) for pred in range(N)]
+        pred_lab = np.argmax(counted)
+        converted_label[predict == pred_lab] = true_lab
+    return converted_label
+
+
+def _runs(rng, T, N):
+    labels = rng.randint(N, size=T)
+    return np.repeat(labels, rng.randint(1, 5, size=T))
+
+
+@mark.parametrize("seed", range(5))
+def test_scores_match_sklearn(seed):
+    rng = np.random.RandomState(seed)
+    N = 4
+    truth = _runs(rng, 40, N)
+    predict = rng.randint(N + 2, size=len(truth))
+    true_labels, pred_labels, counts = contingency_table(truth, predict)
+    assert np.isclose(adjusted_rand_index(counts), adjusted_rand_score(truth, predict))
+
+    converted = _convert_label(truth, predict, N)
+    labels = np.unique(converted)
+    macro, micro = f1_scores(true_labels, pred_labels, counts, N)
+    assert np.isclose(macro, f1_score(truth, converted, labels=labels, average="macro"))
+    assert np.isclose(micro, f1_score(truth, converted, labels=labels, average="micro"))
+
+
+def test_identical_labelings():
+    truth = np.array([0, 0, 1, 1, 2])
+    scores = evaluate(truth, np.array([5, 5, 3, 3, 4]), 3)
+    assert scores["ARI"] == 1.0
+    assert np.isclose(adjusted_rand_index(contingency_table(truth, truth)[2]), 1.0)
+
+
+def test_run_length_encoded_table_matches_frames():
+    rng = np.random.RandomState(0)
+    frames, runs = ContingencyTable(), ContingencyTable()
+    for _ in range(3):
+        true_durations = rng.randint(1, 6, size=8)
+        true_labels = rng.randint(3, size=8)
+        pred_durations = np.diff(np.concatenate(([0], np.sort(rng.choice(np.arange(1, true_durations.sum()), 5, replace=False)), [true_durations.sum()])))
+        pred_labels = rng.randint(4, size=len(pred_durations))
+        frames.add(np.repeat(true_labels, true_durations), np.repeat(pred_labels, pred_durations))
+        runs.add_rle(true_labels, true_durations, pred_labels, pred_durations)
+    for expected, table in zip(frames.table(), runs.table()):
+        assert np.array_equal(expected, table)
@@ -0,0 +1,48 @@
+import numpy as np
+from pytest import raises
+
+from pyhlm.inference import InferenceModel, export_model
+from pyhlm.model import SegmentationMixin
+
+
+def _trained(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    model.resample_states()
+    model.resample_model()
+    return model
+
+
+def test_exported_model_segments_like_the_trained_model(model, datas, tmp_path):
+    _trained(model, datas)
+    model.export(str(tmp_path / "exported"), keep_unused=True)
+    inference_model = InferenceModel.load(str(tmp_path / "exported"))
+    assert isinstance(inference_model, SegmentationMixin)
+    assert isinstance(inference_model.arrays["trans_matrix"], np.memmap)
+
+    expected = model.segment(datas, mode="viterbi")
+    segmentations = inference_model.segment(datas, mode="viterbi")
+    for seg, exp in zip(segmentations, expected):
+        assert np.array_equal(inference_model.original_words(seg.words), exp.words)
+        assert np.array_equal(seg.durations, exp.durations)
+        assert np.array_equal(inference_model.original_letters(seg.letters), exp.letters)
+        assert np.array_equal(seg.letter_durations, exp.letter_durations)
+        # The bigram is renormalized over the kept words, which are all of them here.
+        assert np.isclose(seg.normalizer, exp.normalizer)
+
+
+def test_export_drops_unused_words(model, datas, tmp_path):
+    _trained(model, datas)
+    export_model(model, str(tmp_path / "exported"))
+    inference_model = InferenceModel.load(str(tmp_path / "exported"), mmap=False)
+    assert inference_model.arrays["word_ids"].tolist() == np.flatnonzero(model.word_counts()).tolist()
+    assert np.allclose(inference_model.arrays["trans_matrix"].sum(axis=1), 1.0)
+    for seg in inference_model.segment(datas, mode="sample", num_procs=2):
+        assert seg.durations.sum() == seg.letter_durations.sum()
+
+
+def test_export_without_used_words(model, datas, tmp_path):
+    _trained(model, datas)
+    model.word_counts = lambda: np.zeros(model.num_states, dtype=np.int32)
+    with raises(ValueError, match="keep_unused"):
+        export_model(model, str(tmp_path / "exported"))
@@ -0,0 +1,190 @@
+import itertools
+
+import numpy as np
+from pytest import mark, raises
+
+from pyhlm.internals.hlm_states import WeakLimitHDPHLMStates, WeakLimitHDPHLMStatesPython
+
+
+def _viterbi(model, data, states_class, **kwargs):
+    state = states_class(model, data, generate=False, **kwargs)
+    score = state.Viterbi()
+    return score, state.stateseq.copy(), state.letter_stateseq.copy()
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+@mark.parametrize("min_word_mass", [0.3, 1.0])
+def test_min_word_mass_keeps_the_exact_mode(model, datas, states_class, min_word_mass):
+    # Word 2 is rarely entered, but only it spells letter 3 of the last utterance.
+    model.trans_distn.trans_matrix[:] = [[0.05, 0.9, 0.05], [0.9, 0.05, 0.05], [0.45, 0.5, 0.05]]
+    model.init_state_distn.pi_0[:] = [0.5, 0.45, 0.05]
+    mus = np.array([obs_distn.mu for obs_distn in model.letter_obs_distns])
+    rng = np.random.RandomState(0)
+    datas = datas + [mus[np.repeat([0, 1, 3, 0, 2, 2], 4)] + 0.3 * rng.randn(24, 2)]
+    for data in datas:
+        expected = _viterbi(model, data, states_class)
+        assert 2 in states_class(model, data, generate=False, min_word_mass=min_word_mass).bounded_states
+        score, stateseq, letter_stateseq = _viterbi(model, data, states_class, min_word_mass=min_word_mass)
+        assert np.isclose(score, expected[0])
+        assert np.array_equal(stateseq, expected[1])
+        assert np.array_equal(letter_stateseq, expected[2])
+    assert 2 in expected[1]
+
+
+def test_min_word_mass_keeps_the_exact_normalizer(model, datas):
+    state = WeakLimitHDPHLMStates(model, datas[0], generate=False)
+    _, _, normalizer = state.messages_backwards()
+    state = WeakLimitHDPHLMStates(model, datas[0], generate=False, min_word_mass=1.0)
+    assert np.isclose(state.messages_backwards()[2], normalizer)
+    state.resample()
+    assert np.isclose(state.log_likelihood(), normalizer)
+
+
+def _compositions(T, parts):
+    # All ways to cut T frames into parts non-empty runs.
+    if parts == 1:
+        yield (T,)
+        return
+    for first in range(1, T - parts + 2):
+        for rest in _compositions(T - first, parts - 1):
+            yield (first,) + rest
+
+
+def _brute_force_mode(state):
+    # Best score over all word and letter segmentations of the utterance.
+    model = state.model
+    aBl, alDl, aDl = state.aBl, state.alDl, state.aDl
+    log_pi_0, log_trans_matrix = np.log(state.pi_0), state.log_trans_matrix
+    cum_aBl = np.vstack((np.zeros(aBl.shape[1]), np.cumsum(aBl, axis=0)))
+    best = (-np.inf, None, None)
+
+    def word_score(word, t, duration):
+        scores = []
+        for letter_durations in _compositions(duration, len(word)) if duration >= len(word) else []:
+            ends = t + np.cumsum(letter_durations)
+            score = sum(cum_aBl[end, l] - cum_aBl[end - d, l] + alDl[d - 1, l] for l, d, end in zip(word, letter_durations, ends))
+            scores.append((score, np.repeat(word, letter_durations)))
+        return max(scores, key=lambda x: x[0]) if scores else (-np.inf, None)
+
+    for num_words in range(1, state.T + 1):
+        for durations in _compositions(state.T, num_words):
+            for words in itertools.product(range(model.num_states), repeat=num_words):
+                score = log_pi_0[words[0]] + sum(log_trans_matrix[a, b] for a, b in zip(words[:-1], words[1:]))
+                letters, t = [], 0
+                for word, duration in zip(words, durations):
+                    internal, letter_stateseq = word_score(model.word_list[word], t, duration)
+                    score += internal + aDl[duration - 1, word]
+                    letters.append(letter_stateseq)
+                    t += duration
+                if score > best[0]:
+                    best = (score, np.repeat(words, durations), np.concatenate(letters))
+    return best
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+def test_viterbi_is_the_brute_force_mode(model, states_class):
+    for dur_distn in model.dur_distns:
+        dur_distn.lmbda = 3
+    mus = np.array([obs_distn.mu for obs_distn in model.letter_obs_distns])
+    rng = np.random.RandomState(3)
+    data = mus[[0, 0, 1, 2, 3, 0, 2]] + 0.5 * rng.randn(7, 2)
+    state = states_class(model, data, generate=False)
+    score = state.Viterbi()
+    expected_score, stateseq, letter_stateseq = _brute_force_mode(state)
+    assert np.isclose(score, expected_score)
+    assert np.array_equal(state.stateseq, stateseq)
+    assert np.array_equal(state.letter_stateseq, letter_stateseq)
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+def test_beam_normalizer_error(model, datas, states_class):
+    exact = states_class(model, datas[0], generate=False).messages_backwards()[2]
+    wide = states_class(model, datas[0], generate=False, beam=1e6)
+    assert np.isclose(wide.messages_backwards()[2], exact)
+
+    narrow = states_class(model, datas[0], generate=False, beam=1.0)
+    stats = narrow.beam_statistics()
+    # Pruning only drops paths, so the beam normalizer is a lower bound.
+    # A wide beam only skips the words too long for the frames left.
+    assert stats["pruned_fraction"] > wide.pruned_fraction
+    assert -1.0 < stats["normalizer_error"] <= 1e-9
+    assert np.isclose(narrow.messages_backwards()[2], exact + stats["normalizer_error"])
+
+
+def test_beam_kernels_agree(model, datas):
+    python = WeakLimitHDPHLMStates(model, datas[0], generate=False, beam=1.0)
+    betal, betastarl, normalizer = python.messages_backwards_python()
+    pruned = python._pruned.copy()
+    native = WeakLimitHDPHLMStates(model, datas[0], generate=False, beam=1.0)
+    assert np.isclose(native.messages_backwards()[2], normalizer)
+    assert np.array_equal(native._pruned, pruned)
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+def test_emission_beam(model, datas, states_class):
+    exact = states_class(model, datas[0], generate=False)
+    normalizer = exact.messages_backwards()[2]
+    score = exact.Viterbi()
+
+    state = states_class(model, datas[0], generate=False, emission_beam=5.0)
+    aBl = state.lattice_aBl
+    assert np.isinf(aBl).any()
+    assert (aBl.max(axis=1) == exact.lattice_aBl.max(axis=1)).all()
+    # The letters of the clean data are within the beam, the best path is kept.
+    assert np.isclose(state.Viterbi(), score)
+    assert np.array_equal(state.stateseq, exact.stateseq)
+    assert state.messages_backwards()[2] <= normalizer
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+def test_emission_beam_without_a_path_falls_back(model, datas, states_class):
+    # Only word 2 spells letter 3, followed by letters 0 and 2. With the best letter of
+    # every frame only, no word sequence fits the data.
+    mus = np.array([obs_distn.mu for obs_distn in model.letter_obs_distns])
+    data = mus[np.repeat([0, 1, 3], 4)]
+    exact = states_class(model, data, generate=False)
+    normalizer = exact.messages_backwards()[2]
+    score = exact.Viterbi()
+
+    state = states_class(model, data, generate=False, emission_beam=0.0)
+    assert state.messages_backwards()[2] == -np.inf
+    assert np.isclose(state.Viterbi(), score)
+    state.resample()
+    assert np.isclose(state.log_likelihood(), normalizer)
+
+
+def _ends(durations):
+    return np.cumsum(durations) - 1
+
+
+@mark.parametrize("states_class", [WeakLimitHDPHLMStatesPython, WeakLimitHDPHLMStates])
+def test_boundary_masks(model, datas, states_class):
+    data = datas[0]
+    T = len(data)
+    word_boundaries = np.zeros(T, dtype=bool)
+    word_boundaries[5::6] = True
+    letter_boundaries = np.zeros(T, dtype=bool)
+    letter_boundaries[2::3] = True
+
+    state = states_class(model, data, generate=False, word_boundaries=word_boundaries, letter_boundaries=letter_boundaries)
+    assert state.word_ends[-1] and state.letter_ends[word_boundaries].all()
+    state.Viterbi()
+    assert state.word_ends[_ends(state.durations_censored)].all()
+    assert state.letter_ends[_ends(state.letter_durations)].all()
+    np.random.seed(0)
+    state.resample()
+    state.sample_letter_stateseq()
+    assert state.word_ends[_ends(state.durations_censored)].all()
+    assert state.letter_ends[_ends(state.letter_durations)].all()
+
+    normalizer = state.messages_backwards()[2]
+    assert normalizer < state.unconstrained().messages_backwards()[2]
+    if states_class is WeakLimitHDPHLMStates:
+        assert np.isclose(state.messages_backwards_python()[2], normalizer)
+    everywhere = states_class(model, data, generate=False, word_boundaries=np.ones(T, dtype=bool))
+    assert np.isclose(everywhere.messages_backwards()[2], state.unconstrained().messages_backwards()[2])
+
+
+def test_boundary_masks_need_one_entry_per_frame(model, datas):
+    with raises(ValueError, match="one entry per frame"):
+        WeakLimitHDPHLMStates(model, datas[0], generate=False, word_boundaries=np.ones(3, dtype=bool))
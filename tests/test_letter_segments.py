@@ -0,0 +1,122 @@
+import itertools
+
+import numpy as np
+from pytest import mark
+from scipy.special import logsumexp
+
+from pyhlm.internals.internal_hsmm_states import LetterHSMMStatesEigen, LetterHSMMStatesPython, letter_duration_survival
+
+
+def _segment_tables(model, data):
+    hlmstate = model._states_class(model, data, generate=False)
+    return hlmstate.aBl, hlmstate.alDl, letter_duration_survival(model.letter_dur_distns, len(data))
+
+
+def _exact_distribution(letter_hsmm, aBl, alDl, alDsl, letter_ends=None):
+    # Probability of every letter sequence of one segment, the last letter right-censored.
+    T, P = aBl.shape
+    log_pi_0 = np.log(letter_hsmm.init_state_distn.pi_0)
+    log_trans_matrix = np.log(letter_hsmm.trans_distn.trans_matrix)
+    stateseqs, scores = [], []
+    for stateseq in itertools.product(range(P), repeat=T):
+        stateseq = np.array(stateseq)
+        ends = np.flatnonzero(np.diff(stateseq)) + 1
+        if letter_ends is not None and not all(letter_ends[end - 1] for end in ends):
+            continue
+        letters = stateseq[np.concatenate(([0], ends))]
+        durations = np.diff(np.concatenate(([0], ends, [T])))
+        score = log_pi_0[letters[0]] + log_trans_matrix[letters[:-1], letters[1:]].sum()
+        score += aBl[np.arange(T), stateseq].sum()
+        score += alDl[durations[:-1] - 1, letters[:-1]].sum()
+        # P(D >= d) of the last letter.
+        score += np.logaddexp(alDl[durations[-1] - 1, letters[-1]], alDsl[durations[-1] - 1, letters[-1]])
+        stateseqs.append(stateseq)
+        scores.append(score)
+    scores = np.array(scores)
+    return np.array(stateseqs), np.exp(scores - logsumexp(scores)), logsumexp(scores)
+
+
+def _marginals(stateseqs, weights, P):
+    return np.array([[weights[stateseqs[:, t] == p].sum() for p in range(P)] for t in range(stateseqs.shape[1])])
+
+
+@mark.parametrize("states_class", [LetterHSMMStatesPython, LetterHSMMStatesEigen])
+def test_batched_segments_match_pyhsmm(model, states_class):
+    letter_hsmm = model.letter_hsmm
+    rng = np.random.RandomState(0)
+    data = 0.3 * rng.randn(9, 2)
+    aBl, alDl, alDsl = _segment_tables(model, data)
+    segs = np.array([0, 4, 9], dtype=np.int32)
+
+    _, normalizers = states_class.sample_segments(letter_hsmm, aBl, alDl, alDsl, segs, len(data))
+    for s0, s1, normalizer in zip(segs[:-1], segs[1:], normalizers):
+        letter_hsmm.add_data(data[s0:s1])
+        letter_state = letter_hsmm.states_list.pop()
+        assert np.isclose(normalizer, letter_state.log_likelihood())
+        _, _, exact_normalizer = _exact_distribution(letter_hsmm, aBl[s0:s1], alDl[:s1-s0], alDsl[:s1-s0])
+        assert np.isclose(normalizer, exact_normalizer)
+
+
+@mark.parametrize("states_class", [LetterHSMMStatesPython, LetterHSMMStatesEigen])
+def test_batched_segments_sample_the_exact_distribution(model, states_class):
+    letter_hsmm = model.letter_hsmm
+    rng = np.random.RandomState(1)
+    data = 0.3 * rng.randn(5, 2)
+    aBl, alDl, alDsl = _segment_tables(model, data)
+    stateseqs, probs, _ = _exact_distribution(letter_hsmm, aBl, alDl, alDsl)
+    exact = _marginals(stateseqs, probs, letter_hsmm.num_states)
+
+    np.random.seed(0)
+    segs = np.array([0, 5], dtype=np.int32)
+    draws = np.array([states_class.sample_segments(letter_hsmm, aBl, alDl, alDsl, segs, 5)[0].copy() for _ in range(3000)])
+    assert np.abs(_marginals(draws, np.full(len(draws), 1.0 / len(draws)), letter_hsmm.num_states) - exact).max() < 0.04
+
+    letter_hsmm.add_data(data)
+    letter_state = letter_hsmm.states_list.pop()
+    pyhsmm_draws = []
+    for _ in range(3000):
+        letter_state.resample()
+        pyhsmm_draws.append(letter_state.stateseq.copy())
+    assert np.abs(_marginals(np.array(pyhsmm_draws), np.full(3000, 1.0 / 3000), letter_hsmm.num_states) - exact).max() < 0.04
+
+
+@mark.parametrize("states_class", [LetterHSMMStatesPython, LetterHSMMStatesEigen])
+def test_batched_segments_respect_letter_boundaries(model, states_class):
+    letter_hsmm = model.letter_hsmm
+    rng = np.random.RandomState(2)
+    data = 0.3 * rng.randn(10, 2)
+    aBl, alDl, alDsl = _segment_tables(model, data)
+    # Letters may only end at frames 2, 4 (the segment end) and 9.
+    letter_ends = np.zeros(10, dtype=np.int32)
+    letter_ends[[2, 4, 9]] = 1
+    segs = np.array([0, 5, 10], dtype=np.int32)
+
+    _, normalizers = states_class.sample_segments(letter_hsmm, aBl, alDl, alDsl, segs, 10, letter_ends)
+    _, _, exact_normalizer = _exact_distribution(letter_hsmm, aBl[:5], alDl[:5], alDsl[:5], letter_ends[:5])
+    assert np.isclose(normalizers[0], exact_normalizer)
+
+    np.random.seed(0)
+    for _ in range(200):
+        stateseq, _ = states_class.sample_segments(letter_hsmm, aBl, alDl, alDsl, segs, 10, letter_ends)
+        ends = np.flatnonzero(np.diff(stateseq)) + 1
+        assert all(letter_ends[end - 1] or end in segs for end in ends)
+
+
+def test_training_respects_letter_boundaries(model, datas):
+    data = datas[0]
+    letter_boundaries = np.zeros(len(data), dtype=bool)
+    letter_boundaries[2::3] = True
+    model.add_data(data, generate=False, letter_boundaries=letter_boundaries)
+    model.resample_states()
+    for _ in range(2):
+        model.resample_model()
+        state = model.states_list[0]
+        state.sample_letter_stateseq()
+        ends = np.cumsum(state.letter_durations)[:-1] - 1
+        assert state.letter_ends[ends].all()
+        model.letter_hsmm.states_list = []
+        state.add_word_datas(generate=False)
+        model.letter_hsmm.resample_states_by_segments()
+        ends = np.flatnonzero(np.diff(state.letter_stateseq))
+        word_ends = np.cumsum(state.durations_censored) - 1
+        assert all(state.letter_ends[end] or end in word_ends for end in ends)
@@ -0,0 +1,104 @@
+import copy
+
+import numpy as np
+
+from pyhlm.internals.statistics import gaussian_natural_statistics, letter_statistics, reduce_letter_statistics
+from pyhsmm.util.general import rle
+
+
+def _segmented(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    model.resample_states()
+    model.letter_hsmm.states_list = []
+    for state in model.states_list:
+        state.add_word_datas(generate=False)
+    model.letter_hsmm.resample_states_by_segments()
+    return model
+
+
+def _frame_statistics(x):
+    D = x.shape[1]
+    out = np.zeros((D + 2, D + 2))
+    out[:D, :D] = x.T.dot(x)
+    out[-2, :D] = out[:D, -2] = x.sum(0)
+    out[-2, -2] = out[-1, -1] = len(x)
+    return out
+
+
+def test_letter_statistics_match_the_frames():
+    rng = np.random.RandomState(0)
+    data = rng.randn(12, 2)
+    stateseq = np.array([0, 0, 1, 1, 1, 0, 0, 2, 2, 2, 2, 0])
+    segs = np.array([0, 6, 12])
+    n, sumx, sumxxT, dur_n, dur_tot = reduce_letter_statistics([letter_statistics(data, stateseq, segs, 3)] * 2, 3, 2)
+    for state in range(3):
+        x = data[stateseq == state]
+        assert n[state] == 2 * len(x)
+        assert np.allclose(sumx[state], 2 * x.sum(0))
+        assert np.allclose(sumxxT[state], 2 * x.T.dot(x))
+    # The word boundary at 6 splits the run of letter 0 over frames 5 and 6.
+    assert dur_n.tolist() == [2 * 4, 2 * 1, 2 * 1]
+    assert dur_tot.tolist() == [2 * 5.0, 2 * 3.0, 2 * 4.0]
+    stats = gaussian_natural_statistics(n[0], sumx[0], sumxxT[0])
+    assert np.allclose(stats, _frame_statistics(np.concatenate([data[stateseq == 0]] * 2)))
+
+
+def test_nan_frames_are_left_out_of_the_gaussian_statistics():
+    rng = np.random.RandomState(0)
+    data = rng.randn(12, 2)
+    data[[1, 8]] = np.nan
+    data[3, 0] = np.nan
+    observed = np.ones(12, dtype=bool)
+    observed[[1, 3, 8]] = False
+    stateseq = np.array([0, 0, 1, 1, 1, 0, 0, 2, 2, 2, 2, 0])
+    n, sumx, sumxxT, dur_n, dur_tot = letter_statistics(data, stateseq, np.array([0, 6, 12]), 3)
+    for state in range(3):
+        stats = gaussian_natural_statistics(n[state], sumx[state], sumxxT[state])
+        assert np.allclose(stats, _frame_statistics(data[observed & (stateseq == state)]))
+    assert dur_tot.tolist() == [5.0, 3.0, 4.0]
+
+
+def test_update_from_statistics_matches_update_from_frames(model, datas):
+    letter_hsmm = _segmented(model, datas).letter_hsmm
+    obs_distns = copy.deepcopy(letter_hsmm.obs_distns)
+    dur_distns = copy.deepcopy(letter_hsmm.dur_distns)
+
+    frames = [[] for _ in obs_distns]
+    durations = [[] for _ in dur_distns]
+    for state in model.states_list:
+        for letter in range(len(obs_distns)):
+            frames[letter].append(state.data[state.letter_stateseq == letter])
+        ends = np.cumsum(state.durations_censored)
+        for start, end in zip(np.append(0, ends[:-1]), ends):
+            labels, letter_durations = rle(state.letter_stateseq[start:end])
+            for letter, duration in zip(labels, letter_durations):
+                durations[letter].append(duration)
+
+    np.random.seed(1)
+    letter_hsmm.resample_obs_and_dur_distns_by_statistics()
+    np.random.seed(1)
+    for obs_distn, x in zip(obs_distns, frames):
+        obs_distn.resample(np.concatenate(x))
+    for dur_distn, d in zip(dur_distns, durations):
+        dur_distn.resample(np.array(d, dtype=np.int64))
+
+    for obs_distn, expected in zip(letter_hsmm.obs_distns, obs_distns):
+        assert np.allclose(obs_distn.mu, expected.mu)
+        assert np.allclose(obs_distn.sigma, expected.sigma)
+        # The prior is not changed by the update.
+        assert np.array_equal(obs_distn.mu_0, expected.mu_0) and obs_distn.nu_0 == expected.nu_0
+    for dur_distn, expected in zip(letter_hsmm.dur_distns, dur_distns):
+        assert np.isclose(dur_distn.lmbda, expected.lmbda)
+
+
+def test_parallel_statistics(model, datas):
+    letter_hsmm = _segmented(model, datas).letter_hsmm
+    obs_distns = copy.deepcopy(letter_hsmm.obs_distns)
+    np.random.seed(2)
+    letter_hsmm.resample_obs_and_dur_distns_by_statistics(num_procs=2)
+    parallel = [obs_distn.mu for obs_distn in letter_hsmm.obs_distns]
+    letter_hsmm.obs_distns[:] = obs_distns
+    np.random.seed(2)
+    letter_hsmm.resample_obs_and_dur_distns_by_statistics()
+    assert np.allclose(parallel, [obs_distn.mu for obs_distn in letter_hsmm.obs_distns])
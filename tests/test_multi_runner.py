@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Stands in for pyhlm_sample.py: logs its arguments and fails while a FAIL file exists.
+TRIAL = """import json, os, sys
+print(json.dumps(sys.argv[1:]))
+sys.exit(1 if os.path.exists("../FAIL") else 0)
+"""
+
+
+def _sample_dir(tmp_path):
+    sample_dir = tmp_path / "sample"
+    shutil.copytree(str(ROOT / "sample" / "util"), str(sample_dir / "util"))
+    shutil.copy2(str(ROOT / "sample" / "multi_runner.py"), str(sample_dir))
+    (sample_dir / "pyhlm_sample.py").write_text(TRIAL)
+    (sample_dir / "DATA").mkdir()
+    (sample_dir / "LABEL").mkdir()
+    (sample_dir / "hypparams").mkdir()
+    rng = np.random.RandomState(0)
+    for name in ("a", "b"):
+        np.savetxt(str(sample_dir / "DATA" / (name + ".txt")), rng.randn(5, 2))
+    (sample_dir / "files.txt").write_text("a\nb\n")
+    return sample_dir
+
+
+def _run(sample_dir, *argv):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(ROOT)] + ([env["PYTHONPATH"]] if "PYTHONPATH" in env else []))
+    return subprocess.run([sys.executable, str(sample_dir / "multi_runner.py"), "--label", "results",
+                           "--cpus", "2", "--thread_num", "1", "--end", "3"] + list(argv),
+                          cwd=str(sample_dir), env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+
+def _calls(trial_dir):
+    path = trial_dir / "log.txt"
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def test_trials_run_with_their_own_seeds(tmp_path):
+    sample_dir = _sample_dir(tmp_path)
+    out = _run(sample_dir, "--seed", "7")
+    assert out.returncode == 0, out.stdout.decode()
+    label = sample_dir / "results"
+    records = json.loads((label / "chains.json").read_text())
+    assert [record["trial"] for record in records] == [1, 2, 3]
+    assert all(record["status"] == "done" for record in records)
+    seeds = [record["seed"] for record in records]
+    assert len(set(seeds)) == 3
+    assert seeds[1] == int(np.random.SeedSequence([7, 2]).generate_state(1)[0])
+    for i, seed in zip((1, 2, 3), seeds):
+        trial_dir = label / "{:02d}".format(i)
+        assert _calls(trial_dir) == [["--seed", str(seed), "--thread_num", "1"]]
+        assert (trial_dir / "DATA").is_symlink() and (trial_dir / "files.txt").is_symlink()
+    # The corpus cache is built once, before the trials start.
+    assert (label / "DATA" / ".corpus.json").exists()
+
+
+def test_rerun_skips_finished_and_resumes_failed_trials(tmp_path):
+    sample_dir = _sample_dir(tmp_path)
+    label = sample_dir / "results"
+    label.mkdir()
+    (label / "FAIL").write_text("")
+    out = _run(sample_dir)
+    assert out.returncode == 1
+    assert all(record["status"] == "failed" for record in json.loads((label / "chains.json").read_text()))
+
+    (label / "FAIL").unlink()
+    (label / "02" / "checkpoint").mkdir()
+    assert _run(sample_dir).returncode == 0
+    records = json.loads((label / "chains.json").read_text())
+    assert all(record["status"] == "done" for record in records)
+    assert [record["resumed"] for record in records] == [False, True, False]
+    assert records[1]["total_elapsed"] >= records[1]["elapsed"]
+    assert not (label / "02" / "checkpoint").exists()
+    # The log of a resumed trial is kept, the others start over.
+    assert len(_calls(label / "01")) == 1 and len(_calls(label / "02")) == 2
+
+    assert _run(sample_dir).returncode == 0
+    assert len(_calls(label / "01")) == 1
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def _scored(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    model.resample_states()
+    return model
+
+
+def test_normalizers_are_tagged_with_params_version(model, datas):
+    _scored(model, datas)
+    assert not any(state.normalizer_is_stale for state in model.states_list)
+    stale = model.log_likelihood()
+    model.letter_obs_distns[0].mu = model.letter_obs_distns[0].mu + 1.0
+    model.params_version += 1
+    model._clear_caches()
+    assert all(state.normalizer_is_stale for state in model.states_list)
+    assert model.log_likelihood() == stale
+    current = model.log_likelihood(mode="current")
+    assert current != stale
+    assert not any(state.normalizer_is_stale for state in model.states_list)
+
+
+def test_parallel_normalizers_keep_pi_0(model, datas):
+    _scored(model, datas)
+    model.states_list[1].pi_0 = model.trans_distn.trans_matrix[0]
+    model.params_version += 1
+    serial = [state.log_likelihood(current=True) for state in model.states_list]
+    model.params_version += 1
+    assert np.isclose(model.log_likelihood(mode="current", num_procs=2), sum(serial))
+    assert np.allclose([state._normalizer for state in model.states_list], serial)
+
+
+
+def test_parallel_normalizers_with_fewer_stale_states_than_workers(model, datas):
+    _scored(model, datas)
+    model.params_version += 1
+    serial = [state.log_likelihood(current=True) for state in model.states_list]
+    model.params_version += 1
+    for state in model.states_list[1:]:
+        state.log_likelihood(current=True)
+    assert model.states_list[0].normalizer_is_stale
+    assert np.isclose(model.log_likelihood(mode="current", num_procs=4), sum(serial))
+    assert not any(state.normalizer_is_stale for state in model.states_list)
+
+
+def test_parallel_resample_states(model, datas):
+    for data in datas:
+        model.add_data(data, generate=False)
+    model.states_list[1].pi_0 = model.trans_distn.trans_matrix[0]
+    model.resample_states(num_procs=2)
+    for state, data in zip(model.states_list, datas):
+        assert state.durations_censored.sum() == len(data)
+        assert state.normalizer_is_stale is False
+        assert np.isclose(state._normalizer, state.log_likelihood(current=True))
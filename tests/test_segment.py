@@ -0,0 +1,47 @@
+import numpy as np
+from pytest import raises
+
+
+def test_segment_does_not_touch_the_model(model, datas):
+    model.add_data(datas[0], generate=False)
+    model.resample_states()
+    stateseq = model.states_list[0].stateseq.copy()
+    segmentations = model.segment(datas, mode="viterbi")
+    assert len(model.states_list) == 1
+    assert np.array_equal(model.states_list[0].stateseq, stateseq)
+
+    for seg, data in zip(segmentations, datas):
+        state = model._states_class(model, data, generate=False)
+        assert np.isclose(seg.normalizer, state.Viterbi())
+        assert np.array_equal(np.repeat(seg.words, seg.durations), state.stateseq)
+        assert np.array_equal(np.repeat(seg.letters, seg.letter_durations), state.letter_stateseq)
+
+
+def test_parallel_segment_keeps_the_order(model, datas):
+    datas = datas + [datas[0][:20], datas[1][:30]]
+    serial = model.segment(datas, mode="viterbi")
+    parallel = model.segment(datas, mode="viterbi", num_procs=2)
+    for a, b in zip(serial, parallel):
+        assert np.array_equal(a.words, b.words) and np.array_equal(a.durations, b.durations)
+    for seg, data in zip(model.segment(datas, mode="sample"), datas):
+        assert seg.durations.sum() == seg.letter_durations.sum() == len(data)
+
+
+def test_segment_rejects_unknown_modes(model, datas):
+    with raises(ValueError, match="mode"):
+        model.segment(datas, mode="map")
+
+
+def test_parallel_segment_of_few_utterances(model, datas):
+    assert len(model.segment(datas[:1], mode="viterbi", num_procs=4)) == 1
+
+
+def test_batch_shares_tables_without_changing_the_result(model, datas):
+    datas = datas + [datas[0][:20]]
+    kwargs_list = [dict(trunc=None, word_boundaries=None, letter_boundaries=None)] * len(datas)
+    batch = model._segment_batch(datas, "viterbi", kwargs_list)
+    for seg, data in zip(batch, datas):
+        expected = model._segment(data, "viterbi")
+        assert np.isclose(seg.normalizer, expected.normalizer)
+        assert np.array_equal(seg.durations, expected.durations)
+        assert np.array_equal(seg.letter_durations, expected.letter_durations)
@@ -0,0 +1,46 @@
+import numpy as np
+
+from pyhlm.internals.emissions import letter_log_likelihoods
+
+
+def _segmented(model, data):
+    model.add_data(data, generate=False)
+    model.resample_states()
+    state = model.states_list[0]
+    state.add_word_datas(generate=False)
+    return state
+
+
+def test_segments_borrow_the_utterance_tables(model, datas):
+    state = _segmented(model, datas[0])
+    letter_states = model.letter_hsmm.states_list
+    assert len(letter_states) == len(state.stateseq_norep)
+    for letter_state in letter_states:
+        assert np.shares_memory(letter_state.aBl, state.aBl)
+        assert np.allclose(letter_state.aBl, letter_log_likelihoods(letter_state.data, model.letter_obs_distns))
+        assert np.array_equal(letter_state.aDl, state.alDl[:letter_state.T])
+
+    # New letter parameters drop the utterance tables the segments borrow from.
+    model.letter_obs_distns[0].mu = model.letter_obs_distns[0].mu + 1.0
+    model.letter_hsmm._clear_caches()
+    letter_state = letter_states[0]
+    assert np.allclose(letter_state.aBl, letter_log_likelihoods(letter_state.data, model.letter_obs_distns))
+
+
+def test_segment_states_are_pooled(model, datas):
+    state = _segmented(model, datas[0])
+    pooled = list(model.letter_hsmm.states_list)
+    model.letter_hsmm.states_list = []
+    # Fewer words: the pool is reused and shrinks with them.
+    state.stateseq = np.repeat(np.array([0, 1], dtype=np.int32), [10, state.T - 10])
+    state._stateseq_norep = state._durations_censored = None
+    state.add_word_datas(generate=False)
+    letter_states = model.letter_hsmm.states_list
+    assert len(pooled) > 2 and len(letter_states) == 2
+    assert all(a is b for a, b in zip(letter_states, pooled))
+    ends = np.cumsum(state.durations_censored)
+    for letter_state, word, end, duration in zip(letter_states, state.stateseq_norep, ends, state.durations_censored):
+        assert letter_state.word_idx == word
+        assert letter_state.T == duration
+        assert np.array_equal(letter_state.data, state.data[end - duration:end])
+        assert letter_state.stateseq is None
@@ -0,0 +1,59 @@
+import io
+import json
+
+import numpy as np
+
+from pyhlm.inference import InferenceModel
+from pyhlm.service import SegmentationService, serve_stdio
+
+
+def test_stdio_request_response(model, datas, tmp_path):
+    model.export(str(tmp_path / "exported"), keep_unused=True)
+    inference_model = InferenceModel.load(str(tmp_path / "exported"))
+    stdin = io.StringIO(json.dumps({"id": 7, "data": datas[0].tolist()}) + "\n\nnot json\n")
+    stdout = io.StringIO()
+    with SegmentationService(inference_model, num_threads=2) as service:
+        serve_stdio(service, stdin, stdout)
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert len(responses) == 2
+    error = [response for response in responses if "error" in response]
+    assert len(error) == 1 and error[0]["error"].startswith("invalid JSON")
+    response = [response for response in responses if "id" in response][0]
+    assert response["id"] == 7
+    expected = inference_model.segment([datas[0]], mode="viterbi")[0]
+    assert response["words"] == inference_model.original_words(expected.words).tolist()
+    assert response["durations"] == expected.durations.tolist()
+    assert response["letter_durations"] == expected.letter_durations.tolist()
+    assert np.isclose(response["normalizer"], expected.normalizer)
+
+
+def test_micro_batches_match_single_requests(model, datas, tmp_path):
+    model.export(str(tmp_path / "exported"), keep_unused=True)
+    inference_model = InferenceModel.load(str(tmp_path / "exported"))
+    batch_sizes = []
+    segment_batch = inference_model._segment_batch
+    def counting_segment_batch(datas, mode, kwargs_list):
+        batch_sizes.append(len(datas))
+        return segment_batch(datas, mode, kwargs_list)
+    inference_model._segment_batch = counting_segment_batch
+    requests = [{"id": idx, "data": data[:length].tolist(), "trunc": trunc}
+                for idx, (data, length, trunc) in enumerate(
+                    [(datas[0], None, None), (datas[1], 7, None), (datas[0], 5, 4), (datas[1], None, 4)])]
+    requests.append({"id": "bad", "data": [], "trunc": 4})
+    # A wrong mask only fails in the batch call, the group is then answered one by one.
+    requests.append({"id": "mask", "data": datas[0][:6].tolist(), "trunc": 4, "word_boundaries": [True]})
+    with SegmentationService(inference_model, num_threads=2, max_batch=len(requests), max_wait=10.0) as service:
+        futures = [service.submit(request) for request in requests]
+        responses = [future.result() for future in futures]
+
+    # The requests without and with trunc=4 form two groups.
+    assert sorted(batch_sizes) == [2, 3]
+
+    assert [response["id"] for response in responses] == [request["id"] for request in requests]
+    assert responses[-2]["error"].startswith("ValueError") and responses[-1]["error"].startswith("ValueError")
+    for request, response in zip(requests[:-2], responses[:-2]):
+        expected = inference_model._segment(np.array(request["data"]), "viterbi", trunc=request["trunc"])
+        assert response["durations"] == expected.durations.tolist()
+        assert response["letter_durations"] == expected.letter_durations.tolist()
+        assert np.isclose(response["normalizer"], expected.normalizer)
@@ -0,0 +1,63 @@
+import numpy as np
+from pytest import mark
+
+from pyhlm.streaming import FixedLagSegmenter, segment_stream
+
+
+class FromScratchSegmenter(FixedLagSegmenter):
+    # Decodes every window without the messages of the previous pushes.
+    def _decode(self, data):
+        self._clear_messages()
+        return super(FromScratchSegmenter, self)._decode(data)
+
+
+def _stream(segmenter, data, chunk):
+    out = []
+    for t in range(0, len(data), chunk):
+        out += segmenter.push(data[t:t+chunk])
+    return out + segmenter.flush()
+
+
+def _flatten(segments):
+    return [(s.word, s.start, s.duration, s.letters.tolist(), s.letter_durations.tolist()) for s in segments]
+
+
+def test_stream_without_lag_limit_is_the_offline_viterbi(model, datas):
+    data = np.concatenate(datas)
+    trunc = 20
+    segments = list(segment_stream(model, data, lag=len(data), trunc=trunc))
+    state = model._states_class(model, data, trunc=trunc, generate=False)
+    state.Viterbi()
+    assert [s.word for s in segments] == state.stateseq_norep.tolist()
+    assert [s.duration for s in segments] == state.durations_censored.tolist()
+    assert np.concatenate([s.letters for s in segments]).tolist() == state.letter_stateseq_norep.tolist()
+    assert np.concatenate([s.letter_durations for s in segments]).tolist() == state.letter_durations.tolist()
+
+
+@mark.parametrize("chunk", [1, 5])
+def test_carried_messages_match_a_fresh_decode(model, datas, chunk):
+    data = np.concatenate(datas)
+    segments = _stream(FixedLagSegmenter(model, lag=8, trunc=20, step=3), data, chunk)
+    expected = _stream(FromScratchSegmenter(model, lag=8, trunc=20, step=3), data, chunk)
+    assert _flatten(segments) == _flatten(expected)
+    assert sum(s.duration for s in segments) == len(data)
+    assert all(a.start + a.duration == b.start for a, b in zip(segments, segments[1:]))
+
+
+def test_new_parameters_drop_the_messages(model, datas):
+    segmenter = FixedLagSegmenter(model, lag=100, trunc=20)
+    segmenter.push(datas[0])
+    segmenter._finalize(0)
+    assert segmenter._alpha is not None
+    model.params_version += 1
+    likes = segmenter._likes[0]
+    segmenter._finalize(0)
+    assert segmenter._likes[0] is not likes
+
+
+def test_sampled_stream_covers_the_frames(model, datas):
+    np.random.seed(0)
+    data = np.concatenate(datas)
+    segments = _stream(FixedLagSegmenter(model, lag=8, trunc=20, mode="sample", step=3), data, 4)
+    assert sum(s.duration for s in segments) == len(data)
+    assert all(s.letter_durations.sum() == s.duration for s in segments)
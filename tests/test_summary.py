@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+from pyhlm.evaluation import SegmentationEvaluator
+from pyhlm.summary import load_run_summary, stack_curves, trace_scores
+from pyhlm.trace import TraceWriter
+
+
+def _random_segmentation(rng, T):
+    durations = np.diff(np.concatenate(([0], np.sort(rng.choice(np.arange(1, T), 3, replace=False)), [T])))
+    letter_durations = np.concatenate([[d // 2, d - d // 2] for d in durations])
+    return rng.randint(3, size=4), durations, rng.randint(4, size=8), letter_durations
+
+
+def test_trace_scores_follow_the_traced_iterations(tmp_path):
+    rng = np.random.RandomState(0)
+    names = ["a", "b"]
+    letter_labels = [rng.randint(4, size=20) for _ in names]
+    word_labels = [rng.randint(3, size=20) for _ in names]
+    prefix = str(tmp_path / "trace")
+    segmentations = {}
+    with TraceWriter(prefix, names=names) as trace:
+        # Every second iteration is traced, iteration 4 twice as after a resume.
+        for iteration in (2, 4, 4, 6):
+            segmentations[iteration] = [_random_segmentation(rng, 20) for _ in names]
+            trace.append(iteration, segmentations[iteration])
+
+    evaluator = SegmentationEvaluator(letter_labels, word_labels, 4, 3)
+    iterations, scores = trace_scores(prefix, names, letter_labels, word_labels, 4, 3, chunksize=2)
+    assert iterations.tolist() == [2, 4, 6]
+    for key in scores:
+        assert np.allclose(scores[key], [evaluator.evaluate(segmentations[iteration])[key] for iteration in iterations])
+    _, parallel = trace_scores(prefix, names, letter_labels, word_labels, 4, 3, num_procs=2, chunksize=2)
+    assert all(np.array_equal(parallel[key], scores[key]) for key in scores)
+
+
+def test_stack_curves_cuts_to_the_shortest_run():
+    assert stack_curves([np.arange(5), np.arange(3), np.arange(4)]).tolist() == [[0, 1, 2]] * 3
+
+
+def test_run_summary_cache_follows_the_text_files(tmp_path):
+    summary_dir = tmp_path / "summary_files"
+    summary_dir.mkdir()
+    np.savetxt(str(summary_dir / "resample_times.txt"), [1.0, 2.0])
+    assert load_run_summary(tmp_path, keys=["resample_times"])["resample_times"].tolist() == [1.0, 2.0]
+    assert os.path.exists(str(summary_dir / "summary_cache.npz"))
+    with open(str(summary_dir / "resample_times.txt"), "a") as f:
+        f.write("3.0\n")
+    assert load_run_summary(tmp_path, keys=["resample_times"])["resample_times"].tolist() == [1.0, 2.0, 3.0]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from pyhlm.sweep import FullSweep, PrioritySweep, RandomSweep, RoundRobinSweep
+
+
+def test_round_robin_covers_all_utterances():
+    sweep = RoundRobinSweep(0.4)
+    states_list = list(range(5))
+    assert [sweep.select(states_list).tolist() for _ in range(3)] == [[0, 1], [2, 3], [0, 4]]
+
+
+def test_random_sweep_size():
+    np.random.seed(0)
+    selected = RandomSweep(0.3).select(list(range(10)))
+    assert len(selected) == 3 and len(np.unique(selected)) == 3
+
+
+def test_priority_sweep_prefers_changed_utterances():
+    class State(object):
+        def __init__(self, normalizer):
+            self._normalizer = normalizer
+            self.T = 10
+    sweep = PrioritySweep(0.25, max_age=10)
+    states_list = [State(0.0) for _ in range(4)]
+    sweep.update(states_list, np.arange(4), [0.0, -50.0, 0.0, -10.0])
+    assert sweep.select(states_list).tolist() == [1]
+
+
+def test_resample_states_visits_selected_and_unscored(model, datas):
+    for data in datas + datas:
+        model.add_data(data, generate=False)
+    class FirstOnly(FullSweep):
+        def select(self, states_list):
+            return np.array([0])
+    model.resample_states(sweep=FirstOnly())
+    assert all(state._normalizer is not None for state in model.states_list)
+
+    model.resample_model()
+    before = [state.stateseq.copy() for state in model.states_list]
+    normalizers = [state._normalizer for state in model.states_list]
+    model.resample_states(sweep=FirstOnly())
+    for state, stateseq, normalizer in list(zip(model.states_list, before, normalizers))[1:]:
+        assert np.array_equal(state.stateseq, stateseq)
+        assert state._normalizer == normalizer
+
+
+def test_parallel_sweep_with_fewer_utterances_than_workers(model, datas):
+    for data in datas + datas:
+        model.add_data(data, generate=False)
+    model.resample_states()
+    before = [state.stateseq.copy() for state in model.states_list]
+    model.resample_states(num_procs=4, sweep=RoundRobinSweep(0.25))
+    for state, stateseq in list(zip(model.states_list, before))[1:]:
+        assert np.array_equal(state.stateseq, stateseq)
+    assert model.states_list[0].durations_censored.sum() == len(datas[0])
@@ -0,0 +1,76 @@
+import gc
+import pickle
+
+import numpy as np
+from pytest import raises
+
+from pyhlm.internals.table_cache import TableCache
+
+
+def test_tables_stay_within_the_budget(model, datas):
+    datas = datas + [data[::-1].copy() for data in datas]
+    for data in datas:
+        model.add_data(data, generate=False)
+    one = model.states_list[0]
+    one.aBl, one.aDl, one.alDl, one.lattice_aBl
+    budget = int(1.5 * one.table_nbytes())
+    one.clear_caches()
+
+    np.random.seed(0)
+    model.resample_states()
+    expected = [state.stateseq.copy() for state in model.states_list]
+    model.table_cache = cache = TableCache(budget)
+    np.random.seed(0)
+    model.resample_states()
+    assert cache.evictions > 0
+    assert cache.nbytes <= budget and len(cache) < len(model.states_list)
+    assert cache.nbytes == sum(state.table_nbytes() for state in model.states_list)
+    for state, stateseq in zip(model.states_list, expected):
+        assert np.array_equal(state.stateseq, stateseq)
+
+
+def test_cache_does_not_keep_states_alive(model, datas):
+    cache = TableCache(10**9)
+    model.table_cache = cache
+    state = model._states_class(model, datas[0], generate=False)
+    state.aBl
+    assert len(cache) == 1
+    state.clear_caches()
+    assert len(cache) == 0 and cache.nbytes == 0
+    state.aBl
+    del state
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_dead_states_leave_the_cache(model, datas):
+    model.table_cache = cache = TableCache(10**9)
+    state = model._states_class(model, datas[0], generate=False)
+    state.aBl
+    model.segment(datas, mode="viterbi")
+    assert len(cache) == 1
+    del state
+    gc.collect()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_reading_a_table_makes_it_recently_used(model, datas):
+    states = [model._states_class(model, data, generate=False) for data in datas + [datas[0]]]
+    states[0].aBl
+    model.table_cache = cache = TableCache(int(2.5 * states[0].table_nbytes()))
+    states[0].clear_caches()
+    states[0].aBl
+    states[1].aBl
+    states[0].aBl
+    states[2].aBl
+    assert cache.evictions == 1
+    assert states[0]._aBl is not None and states[1]._aBl is None
+
+
+def test_cache_is_pickled_empty():
+    cache = TableCache(100)
+    cache.nbytes = 50
+    restored = pickle.loads(pickle.dumps(cache))
+    assert restored.max_bytes == 100 and restored.nbytes == 0 and len(restored) == 0
+    with raises(ValueError):
+        TableCache(0)
@@ -0,0 +1,50 @@
+import numpy as np
+from pytest import raises
+
+from pyhlm.trace import TraceReader, TraceWriter
+
+
+def _segmentation(seed):
+    rng = np.random.RandomState(seed)
+    durations = rng.permutation([2, 3, 4])
+    return rng.randint(5, size=3), durations, rng.randint(7, size=3), durations
+
+
+def _assert_equal(seg, expected):
+    for array, exp in zip(seg[:4], expected):
+        assert np.array_equal(array, exp)
+
+
+def test_round_trip_with_duplicate_iterations(tmp_path):
+    prefix = str(tmp_path / "results" / "trace")
+    with TraceWriter(prefix, names=["a", "b"]) as trace:
+        trace.append(1, [_segmentation(0), _segmentation(1)])
+        trace.append(2, [_segmentation(2), _segmentation(3)])
+    # A resumed run writes iteration 2 again.
+    with TraceWriter(prefix) as trace:
+        trace.append(2, [_segmentation(4), _segmentation(5)])
+        trace.append(3, [_segmentation(6), _segmentation(7)])
+
+    reader = TraceReader(prefix)
+    assert reader.names == ["a", "b"]
+    assert reader.iterations.tolist() == [1, 2, 3]
+    _assert_equal(reader.segmentation("a", 1), _segmentation(0))
+    _assert_equal(reader.segmentation(1, 2), _segmentation(5))
+    _assert_equal(reader.segmentation("a", 3), _segmentation(6))
+    assert [len(seg.words) for seg in reader.segmentations("b")] == [3, 3, 3]
+    assert reader.stateseqs("a")[1].tolist() == np.repeat(*_segmentation(4)[:2]).tolist()
+    with raises(KeyError):
+        reader.segmentation("a", 4)
+
+
+def test_partial_index_row_is_dropped(tmp_path):
+    prefix = str(tmp_path / "trace")
+    with TraceWriter(prefix) as trace:
+        trace.append(1, [_segmentation(0)])
+    with open(prefix + ".idx", "ab") as f:
+        f.write(b"\0" * 12)
+    with TraceWriter(prefix) as trace:
+        trace.append(2, [_segmentation(1)])
+    reader = TraceReader(prefix)
+    assert reader.iterations.tolist() == [1, 2]
+    _assert_equal(reader.segmentation(0, 2), _segmentation(1))
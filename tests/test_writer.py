@@ -0,0 +1,51 @@
+import threading
+
+import numpy as np
+from pytest import raises
+
+from pyhlm.writer import AsyncWriter, snapshot
+
+
+def test_jobs_run_in_order():
+    out = []
+    with AsyncWriter(maxsize=2) as writer:
+        for i in range(20):
+            writer.submit(out.append, i)
+        writer.flush()
+        assert out == list(range(20))
+        assert writer.pending == 0
+    with raises(RuntimeError, match="closed"):
+        writer.submit(out.append, 0)
+
+
+def test_error_is_raised_and_later_jobs_are_dropped():
+    out = []
+    release = threading.Event()
+    writer = AsyncWriter()
+    writer.submit(release.wait)
+    writer.submit(lambda: 1 / 0)
+    writer.submit(out.append, 1)
+    release.set()
+    with raises(ZeroDivisionError):
+        writer.flush()
+    assert out == []
+    writer.submit(out.append, 2)
+    writer.close()
+    assert out == [2]
+
+
+def test_thinned_submission():
+    out = []
+    with AsyncWriter(thin=3) as writer:
+        for i in range(1, 10):
+            writer.submit_thinned(i, out.append, i)
+    assert out == [3, 6, 9]
+    with raises(ValueError):
+        AsyncWriter(thin=0)
+
+
+def test_snapshot_copies_arrays():
+    params = {"mu": [np.zeros(2)], "n": 3}
+    copied = snapshot(params)
+    params["mu"][0][0] = 1.0
+    assert copied["mu"][0][0] == 0.0 and copied["n"] == 3